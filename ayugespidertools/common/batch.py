@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+from ayugespidertools.common.typevars import BatchConf
+
+__all__ = [
+    "BatchBuffer",
+    "estimate_size",
+    "get_batch_conf",
+]
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+    from scrapy.settings import BaseSettings
+
+K = TypeVar("K", bound="Hashable")
+T = TypeVar("T")
+
+
+def get_batch_conf(settings: BaseSettings, name: str) -> BatchConf:
+    """从 scrapy settings 中获取批量写入的配置
+
+    Args:
+        settings: scrapy 的 settings 信息
+        name: 批量写入配置的 settings 名称，比如 MYSQL_BATCH_CONFIG
+
+    Returns:
+        1). 批量写入配置，未配置时其 size 为 0，即不开启批量写入
+    """
+    batch_conf = settings.getdict(name)
+    return BatchConf(**batch_conf) if batch_conf else BatchConf()
+
+
+def estimate_size(values: Any) -> int:
+    """粗略估算一行数据的字节数，用于批量写入时的 max_bytes 阈值判断
+
+    Args:
+        values: 一行数据，可以是 dict 或 tuple 等
+
+    Returns:
+        1). 估算的字节数
+    """
+    if isinstance(values, dict):
+        values = values.values()
+    size = 0
+    for value in values:
+        if isinstance(value, bytes | bytearray):
+            size += len(value)
+        elif value is not None:
+            size += len(str(value))
+    return size
+
+
+class _BatchGroup(Generic[T]):
+    __slots__ = ("created", "rows", "size")
+
+    def __init__(self) -> None:
+        self.rows: list[T] = []
+        self.size = 0
+        self.created = time.monotonic()
+
+
+class BatchBuffer(Generic[K, T]):
+    """按 key 分组缓存待写入的数据，分组满足条数、字节数或时间阈值时返回其数据用于批量写入
+
+    Examples:
+        >>> buffer = BatchBuffer(BatchConf(size=2))
+        >>> buffer.add("ta", {"a": 1}) is None
+        True
+        >>> buffer.add("ta", {"a": 2})
+        [{'a': 1}, {'a': 2}]
+        >>> buffer.add("tb", {"b": 1}) is None
+        True
+        >>> buffer.pop_all()
+        [('tb', [{'b': 1}])]
+        >>> len(buffer)
+        0
+    """
+
+    def __init__(self, batch_conf: BatchConf) -> None:
+        self.batch_conf = batch_conf
+        self._groups: dict[K, _BatchGroup[T]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(group.rows) for group in self._groups.values())
+
+    def add(self, key: K, row: T, size: int | None = None) -> list[T] | None:
+        """添加一行数据到 key 对应的分组中
+
+        Args:
+            key: 分组的 key，一般为表名及字段等组成的 tuple
+            row: 需要缓存的数据
+            size: 此行数据的字节数，不传时使用 estimate_size 估算
+
+        Returns:
+            1). 分组达到条数或字节数阈值时返回并移除此分组的数据，否则返回 None
+        """
+        if (group := self._groups.get(key)) is None:
+            group = self._groups[key] = _BatchGroup()
+        group.rows.append(row)
+        group.size += estimate_size(row) if size is None else size
+        if (
+            len(group.rows) >= self.batch_conf.size
+            or group.size >= self.batch_conf.max_bytes
+        ):
+            del self._groups[key]
+            return group.rows
+        return None
+
+    def pop_expired(self) -> list[tuple[K, list[T]]]:
+        """获取并移除所有超过 interval 时间阈值的分组"""
+        now = time.monotonic()
+        expired = [
+            key
+            for key, group in self._groups.items()
+            if now - group.created >= self.batch_conf.interval
+        ]
+        return [(key, self._groups.pop(key).rows) for key in expired]
+
+    def pop_all(self) -> list[tuple[K, list[T]]]:
+        """获取并移除所有分组，一般用于 close_spider 时清空缓存"""
+        groups = [(key, group.rows) for key, group in self._groups.items()]
+        self._groups.clear()
+        return groups
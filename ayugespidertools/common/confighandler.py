@@ -135,6 +135,12 @@ class MysqlHandler(ConfigHandler):
             ),
             "odku_enable": mysql_section.getboolean("odku_enable", False),
             "insert_ignore": mysql_section.getboolean("insert_ignore", False),
+            "cp_min": mysql_section.getint("cp_min", 3),
+            "cp_max": mysql_section.getint("cp_max", 5),
+            "pool_min_size": mysql_section.getint("pool_min_size", 1),
+            "pool_max_size": mysql_section.getint("pool_max_size", 10),
+            "pool_recycle": mysql_section.getint("pool_recycle", -1),
+            "pool_timeout": mysql_section.getfloat("pool_timeout", None),
         }
 
 
@@ -177,6 +183,15 @@ class PostgresqlHandler(ConfigHandler):
             "password": postgres_section.get("password", ""),
             "database": postgres_section.get("database", ""),
             "charset": postgres_section.get("charset", "UTF8"),
+            "pool_min_size": postgres_section.getint("pool_min_size", 10),
+            "pool_max_size": postgres_section.getint("pool_max_size", 10),
+            "pool_timeout": postgres_section.getfloat("pool_timeout", None),
+            "statement_cache_size": postgres_section.getint(
+                "statement_cache_size", 100
+            ),
+            "max_inactive_lifetime": postgres_section.getfloat(
+                "max_inactive_lifetime", 300.0
+            ),
         }
 
 
@@ -215,6 +230,9 @@ class OracleHandler(ConfigHandler):
             "thick_lib_dir": oracle_section.get("thick_lib_dir", False),
             "disable_oob": oracle_section.get("disable_oob", False),
             "authentication_mode": oracle_section.get("authentication_mode", "DEFAULT"),
+            "pool_min": oracle_section.getint("pool_min", 1),
+            "pool_max": oracle_section.getint("pool_max", 2),
+            "pool_increment": oracle_section.getint("pool_increment", 1),
         }
 
 
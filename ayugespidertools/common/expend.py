@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import datetime
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any
 
 from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.sqlformat import GenOracle, GenPostgresqlAsyncpg
 from ayugespidertools.common.typevars import InsertPrefixStr, PortalTag
 from ayugespidertools.config import logger
 from ayugespidertools.utils.database import MysqlPortal, OraclePortal, PostgreSQLPortal
@@ -15,16 +17,155 @@ __all__ = [
 ]
 
 if TYPE_CHECKING:
+    from collections.abc import Collection
+
     from oracledb.connection import Connection as OracleConnection
     from psycopg.connection import Connection as PsycopgConnection
     from pymysql.connections import Connection as PymysqlConnection
-
-    from ayugespidertools.common.typevars import MysqlConf, OracleConf, PostgreSQLConf
+    from scrapy.crawler import Crawler
+
+    from ayugespidertools.common.typevars import (
+        AlterItem,
+        MysqlConf,
+        OracleConf,
+        PostgreSQLConf,
+    )
+
+    # 数据表，字段，冲突字段，冲突时需要更新的字段
+    AsyncpgSqlKeyT = tuple[str, tuple[str, ...], tuple[str, ...], tuple[str, ...]]
+    # 数据表，字段，MERGE 的匹配字段，匹配时需要更新的字段
+    OracleSqlKeyT = tuple[str, tuple[str, ...], tuple[str, ...], tuple[str, ...]]
+
+# oracle 绑定变量时 VARCHAR2 及 RAW 类型的最大字节数，超过时需要以 CLOB 或 BLOB 类型绑定
+ORACLE_MAX_STRING_SIZE = 4000
+ORACLE_MAX_RAW_SIZE = 2000
+
+
+def get_oracle_input_sizes(
+    rows: list[tuple], cached: list[Any] | None = None
+) -> list[Any]:
+    """根据一批数据获取 executemany 所需的 setinputsizes 参数
+
+    字符串字段为其最大的字节数，超过 VARCHAR2 的限制时为 CLOB 类型，二进制字段超过 RAW 的限制时为 BLOB
+    类型，其它字段为 None 即由 oracledb 自行判断。传入 cached 时只会在其基础上扩大，不会缩小。
+
+    Args:
+        rows: 需要写入的一批数据
+        cached: 之前批次使用的 setinputsizes 参数
+
+    Returns:
+        1). setinputsizes 参数
+    """
+    import oracledb  # noqa: PLC0415
+
+    sizes: list[Any] = list(cached) if cached else [None] * len(rows[0])
+    for i, values in enumerate(zip(*rows, strict=True)):
+        if sizes[i] in (oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_BLOB):
+            continue
+        if all(isinstance(v, str) or v is None for v in values):
+            size = max((len(v.encode()) for v in values if v is not None), default=0)
+            if size > ORACLE_MAX_STRING_SIZE:
+                sizes[i] = oracledb.DB_TYPE_CLOB
+            elif size:
+                sizes[i] = max(size, sizes[i] or 0)
+        elif any(
+            isinstance(v, bytes | bytearray) and len(v) > ORACLE_MAX_RAW_SIZE
+            for v in values
+        ):
+            sizes[i] = oracledb.DB_TYPE_BLOB
+    return sizes
+
+
+@lru_cache(maxsize=1024)
+def _compile_mysql_sql(
+    table: str,
+    columns: tuple[str, ...],
+    insert_prefix: InsertPrefixStr,
+    duplicate_keys: tuple[str, ...],
+) -> str:
+    """生成并缓存 mysql 插入语句，同一数据表的字段一般都相同，不必每个 item 都重新拼接
+
+    冲突时的更新值使用 VALUES(col) 即本次插入的值，所以语句只与以下参数有关，参数中也不必重复传入更新值。
+
+    Args:
+        table: 数据库表名
+        columns: 插入的字段
+        insert_prefix: INSERT 语句前缀设置: INSERT IGNORE or INSERT
+        duplicate_keys: ON DUPLICATE KEY UPDATE 需要更新的字段，为空时不添加此语句
+
+    Returns:
+        1). sql 插入语句
+    """
+    keys = f"""`{"`, `".join(columns)}`"""
+    values = ", ".join(["%s"] * len(columns))
+    sql = f"{insert_prefix} INTO `{table}` ({keys}) values ({values})"
+    if duplicate_keys:
+        update = ", ".join(f"`{key}` = VALUES(`{key}`)" for key in duplicate_keys)
+        sql += f" ON DUPLICATE KEY UPDATE {update}"
+    return sql
+
+
+@lru_cache(maxsize=1024)
+def _compile_asyncpg_upsert_sql(
+    table: str,
+    columns: tuple[str, ...],
+    conflict_cols: tuple[str, ...],
+    update_cols: tuple[str, ...],
+) -> str:
+    """生成并缓存 asyncpg 的 upsert 语句，语句相同时 asyncpg 会复用连接上已准备好的 prepared statement
+
+    Args:
+        table: 数据库表名
+        columns: 插入的字段
+        conflict_cols: ON CONFLICT 的冲突字段
+        update_cols: 冲突时需要更新的字段，为空时为 DO NOTHING
+
+    Returns:
+        1). sql 插入语句
+    """
+    sql, _ = GenPostgresqlAsyncpg.upsert_generate(
+        db_table=table,
+        conflict_cols=set(conflict_cols),
+        data=dict.fromkeys(columns),
+        update_cols=set(update_cols),
+    )
+    return sql
 
 
 class MysqlPipeEnhanceMixin:
     """扩展 mysql pipelines 的功能"""
 
+    crawler: Crawler
+    table_rows_stats_prefix = "mysql/table_rows/"
+
+    def _count_rows(self, table: str, count: int = 1) -> None:
+        """在 crawler stats 中累加数据表写入成功的条数，用于 AyuStatisticsMysqlPipeline 的统计
+
+        需在 reactor 线程中且写入提交后调用，在写入线程中执行的写入需要在其 Deferred 回调中统计，
+        这样 close_spider 等待写入完成后，stats 中的条数就已是最终结果。
+
+        Args:
+            table: 数据表名
+            count: 写入成功的条数
+        """
+        if count:
+            self.crawler.stats.inc_value(
+                f"{self.table_rows_stats_prefix}{table}", count
+            )
+
+    def _count_written(self, count: int, table: str) -> int:
+        """作为写入 Deferred 的回调，在写入事务提交后统计写入成功的条数
+
+        Args:
+            count: 写入成功的条数，即写入方法的返回值
+            table: 数据表名
+
+        Returns:
+            1). 写入成功的条数
+        """
+        self._count_rows(table, count)
+        return count
+
     @staticmethod
     def _connect(mysql_conf: MysqlConf) -> PymysqlConnection:
         """链接数据库操作：
@@ -58,7 +199,7 @@ class MysqlPipeEnhanceMixin:
         item: dict[str, Any],
         odku_enable: bool = True,
         insert_prefix: InsertPrefixStr = "INSERT",
-        duplicate: dict[str, Any] | None = None,
+        duplicate: Collection[str] | None = None,
     ) -> tuple[str, tuple]:
         """根据处理后的 item 生成 mysql 插入语句
 
@@ -67,26 +208,40 @@ class MysqlPipeEnhanceMixin:
             item: 处理后的 item
             odku_enable: 是否开启 ON DUPLICATE KEY UPDATE
             insert_prefix: INSERT 语句前缀设置: INSERT IGNORE or INSERT
-            duplicate: 需要更新的数据
+            duplicate: 冲突时需要更新的字段，更新为 item 中本次插入的值
 
         Returns:
             1). sql 插入语句
             2). sql 语句执行和格式化需要的 value
         """
-        keys = f"""`{"`, `".join(item.keys())}`"""
-        values = ", ".join(["%s"] * len(item))
-        if odku_enable:
-            if duplicate:
-                update = ",".join([f" `{key}` = %s" for key in duplicate])
-                args = tuple(item.values()) + tuple(duplicate.values())
-                sql = f"{insert_prefix} INTO `{table}` ({keys}) values ({values}) ON DUPLICATE KEY UPDATE {update}"
-            else:
-                args = tuple(item.values())
-                sql = f"{insert_prefix} INTO `{table}` ({keys}) values ({values})"
-            return sql, args
-        sql = f"{insert_prefix} INTO `{table}` ({keys}) values ({values})"
-        args = tuple(item.values())
-        return sql, args
+        duplicate_keys: tuple[str, ...] = ()
+        if odku_enable and duplicate:
+            # 按 item 中的字段顺序，同一分组的 item 会得到相同的语句
+            duplicate_keys = tuple(key for key in item if key in duplicate)
+        sql = _compile_mysql_sql(table, tuple(item), insert_prefix, duplicate_keys)
+        return sql, tuple(item.values())
+
+    @classmethod
+    def _get_sql_by_alter_item(
+        cls, alter_item: AlterItem, mysql_conf: MysqlConf
+    ) -> tuple[str, tuple]:
+        """根据 reshape 后的 item 及 mysql 配置生成插入语句
+
+        Args:
+            alter_item: reshape 后的 item
+            mysql_conf: mysql 配置
+
+        Returns:
+            1). sql 插入语句
+            2). sql 语句执行和格式化需要的 value
+        """
+        return cls._get_sql_by_item(
+            table=alter_item.table.name,
+            item=alter_item.new_item,
+            odku_enable=mysql_conf.odku_enable,
+            insert_prefix=mysql_conf.insert_prefix,
+            duplicate=alter_item.update_keys,
+        )
 
     @staticmethod
     def _get_log_by_spider(spider, crawl_time):
@@ -221,10 +376,34 @@ class PostgreSQLPipeEnhanceMixin:
         values = ", ".join(f"${i}" for i in range(1, len(item) + 1))
         return f"INSERT INTO {table} ({keys}) VALUES ({values}) ON CONFLICT DO NOTHING;"
 
+    @staticmethod
+    def _get_asyncpg_sql_key(alter_item: AlterItem) -> AsyncpgSqlKeyT:
+        """获取 alter_item 对应的 asyncpg upsert 语句结构，结构相同的 item 可复用同一条语句
+
+        Args:
+            alter_item: 处理后的 item
+
+        Returns:
+            1). 数据表，字段，冲突字段及冲突时需要更新的字段
+        """
+        return (
+            alter_item.table.name,
+            tuple(alter_item.new_item),
+            tuple(sorted(alter_item.conflict_cols)),
+            tuple(sorted(alter_item.update_keys or ())),
+        )
+
+    @staticmethod
+    def _get_asyncpg_sql(key: AsyncpgSqlKeyT) -> str:
+        """根据 _get_asyncpg_sql_key 的结果获取（缓存的）asyncpg upsert 语句"""
+        return _compile_asyncpg_upsert_sql(*key)
+
 
 class OraclePipeEnhanceMixin:
     """扩展 oracle pipelines 的功能"""
 
+    input_sizes: dict[OracleSqlKeyT, list[Any]]
+
     @staticmethod
     def _connect(oracle_conf: OracleConf) -> OracleConnection:
         """链接数据库返回链接句柄
@@ -251,3 +430,47 @@ class OraclePipeEnhanceMixin:
         keys = f""":{", :".join(item.keys())}"""
         table_keys = ", ".join(f'"{key}"' for key in item)
         return f'INSERT INTO "{table}" ({table_keys}) values ({keys})'
+
+    @staticmethod
+    def _get_oracle_sql_key(alter_item: AlterItem) -> OracleSqlKeyT:
+        """获取 alter_item 对应的 MERGE 语句结构，结构相同的 item 可以合并为一次 executemany
+
+        Args:
+            alter_item: 处理后的 item
+
+        Returns:
+            1). 数据表，字段，MERGE 的匹配字段及匹配时需要更新的字段
+        """
+        return (
+            alter_item.table.name,
+            tuple(alter_item.new_item),
+            tuple(alter_item._update_rule),
+            tuple(sorted(alter_item.update_keys or ())),
+        )
+
+    def _prepare_merge_many(
+        self, cursor: Any, key: OracleSqlKeyT, rows: list[tuple]
+    ) -> str:
+        """获取批量 MERGE 的 sql，并根据此批数据及之前的批次设置 cursor 的 setinputsizes
+
+        Args:
+            cursor: oracledb cursor，也可以是 twisted 的 Transaction
+            key: rows 对应的 MERGE 语句结构
+            rows: 需要写入的数据
+
+        Returns:
+            1). MERGE 语句
+        """
+        table, keys, match_cols, update_cols = key
+        sql, _ = GenOracle.merge_generate(
+            db_table=table,
+            match_cols=match_cols,
+            data=dict.fromkeys(keys),
+            update_cols=update_cols,
+        )
+        input_sizes = self.input_sizes[key] = get_oracle_input_sizes(
+            rows, self.input_sizes.get(key)
+        )
+        if any(size is not None for size in input_sizes):
+            cursor.setinputsizes(*input_sizes)
+        return sql
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = [
+    "init_asyncpg_connection",
+    "json_dumps",
+    "json_loads",
+    "register_psycopg_json",
+]
+
+if TYPE_CHECKING:
+    from asyncpg.connection import Connection
+    from psycopg.connection import Connection as PsycopgConnection
+
+# jsonb 二进制格式的版本号，目前只有 1
+_JSONB_VERSION = b"\x01"
+
+
+def json_dumps(obj: Any) -> bytes:
+    """将 obj 序列化为 utf-8 编码的 json，安装了 orjson 时使用 orjson
+
+    Examples:
+        >>> json_dumps({"a": [1, "中"]}).decode()
+        '{"a":[1,"中"]}'
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def json_loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _encode_json(obj: Any) -> bytes:
+    """编码 json 字段的值，str 和 bytes 视为已序列化的 json 原样写入，避免重复序列化
+
+    Examples:
+        >>> _encode_json('{"a": 1}')
+        b'{"a": 1}'
+        >>> _encode_json({"a": 1})
+        b'{"a":1}'
+    """
+    if isinstance(obj, str):
+        return obj.encode()
+    if isinstance(obj, bytes | bytearray | memoryview):
+        return bytes(obj)
+    return json_dumps(obj)
+
+
+def _encode_jsonb(obj: Any) -> bytes:
+    return _JSONB_VERSION + _encode_json(obj)
+
+
+def _decode_jsonb(data: bytes) -> Any:
+    return json_loads(data[1:])
+
+
+async def init_asyncpg_connection(conn: Connection) -> None:
+    """asyncpg 连接池的 init 回调，为每个连接注册 json 和 jsonb 的二进制编解码
+
+    注册后 dict 和 list 等字段值可以直接写入 json 或 jsonb 字段，不需要在写入前逐条 json.dumps，
+    读取时也会直接返回解析后的对象。已序列化的 str 或 bytes 值会原样写入，与注册前的写入结果一致。
+
+    Args:
+        conn: asyncpg connection
+    """
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary",
+    )
+    await conn.set_type_codec(
+        "json",
+        encoder=_encode_json,
+        decoder=json_loads,
+        schema="pg_catalog",
+        format="binary",
+    )
+
+
+def register_psycopg_json(conn: PsycopgConnection, list_as_jsonb: bool = False) -> None:
+    """为 psycopg 连接注册 dict 的 jsonb 二进制 dumper
+
+    psycopg 默认不能直接写入 dict，注册后 dict 字段值会以 jsonb 类型写入，与 asyncpg 的 pipelines 保持
+    一致。list 默认仍由 psycopg 作为数组写入，以兼容 text[] 或 int[] 等数组类型的字段。
+
+    Args:
+        conn: psycopg connection
+        list_as_jsonb: 是否将 list 同样以 jsonb 类型写入，对应 POSTGRES_LIST_AS_JSONB 配置
+    """
+    from psycopg.types.json import JsonbBinaryDumper  # noqa: PLC0415
+
+    class _JsonbBinaryDumper(JsonbBinaryDumper):
+        _dumps = staticmethod(json_dumps)
+
+    conn.adapters.register_dumper(dict, _JsonbBinaryDumper)
+    if list_as_jsonb:
+        conn.adapters.register_dumper(list, _JsonbBinaryDumper)
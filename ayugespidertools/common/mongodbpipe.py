@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import threading
 from typing import TYPE_CHECKING, Protocol
 
+from pymongo import ASCENDING, InsertOne, UpdateOne
+
 from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.config import logger
 
 __all__ = [
+    "AsyncMongoIndexCache",
     "AsyncStorageHandler",
+    "MongoIndexCache",
     "SyncStorageHandler",
+    "get_bulk_write_errors",
+    "get_update_doc",
+    "get_write_operation",
     "store_process",
     "store_process_async",
 ]
@@ -14,6 +23,7 @@ __all__ = [
 if TYPE_CHECKING:
     from motor.core import AgnosticDatabase
     from pymongo.database import Database
+    from pymongo.errors import BulkWriteError
 
 
 class SyncStorage(Protocol):
@@ -42,29 +52,90 @@ async def store_process_async(
     await handler.store(db, item_dict, collection, insert_data)
 
 
+def get_update_doc(item_dict: dict, insert_data: dict) -> dict:
+    """获取 upsert 时的更新文档，_update_keys 中的字段使用 $set，其余字段只在插入时写入
+
+    Args:
+        item_dict: item 转换后的 dict
+        insert_data: 需要写入的数据
+
+    Returns:
+        1). update_one 的 update 参数
+
+    Examples:
+        >>> get_update_doc({"_update_keys": {"b"}}, {"a": 1, "b": 2})
+        {'$set': {'b': 2}, '$setOnInsert': {'a': 1}}
+    """
+    update_doc = {}
+    if update_keys := item_dict.get("_update_keys"):
+        set_data = ReuseOperation.get_items_by_keys(data=insert_data, keys=update_keys)
+        update_doc["$set"] = set_data
+    else:
+        set_data = {}
+    update_doc["$setOnInsert"] = ReuseOperation.get_items_except_keys(
+        data=insert_data, keys=set_data
+    )
+    return update_doc
+
+
+def get_write_operation(item_dict: dict, insert_data: dict) -> InsertOne | UpdateOne:
+    """获取 item 对应的 bulk_write 操作，有 _update_rule 时为 upsert 的 UpdateOne，否则为 InsertOne
+
+    Args:
+        item_dict: item 转换后的 dict
+        insert_data: 需要写入的数据
+
+    Returns:
+        1). bulk_write 的写入操作
+    """
+    if update_rule := item_dict.get("_update_rule"):
+        return UpdateOne(
+            update_rule, get_update_doc(item_dict, insert_data), upsert=True
+        )
+    return InsertOne(insert_data)
+
+
+def get_bulk_write_errors(collection: str, err: BulkWriteError) -> list[str]:
+    """获取无序 bulk_write 中各个失败操作的报错信息，用于记录日志
+
+    Args:
+        collection: 集合名
+        err: bulk_write 的报错
+
+    Returns:
+        1). 每个失败操作的报错信息
+    """
+    details = err.details
+    errors = [
+        f"Pipe Error: {error.get('errmsg')} & Collection: {collection} & "
+        f"Offset: {error.get('index')} & Item: {error.get('op')}"
+        for error in details.get("writeErrors", [])
+    ]
+    if write_concern_errors := details.get("writeConcernErrors"):
+        errors.append(f"Pipe Error: {write_concern_errors} & Collection: {collection}")
+    return errors
+
+
 class SyncStorageHandler:
     @staticmethod
     def store(
         db: Database, item_dict: dict, collection: str, insert_data: dict
     ) -> None:
         if update_rule := item_dict.get("_update_rule"):
-            update_doc = {}
-            if update_keys := item_dict.get("_update_keys"):
-                set_data = ReuseOperation.get_items_by_keys(
-                    data=insert_data, keys=update_keys
-                )
-                update_doc["$set"] = set_data
-            else:
-                set_data = {}
-            update_doc["$setOnInsert"] = ReuseOperation.get_items_except_keys(
-                data=insert_data, keys=set_data
-            )
+            update_doc = get_update_doc(item_dict, insert_data)
             db[collection].update_one(
                 filter=update_rule, update=update_doc, upsert=True
             )
         else:
             db[collection].insert_one(insert_data)
 
+    @staticmethod
+    def store_many(
+        db: Database, collection: str, operations: list[InsertOne | UpdateOne]
+    ) -> None:
+        """使用无序的 bulk_write 写入 operations，只有 InsertOne 时与 insert_many 一致"""
+        db[collection].bulk_write(operations, ordered=False)
+
 
 class AsyncStorageHandler:
     @staticmethod
@@ -72,19 +143,132 @@ class AsyncStorageHandler:
         db: AgnosticDatabase, item_dict: dict, collection: str, insert_data: dict
     ) -> None:
         if update_rule := item_dict.get("_update_rule"):
-            update_doc = {}
-            if update_keys := item_dict.get("_update_keys"):
-                set_data = ReuseOperation.get_items_by_keys(
-                    data=insert_data, keys=update_keys
-                )
-                update_doc["$set"] = set_data
-            else:
-                set_data = {}
-            update_doc["$setOnInsert"] = ReuseOperation.get_items_except_keys(
-                data=insert_data, keys=set_data
-            )
+            update_doc = get_update_doc(item_dict, insert_data)
             await db[collection].update_one(
                 filter=update_rule, update=update_doc, upsert=True
             )
         else:
             await db[collection].insert_one(insert_data)
+
+
+def _has_index(index_info: dict, keys: list[str]) -> bool:
+    """判断已有的索引中是否有以 keys（顺序不限）为前缀的索引，有时等值查询 keys 即可使用此索引
+
+    Examples:
+        >>> _has_index({"_id_": {"key": [("_id", 1)]}}, ["_id"])
+        True
+        >>> _has_index({"a_1_b_1": {"key": [("a", 1), ("b", 1)]}}, ["b", "a"])
+        True
+        >>> _has_index({"a_1_b_1": {"key": [("a", 1), ("b", 1)]}}, ["b"])
+        False
+    """
+    for info in index_info.values():
+        fields = [field for field, _ in info["key"]]
+        if set(fields[: len(keys)]) == set(keys):
+            return True
+    return False
+
+
+class MongoIndexCache:
+    """根据 _update_rule 的查询字段自动为集合创建索引，避免 upsert 时全集合扫描
+
+    每个集合的每组查询字段首次遇到时读取集合已有的索引，没有可用的索引时再创建，确认有可用的索引后才会
+    缓存在进程中，之后的写入只需检查缓存。创建失败时之后的 item 会再次尝试，失败 max_attempts 次后不再尝试。
+
+    Args:
+        unique: 是否创建唯一索引，集合中已有重复数据时会创建失败并记录日志
+        max_attempts: 每组查询字段最多尝试创建索引的次数
+    """
+
+    def __init__(self, unique: bool = False, max_attempts: int = 3) -> None:
+        self.unique = unique
+        self.max_attempts = max_attempts
+        # 已有可用索引或已放弃创建的 (集合, 查询字段)
+        self._seen: set[tuple[str, frozenset[str]]] = set()
+        # 正在处理的 (集合, 查询字段)，避免同时重复创建
+        self._running: set[tuple[str, frozenset[str]]] = set()
+        self._failures: dict[tuple[str, frozenset[str]], int] = {}
+        self._lock = threading.Lock()
+
+    def pending(self, collection: str, item_dict: dict) -> list[str] | None:
+        """获取需要确保索引的查询字段，没有 _update_rule，已处理过或正在处理时返回 None
+
+        返回查询字段时，调用方需要接着调用 ensure_index 来处理。
+
+        Args:
+            collection: 集合名
+            item_dict: item 转换后的 dict
+
+        Returns:
+            1). 需要确保索引的查询字段
+        """
+        if not (update_rule := item_dict.get("_update_rule")):
+            return None
+
+        key = (collection, frozenset(update_rule))
+        if key in self._seen:
+            return None
+        with self._lock:
+            if key in self._seen or key in self._running:
+                return None
+            self._running.add(key)
+        return list(update_rule)
+
+    def _done(self, collection: str, keys: list[str], ok: bool) -> None:
+        """记录 ensure_index 的结果，成功或失败次数达到上限时不再处理此组查询字段"""
+        key = (collection, frozenset(keys))
+        with self._lock:
+            self._running.discard(key)
+            if ok:
+                self._seen.add(key)
+                return
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if self._failures[key] >= self.max_attempts:
+                self._seen.add(key)
+                logger.warning(
+                    f"集合 {collection} 创建索引 {keys} 已失败 {self.max_attempts} 次，不再尝试"
+                )
+
+    def _get_index_keys(self, keys: list[str]) -> list[tuple[str, int]]:
+        return [(key, ASCENDING) for key in keys]
+
+    def ensure_index(self, db: Database, collection: str, keys: list[str]) -> None:
+        """确保查询字段 keys 在集合中有可用的索引，没有时创建
+
+        Args:
+            db: pymongo database
+            collection: 集合名
+            keys: pending 返回的查询字段
+        """
+        try:
+            if _has_index(db[collection].index_information(), keys):
+                self._done(collection, keys, ok=True)
+                return
+            db[collection].create_index(self._get_index_keys(keys), unique=self.unique)
+        except Exception as e:
+            self._done(collection, keys, ok=False)
+            logger.warning(f"集合 {collection} 创建索引 {keys} 失败，err: {e}")
+        else:
+            self._done(collection, keys, ok=True)
+            logger.info(f"集合 {collection} 创建索引 {keys} 成功！")
+
+
+class AsyncMongoIndexCache(MongoIndexCache):
+    """MongoIndexCache 的 asyncio 版本，用于 AyuAsyncMongoPipeline"""
+
+    async def ensure_index(  # type: ignore[override]
+        self, db: AgnosticDatabase, collection: str, keys: list[str]
+    ) -> None:
+        try:
+            if _has_index(await db[collection].index_information(), keys):
+                self._done(collection, keys, ok=True)
+                return
+            await db[collection].create_index(
+                self._get_index_keys(keys), unique=self.unique
+            )
+        except Exception as e:
+            self._done(collection, keys, ok=False)
+            logger.warning(f"集合 {collection} 创建索引 {keys} 失败，err: {e}")
+        else:
+            self._done(collection, keys, ok=True)
+            logger.info(f"集合 {collection} 创建索引 {keys} 成功！")
@@ -107,6 +107,11 @@ class ReuseOperation:
             table_info = AlterItemTable(_table_name, _table_notes)
             new_item = {k: v.key_value for k, v in insert_data.items()}
             notes_dic = {k: v.notes for k, v in insert_data.items()}
+            types_dic = {
+                k: column_type
+                for k, v in insert_data.items()
+                if (column_type := getattr(v, "column_type", None))
+            }
             return AlterItem(
                 new_item=new_item,
                 notes_dic=notes_dic,
@@ -115,6 +120,7 @@ class ReuseOperation:
                 update_rule=update_rule,
                 update_keys=update_keys,
                 conflict_cols=conflict_cols,
+                types_dic=types_dic,
             )
 
         _table_name = item_dict.get("_table", "")
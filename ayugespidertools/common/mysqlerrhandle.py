@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import datetime
 import re
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, NamedTuple, TypeVar
+from typing import TYPE_CHECKING, Any, NamedTuple, TypeVar
 
 from ayugespidertools.config import logger
 
@@ -10,6 +11,10 @@ __all__ = [
     "Synchronize",
     "TwistedAsynchronous",
     "deal_mysql_err",
+    "get_column_definition",
+    "get_column_types",
+    "infer_column_type",
+    "is_schema_err",
 ]
 
 if TYPE_CHECKING:
@@ -17,12 +22,106 @@ if TYPE_CHECKING:
     from pymysql.cursors import Cursor, DictCursor
     from twisted.enterprise.adbapi import Transaction
 
-    from ayugespidertools.common.typevars import MysqlConf
+    from ayugespidertools.common.typevars import AlterItem, MysqlConf
 
     TwistedTransactionT = TypeVar("TwistedTransactionT", bound=Transaction)
     PymysqlDictCursorT = TypeVar("PymysqlDictCursorT", bound=DictCursor)
 
 
+DEFAULT_COLUMN_TYPE = "VARCHAR(255)"
+# deal_mysql_err 中会通过修改表结构处理的错误码
+SCHEMA_ERR_CODES = ("1054", "1146", "1406", "1265", "1264", "1292", "1366")
+
+
+def is_schema_err(err_msg: str) -> bool:
+    r"""判断写入时的报错是否为 deal_mysql_err 会修改表结构处理的错误
+
+    Args:
+        err_msg: pipeline 存储时报错内容
+
+    Returns:
+        1). 是否为表结构相关的错误
+
+    Examples:
+        >>> is_schema_err("(1054, \"Unknown column 'a' in 'field list'\")")
+        True
+        >>> is_schema_err("(2013, 'Lost connection to MySQL server during query')")
+        False
+    """
+    return any(code in err_msg for code in SCHEMA_ERR_CODES)
+
+
+def infer_column_type(value: Any, column_type: str | None = None) -> str:
+    """根据字段值推断自动添加字段时的字段类型，避免后续因类型或长度不符而修改字段类型时重建数据表
+
+    不超过 255 个字符的字符串使用可以建立索引的 VARCHAR(255)，更长的字符串及二进制类型会为后续更长的值预留
+    一倍的长度；整数统一使用 BIGINT，避免后续出现超出 INT 范围的值。
+
+    Args:
+        value: 首次写入时的字段值
+        column_type: 指定的字段类型，比如 DataItem 中的 column_type，指定时直接使用
+
+    Returns:
+        1). 字段类型
+
+    Examples:
+        >>> infer_column_type(1)
+        'BIGINT'
+        >>> infer_column_type("abc")
+        'VARCHAR(255)'
+        >>> infer_column_type("a" * 255)
+        'VARCHAR(255)'
+        >>> infer_column_type("a" * 1000)
+        'TEXT'
+        >>> infer_column_type({"a": 1})
+        'JSON'
+        >>> infer_column_type("abc", "INT")
+        'INT'
+    """
+    if column_type:
+        return column_type
+    if isinstance(value, bool):
+        return "TINYINT(1)"
+    if isinstance(value, int):
+        return "BIGINT"
+    if isinstance(value, float):
+        return "DOUBLE"
+    if isinstance(value, datetime.datetime):
+        return "DATETIME"
+    if isinstance(value, datetime.date):
+        return "DATE"
+    if isinstance(value, dict | list):
+        return "JSON"
+    if isinstance(value, bytes | bytearray):
+        size = len(value) * 2
+        if size <= 65535:
+            return "BLOB"
+        return "MEDIUMBLOB" if size <= 16777215 else "LONGBLOB"
+    if isinstance(value, str):
+        if len(value) <= 255:
+            return DEFAULT_COLUMN_TYPE
+        size = len(value.encode()) * 2
+        if size <= 65535:
+            return "TEXT"
+        return "MEDIUMTEXT" if size <= 16777215 else "LONGTEXT"
+    return DEFAULT_COLUMN_TYPE
+
+
+def get_column_types(alter_item: AlterItem) -> dict[str, str]:
+    """推断 alter_item 中各字段在自动添加时的字段类型"""
+    return {
+        k: infer_column_type(v, alter_item.types_dic.get(k))
+        for k, v in alter_item.new_item.items()
+    }
+
+
+def get_column_definition(column_type: str) -> str:
+    """获取添加字段时的字段定义，VARCHAR 类型保持原有的默认值 ''，其它类型默认为 NULL"""
+    if column_type.upper().startswith("VARCHAR"):
+        return f"{column_type} NULL DEFAULT ''"
+    return f"{column_type} NULL DEFAULT NULL"
+
+
 class MysqlContext(NamedTuple):
     cursor: Cursor | Transaction
     conn: Connection | None = None
@@ -50,10 +149,12 @@ class AbstractClass(ABC):
             collate: collate
             table_notes: 创建表的注释
         """
-        sql = (
-            f"CREATE TABLE IF NOT EXISTS `{table_name}` (`id` int(32) NOT NULL"
-            f" AUTO_INCREMENT COMMENT 'id', PRIMARY KEY (`id`)) ENGINE={engine}"
-            f" DEFAULT CHARSET={charset} COLLATE={collate} COMMENT={table_notes!r};"
+        sql = self._get_create_table_sql(
+            table_name=table_name,
+            engine=engine,
+            charset=charset,
+            collate=collate,
+            table_notes=table_notes,
         )
 
         try:
@@ -62,6 +163,108 @@ class AbstractClass(ABC):
         except Exception as e:
             logger.error(f"创建表 {table_name} 失败，err：{e}")
 
+    @staticmethod
+    def _get_create_table_sql(
+        table_name: str,
+        engine: str,
+        charset: str,
+        collate: str,
+        table_notes: str = "",
+    ) -> str:
+        """获取创建数据库表的 sql 语句，参数同 _create_table"""
+        return (
+            f"CREATE TABLE IF NOT EXISTS `{table_name}` (`id` int(32) NOT NULL"
+            f" AUTO_INCREMENT COMMENT 'id', PRIMARY KEY (`id`)) ENGINE={engine}"
+            f" DEFAULT CHARSET={charset} COLLATE={collate} COMMENT={table_notes!r};"
+        )
+
+    @staticmethod
+    def _get_change_column_type(column_type: str | None) -> str:
+        """获取字段内容过长或类型不符时需要修改为的字段类型
+
+        Args:
+            column_type: 字段当前的存储类型
+
+        Returns:
+            1). 修改后的字段类型，text 类型修改为 LONGTEXT，blob 类型修改为 LONGBLOB，其它修改为 TEXT
+        """
+        if column_type in {"text", "mediumtext"}:
+            return "LONGTEXT"
+        if column_type in {"blob", "mediumblob"}:
+            return "LONGBLOB"
+        return "TEXT"
+
+    @staticmethod
+    def _get_widen_column_type(column_type: str | None, err_msg: str) -> str | None:
+        """获取字段值超出范围等问题时可以放宽到的同类字段类型
+
+        只会放宽数值及时间类型（比如 INT 改为 BIGINT，DATE 改为 DATETIME），不会修改为 TEXT 等其它类型，
+        所以字段值与字段类型不是同一类时（比如 1366 Incorrect integer value）返回 None。
+
+        Args:
+            column_type: 字段当前的存储类型
+            err_msg: 报错内容
+
+        Returns:
+            1). 放宽后的字段类型，不能放宽时为 None
+
+        Examples:
+            >>> AbstractClass._get_widen_column_type("int(11)", "1264, Out of range value")
+            'BIGINT'
+            >>> AbstractClass._get_widen_column_type("bigint", "1264, Out of range value")
+            'DECIMAL(65,0)'
+            >>> AbstractClass._get_widen_column_type("date", "1292, Incorrect datetime value")
+            'DATETIME'
+            >>> AbstractClass._get_widen_column_type("int", "1366, Incorrect integer value") is None
+            True
+        """
+        base_type = (column_type or "").split("(")[0].split()[0:1]
+        base = base_type[0].lower() if base_type else ""
+        if "1264" in err_msg:
+            if base in {"tinyint", "smallint", "mediumint", "int", "integer"}:
+                return "BIGINT"
+            if base == "bigint":
+                return "DECIMAL(65,0)"
+            if base == "float":
+                return "DOUBLE"
+        if "1292" in err_msg and base in {"date", "timestamp"}:
+            return "DATETIME"
+        return None
+
+    @staticmethod
+    def _get_change_column_sql(
+        table: str, colum: str, column_type: str | None, notes: str
+    ) -> tuple[str, str]:
+        """获取字段内容过长或类型不符时修改字段类型的 sql 语句
+
+        Args:
+            table: 数据表名
+            colum: 字段名称
+            column_type: 字段当前的存储类型
+            notes: 字段注释
+
+        Returns:
+            1). sql: 修改字段类型的 sql
+            2). 执行此 sql 可能会报错的信息
+        """
+        change_colum_type = AbstractClass._get_change_column_type(column_type)
+        sql = (
+            f"ALTER TABLE `{table}` CHANGE COLUMN `{colum}` `{colum}`"
+            f" {change_colum_type} NULL DEFAULT NULL COMMENT {notes!r};"
+        )
+        return sql, f"更新 {colum} 字段类型为 {change_colum_type} 时失败"
+
+    @staticmethod
+    def _get_widen_column_sql(
+        table: str, colum: str, column_type: str, notes: str
+    ) -> tuple[str, str]:
+        """获取将字段放宽为 column_type 的 sql 语句，参数同 _get_change_column_sql"""
+        sql = (
+            f"ALTER TABLE `{table}` MODIFY COLUMN `{colum}` {column_type}"
+            f" NULL DEFAULT NULL COMMENT {notes!r};"
+        )
+        return sql, f"更新 {colum} 字段类型为 {column_type} 时失败"
+
     def _get_column_type(
         self, context: MysqlContext, database: str, table: str, column: str
     ) -> str | None:
@@ -103,6 +306,7 @@ class AbstractClass(ABC):
         table: str,
         table_notes: str,
         note_dic: dict[str, str],
+        column_dic: dict[str, str] | None = None,
     ) -> None:
         """模板方法，用于处理 mysql 存储场景的异常
 
@@ -113,10 +317,11 @@ class AbstractClass(ABC):
             table: 数据表
             table_notes: 数据表注释
             note_dic: 当前表字段注释
+            column_dic: 当前表字段自动添加时的字段类型，不传时为 VARCHAR(255)
         """
         if "1054" in err_msg:
             sql, possible_err = self.deal_1054_error(
-                err_msg=err_msg, table=table, note_dic=note_dic
+                err_msg=err_msg, table=table, note_dic=note_dic, column_dic=column_dic
             )
             self._exec_sql(context=context, sql=sql, possible_err=possible_err)
 
@@ -150,11 +355,25 @@ class AbstractClass(ABC):
             )
             self._exec_sql(context=context, sql=sql, possible_err=possible_err)
 
+        elif any(code in err_msg for code in ("1264", "1292", "1366")):
+            sql, possible_err = self.deal_incorrect_value_error(
+                err_msg=err_msg,
+                context=context,
+                database=mysql_conf.database,
+                table=table,
+                note_dic=note_dic,
+            )
+            self._exec_sql(context=context, sql=sql, possible_err=possible_err)
+
         else:
             raise Exception(f"MYSQL OTHER ERROR: {err_msg}")
 
     def deal_1054_error(
-        self, err_msg: str, table: str, note_dic: dict[str, str]
+        self,
+        err_msg: str,
+        table: str,
+        note_dic: dict[str, str],
+        column_dic: dict[str, str] | None = None,
     ) -> tuple[str, str]:
         """解决 1054, u"Unknown column 'xx' in 'field list'"
 
@@ -162,6 +381,7 @@ class AbstractClass(ABC):
             err_msg: 报错内容
             table: 数据表名
             note_dic: 当前表字段的注释
+            column_dic: 当前表字段自动添加时的字段类型
 
         Returns:
             1). sql: 用于添加字段的 sql 语句
@@ -172,7 +392,8 @@ class AbstractClass(ABC):
         colum = text[0]
         notes = note_dic[colum]
 
-        sql = f"ALTER TABLE `{table}` ADD COLUMN `{colum}` VARCHAR(255) NULL DEFAULT '' COMMENT {notes!r};"
+        column_type = (column_dic or {}).get(colum, DEFAULT_COLUMN_TYPE)
+        sql = f"ALTER TABLE `{table}` ADD COLUMN `{colum}` {get_column_definition(column_type)} COMMENT {notes!r};"
         return sql, f"添加字段 {colum} 已存在"
 
     def deal_1406_error(
@@ -204,12 +425,7 @@ class AbstractClass(ABC):
             column_type = self._get_column_type(
                 context=context, database=database, table=table, column=colum
             )
-            change_colum_type = "LONGTEXT" if column_type == "text" else "TEXT"
-            sql = (
-                f"ALTER TABLE `{table}` CHANGE COLUMN `{colum}` `{colum}`"
-                f" {change_colum_type} NULL DEFAULT NULL COMMENT {notes!r};"
-            )
-            return sql, f"更新 {colum} 字段类型为 {change_colum_type} 时失败"
+            return self._get_change_column_sql(table, colum, column_type, notes)
         raise Exception(f"未解决 Data too long 的问题，err: {err_msg}")
 
     def deal_1265_error(
@@ -241,14 +457,50 @@ class AbstractClass(ABC):
             column_type = self._get_column_type(
                 context=context, database=database, table=table, column=colum
             )
-            change_colum_type = "LONGTEXT" if column_type == "text" else "TEXT"
-            sql = (
-                f"ALTER TABLE `{table}` CHANGE COLUMN `{colum}` `{colum}`"
-                f" {change_colum_type} NULL DEFAULT NULL COMMENT {notes!r};"
-            )
-            return sql, f"更新 {colum} 字段类型为 {change_colum_type} 时失败"
+            return self._get_change_column_sql(table, colum, column_type, notes)
         raise Exception(f"未解决 Data truncated 问题，err: {err_msg}")
 
+    def deal_incorrect_value_error(
+        self,
+        err_msg: str,
+        context: MysqlContext,
+        database: str,
+        table: str,
+        note_dic: dict[str, str],
+    ) -> tuple[str, str]:
+        """解决字段值与自动推断的字段类型不符的问题，比如：
+            1264, u"Out of range value for column 'xx' at row 1"
+            1292, u"Incorrect datetime value: 'xx' for column 'xx' at row 1"
+            1366, u"Incorrect integer value: 'xx' for column 'xx' at row 1"
+
+        只会将数值及时间类型放宽为同类的更大类型，不能放宽时抛出异常，即跳过此条数据，不修改字段类型。
+
+        Args:
+            err_msg: 报错内容
+            context: mysql connect context
+            database: 数据库名
+            table: 数据表名
+            note_dic: 当前表字段的注释
+
+        Returns:
+            1). sql: 修改字段类型的 sql
+            2). 执行此 sql 可能会报错的信息
+        """
+        colum_pattern = re.compile(r"for column '(.*?)' at row")
+        if text := re.findall(colum_pattern, err_msg):
+            colum = text[0]
+            column_type = self._get_column_type(
+                context=context, database=database, table=table, column=colum
+            )
+            if widen_type := self._get_widen_column_type(column_type, err_msg):
+                return self._get_widen_column_sql(
+                    table, colum, widen_type, note_dic[colum]
+                )
+            raise Exception(
+                f"字段 {colum} 的值与字段类型 {column_type} 不符，跳过此条数据，err: {err_msg}"
+            )
+        raise Exception(f"未解决字段类型不符的问题，err: {err_msg}")
+
     @abstractmethod
     def _exec_sql(
         self, context: MysqlContext, sql: str, possible_err: str | None = None
@@ -295,6 +547,7 @@ def deal_mysql_err(
     table_notes: str,
     note_dic: dict[str, str],
     conn: Connection | None = None,
+    column_dic: dict[str, str] | None = None,
 ) -> None:
     context = MysqlContext(cursor=cursor, conn=conn)
     abstract_class.template_method(
@@ -304,4 +557,5 @@ def deal_mysql_err(
         table,
         table_notes,
         note_dic,
+        column_dic,
     )
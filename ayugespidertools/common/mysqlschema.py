@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+from typing import TYPE_CHECKING
+
+from ayugespidertools.common.mysqlerrhandle import (
+    AbstractClass,
+    MysqlContext,
+    get_column_definition,
+    get_column_types,
+)
+from ayugespidertools.config import logger
+
+__all__ = [
+    "AsyncMysqlSchemaCache",
+    "MysqlSchemaCache",
+]
+
+if TYPE_CHECKING:
+    from aiomysql import Cursor as AiomysqlCursor
+    from pymysql.cursors import Cursor
+    from twisted.enterprise.adbapi import Transaction
+
+    from ayugespidertools.common.typevars import AlterItem, MysqlConf
+
+
+# 需要修改字段类型的报错：内容过长，及字段值与字段类型不符
+_CHANGE_COLUMN_CODES = ("1406", "1265", "1264", "1292", "1366")
+_CHANGE_COLUMN_PATTERN = re.compile(r"for column '(.*?)' at")
+
+
+def _get_add_columns_sql(
+    table: str, columns: list[str], alter_item: AlterItem
+) -> tuple[str, dict[str, str]]:
+    """获取一次添加多个字段的 ALTER TABLE 语句
+
+    Args:
+        table: 数据表名
+        columns: 需要添加的字段
+        alter_item: 需要写入的 item，用于获取字段注释及推断字段类型
+
+    Returns:
+        1). ALTER TABLE 语句
+        2). 添加的字段及其类型
+    """
+    column_types = get_column_types(alter_item)
+    add_types = {col: column_types[col] for col in columns}
+    add_columns = ", ".join(
+        f"ADD COLUMN `{col}` {get_column_definition(column_type)}"
+        f" COMMENT {alter_item.notes_dic.get(col, '')!r}"
+        for col, column_type in add_types.items()
+    )
+    return f"ALTER TABLE `{table}` {add_columns};", add_types
+
+
+class MysqlSchemaCache:
+    """缓存 mysql 数据表已有的字段，在写入前一次性补全 item 中新增的字段
+
+    每个数据表只在首次写入时从 information_schema.columns 中加载一次字段信息，数据表不存在时会先创建，
+    item 中缺少的字段会合并为一条 ALTER TABLE 语句添加，避免每个新字段都要经过一次写入报错和重试。
+    """
+
+    def __init__(self, mysql_conf: MysqlConf, abstract_class: AbstractClass) -> None:
+        self.mysql_conf = mysql_conf
+        self.abstract_class = abstract_class
+        self._columns: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def ensure_columns(
+        self, cursor: Cursor | Transaction, alter_item: AlterItem
+    ) -> None:
+        """确保 alter_item 对应的数据表及字段都已存在
+
+        Args:
+            cursor: mysql cursor，可以是 pymysql 的 Cursor 或 twisted 的 Transaction
+            alter_item: 需要写入的 item
+        """
+        table = alter_item.table.name
+        columns = alter_item.new_item.keys()
+        cached = self._columns.get(table)
+        if cached is not None and all(col.lower() in cached for col in columns):
+            return
+
+        with self._lock:
+            if (cached := self._columns.get(table)) is None:
+                cached = self._load_columns(cursor, table)
+                if not cached:
+                    self.abstract_class._create_table(
+                        context=MysqlContext(cursor=cursor),
+                        table_name=table,
+                        engine=self.mysql_conf.engine,
+                        charset=self.mysql_conf.charset,
+                        collate=self.mysql_conf.collate,
+                        table_notes=alter_item.table.notes,
+                    )
+                    cached = self._load_columns(cursor, table)
+                self._columns[table] = cached
+
+            if missing := [col for col in columns if col.lower() not in cached]:
+                if self._add_columns(cursor, table, missing, alter_item):
+                    cached.update(col.lower() for col in missing)
+                else:
+                    self._columns.pop(table, None)
+
+    def invalidate(self, table: str) -> None:
+        """删除数据表的字段缓存，下次写入时会重新加载"""
+        with self._lock:
+            self._columns.pop(table, None)
+
+    def _load_columns(self, cursor: Cursor | Transaction, table: str) -> set[str]:
+        sql = (
+            "select COLUMN_NAME from information_schema.columns"
+            " where table_schema = %s and table_name = %s;"
+        )
+        cursor.execute(sql, (self.mysql_conf.database, table))
+        # DictCursor 返回的结构示例为：[{'COLUMN_NAME': 'id'}]，普通 Cursor 为：(('id',),)
+        return {
+            (next(iter(row.values())) if isinstance(row, dict) else row[0]).lower()
+            for row in cursor.fetchall()
+        }
+
+    def _add_columns(
+        self,
+        cursor: Cursor | Transaction,
+        table: str,
+        columns: list[str],
+        alter_item: AlterItem,
+    ) -> bool:
+        sql, _ = _get_add_columns_sql(table, columns, alter_item)
+        try:
+            cursor.execute(sql)
+        except Exception as e:
+            logger.warning(f"数据表 {table} 添加字段 {columns} 失败，err: {e}")
+            return False
+        logger.info(f"数据表 {table} 添加字段 {columns} 成功！")
+        return True
+
+
+class AsyncMysqlSchemaCache:
+    """MysqlSchemaCache 的 asyncio 版本，用于 AyuAsyncMysqlPipeline
+
+    同一个数据表的 DDL 操作由表级别的 asyncio.Lock 串行执行：多个协程同时遇到同一个 1054，1146，1406，
+    1265 等报错时，只有第一个协程会执行 DDL，其它协程等待其完成后直接重试写入。字段及其类型的缓存在所有
+    协程间共享，其它数据表的写入不受影响。
+    """
+
+    def __init__(self, mysql_conf: MysqlConf) -> None:
+        self.mysql_conf = mysql_conf
+        # 数据表 -> {字段名: 字段类型}
+        self._columns: dict[str, dict[str, str]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        # 数据表每执行一次 DDL 加 1，用于判断报错后是否已被其它协程处理
+        self._versions: dict[str, int] = {}
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def _get_lock(self, table: str) -> asyncio.Lock:
+        if (lock := self._locks.get(table)) is None:
+            lock = self._locks[table] = asyncio.Lock()
+        return lock
+
+    async def ensure_columns(
+        self, cursor: AiomysqlCursor, alter_item: AlterItem
+    ) -> None:
+        """确保 alter_item 对应的数据表及字段都已存在
+
+        Args:
+            cursor: aiomysql cursor
+            alter_item: 需要写入的 item
+        """
+        cached = self._columns.get(alter_item.table.name)
+        if cached is not None and all(
+            col.lower() in cached for col in alter_item.new_item
+        ):
+            return
+
+        async with self._get_lock(alter_item.table.name):
+            await self._ensure_columns(cursor, alter_item)
+
+    async def deal_mysql_err(
+        self,
+        cursor: AiomysqlCursor,
+        err_msg: str,
+        alter_item: AlterItem,
+        version: int,
+    ) -> None:
+        """处理写入时的表结构问题，处理后（或已被其它协程处理后）返回，由调用方重试写入
+
+        Args:
+            cursor: aiomysql cursor
+            err_msg: 写入时的报错内容
+            alter_item: 需要写入的 item
+            version: 写入前获取的数据表 DDL 版本
+
+        Raises:
+            Exception: 不是表结构相关的问题
+        """
+        if not any(code in err_msg for code in ("1054", "1146", *_CHANGE_COLUMN_CODES)):
+            raise Exception(f"MYSQL OTHER ERROR: {err_msg}")
+
+        table = alter_item.table.name
+        async with self._get_lock(table):
+            if self.version(table) != version:
+                return
+
+            if "1054" in err_msg or "1146" in err_msg:
+                # 字段缓存已过期，比如数据表被删除或修改，重新加载后补全
+                self._columns.pop(table, None)
+                await self._ensure_columns(cursor, alter_item)
+            else:
+                await self._change_column(cursor, err_msg, alter_item)
+            self._bump_version(table)
+
+    async def _ensure_columns(
+        self, cursor: AiomysqlCursor, alter_item: AlterItem
+    ) -> None:
+        table = alter_item.table.name
+        if (cached := self._columns.get(table)) is None:
+            cached = await self._load_columns(cursor, table)
+            if not cached:
+                sql = AbstractClass._get_create_table_sql(
+                    table_name=table,
+                    engine=self.mysql_conf.engine,
+                    charset=self.mysql_conf.charset,
+                    collate=self.mysql_conf.collate,
+                    table_notes=alter_item.table.notes,
+                )
+                if await self._exec_sql(cursor, sql, f"创建表 {table} 失败"):
+                    logger.info(f"创建数据表 {alter_item.table.notes}: {table} 成功！")
+                    self._bump_version(table)
+                cached = await self._load_columns(cursor, table)
+            self._columns[table] = cached
+
+        if missing := [col for col in alter_item.new_item if col.lower() not in cached]:
+            sql, add_types = _get_add_columns_sql(table, missing, alter_item)
+            if await self._exec_sql(
+                cursor, sql, f"数据表 {table} 添加字段 {missing} 失败"
+            ):
+                cached.update((col.lower(), t.lower()) for col, t in add_types.items())
+                self._bump_version(table)
+            else:
+                self._columns.pop(table, None)
+
+    async def _change_column(
+        self, cursor: AiomysqlCursor, err_msg: str, alter_item: AlterItem
+    ) -> None:
+        if not (matched := _CHANGE_COLUMN_PATTERN.search(err_msg)):
+            raise Exception(f"未解决字段类型的问题，err: {err_msg}")
+
+        table = alter_item.table.name
+        colum = matched.group(1)
+        if (cached := self._columns.get(table)) is None or colum.lower() not in cached:
+            cached = self._columns[table] = await self._load_columns(cursor, table)
+        column_type = cached.get(colum.lower())
+        notes = alter_item.notes_dic.get(colum, "")
+        if "1406" in err_msg or "1265" in err_msg:
+            # 内容过长时按当前类型逐级修改
+            change_type = AbstractClass._get_change_column_type(column_type)
+            sql, possible_err = AbstractClass._get_change_column_sql(
+                table, colum, column_type, notes
+            )
+        elif change_type := AbstractClass._get_widen_column_type(column_type, err_msg):
+            # 数值或时间类型的值超出范围时放宽为同类的更大类型
+            sql, possible_err = AbstractClass._get_widen_column_sql(
+                table, colum, change_type, notes
+            )
+        else:
+            raise Exception(
+                f"字段 {colum} 的值与字段类型 {column_type} 不符，跳过此条数据，err: {err_msg}"
+            )
+        if await self._exec_sql(cursor, sql, possible_err):
+            cached[colum.lower()] = change_type.lower()
+
+    def _bump_version(self, table: str) -> None:
+        self._versions[table] = self.version(table) + 1
+
+    async def _load_columns(self, cursor: AiomysqlCursor, table: str) -> dict[str, str]:
+        sql = (
+            "select COLUMN_NAME, COLUMN_TYPE from information_schema.columns"
+            " where table_schema = %s and table_name = %s;"
+        )
+        await cursor.execute(sql, (self.mysql_conf.database, table))
+        return {row[0].lower(): row[1].lower() for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def _exec_sql(cursor: AiomysqlCursor, sql: str, possible_err: str) -> bool:
+        try:
+            await cursor.execute(sql)
+        except Exception as e:
+            logger.warning(
+                f"asyncio mysql exec sql err: {e!s}\npossible_err: {possible_err}"
+            )
+            return False
+        return True
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, NamedTuple, TypeVar
+from typing import TYPE_CHECKING, Any, NamedTuple, TypeVar
 
 from ayugespidertools.config import logger
 
@@ -35,6 +35,8 @@ class AbstractClass(ABC):
         table: str,
         table_notes: str,
         note_dic: dict[str, str],
+        new_item: dict[str, Any] | None = None,
+        list_as_jsonb: bool = False,
     ) -> None:
         """模板方法，用于处理 postgresql 存储场景的异常
 
@@ -44,10 +46,16 @@ class AbstractClass(ABC):
             table: 数据表
             table_notes: 数据表注释
             note_dic: 当前表字段注释
+            new_item: 当前写入的数据，用于推断需要添加的字段类型
+            list_as_jsonb: list 类型的字段是否以 jsonb 类型写入
         """
         if f' of relation "{table}" does not exist' in err_msg:
             sql, possible_err = self.deal_1054_error(
-                err_msg=err_msg, table=table, note_dic=note_dic
+                err_msg=err_msg,
+                table=table,
+                note_dic=note_dic,
+                new_item=new_item,
+                list_as_jsonb=list_as_jsonb,
             )
             self._exec_sql(context=context, sql=sql, possible_err=possible_err)
 
@@ -66,7 +74,12 @@ class AbstractClass(ABC):
             raise Exception(f"POSTGRES OTHER ERROR: {err_msg}")
 
     def deal_1054_error(
-        self, err_msg: str, table: str, note_dic: dict[str, str]
+        self,
+        err_msg: str,
+        table: str,
+        note_dic: dict[str, str],
+        new_item: dict[str, Any] | None = None,
+        list_as_jsonb: bool = False,
     ) -> tuple[str, str]:
         """解决 column "xxx" of relation "x" does not exist
 
@@ -74,6 +87,8 @@ class AbstractClass(ABC):
             err_msg: 报错内容
             table: 数据表名
             note_dic: 当前表字段的注释
+            new_item: 当前写入的数据，dict 类型的字段会添加为 JSONB 类型
+            list_as_jsonb: 为 True 时 list 类型的字段同样添加为 JSONB 类型
 
         Returns:
             1). sql: 用于添加字段的 sql 语句
@@ -83,9 +98,13 @@ class AbstractClass(ABC):
         text = re.findall(colum_pattern, err_msg)
         colum = text[0]
         notes = note_dic[colum]
+        column_type = "VARCHAR(255) DEFAULT ''"
+        json_types = (dict, list) if list_as_jsonb else (dict,)
+        if new_item and isinstance(new_item.get(colum), json_types):
+            column_type = "JSONB"
 
         sql = (
-            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {colum} VARCHAR(255) DEFAULT '';"
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {colum} {column_type};"
             f"COMMENT ON COLUMN {table}.{colum} IS {notes!r}"
         )
         return sql, f"添加字段 {colum} 已存在"
@@ -140,6 +159,8 @@ def deal_postgres_err(
     table_notes: str,
     note_dic: dict[str, str],
     conn: Connection | None = None,
+    new_item: dict[str, Any] | None = None,
+    list_as_jsonb: bool = False,
 ) -> None:
     context = PostgresContext(cursor=cursor, conn=conn)
     abstract_class.template_method(
@@ -148,4 +169,6 @@ def deal_postgres_err(
         table,
         table_notes,
         note_dic,
+        new_item,
+        list_as_jsonb,
     )
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import threading
+from typing import TYPE_CHECKING, Any
+
+from ayugespidertools.common.typevars import PartitionConf
+from ayugespidertools.config import logger
+
+__all__ = [
+    "AsyncPostgresPartitioner",
+    "PostgresPartitioner",
+    "coerce_partition_value",
+    "get_partition_bounds",
+    "get_partition_conf",
+    "to_partition_value",
+]
+
+if TYPE_CHECKING:
+    from asyncpg.pool import Pool as PGPool
+    from psycopg.connection import Connection
+    from scrapy.settings import BaseSettings
+
+    from ayugespidertools.common.typevars import AlterItem
+    from ayugespidertools.utils.database import StatsPool
+
+# 未指定分区字段的类型时，分区父表中此字段的类型
+DEFAULT_PARTITION_TYPE = "TIMESTAMP"
+# 查询数据表中分区字段的实际类型，数据表可能是之前的运行或用户自己创建的
+_COLUMN_TYPE_SQL = (
+    "SELECT format_type(atttypid, atttypmod) FROM pg_attribute"
+    " WHERE attrelid = to_regclass({0}::text) AND attname = {1} AND NOT attisdropped"
+)
+
+
+def get_partition_conf(settings: BaseSettings) -> PartitionConf:
+    """从 scrapy settings 中获取 POSTGRES_PARTITION_CONFIG 分区写入配置
+
+    Args:
+        settings: scrapy 的 settings 信息
+
+    Returns:
+        1). 分区写入配置，未配置时其 column 为空，即不开启分区写入
+    """
+    partition_conf = settings.getdict("POSTGRES_PARTITION_CONFIG")
+    conf = PartitionConf(**partition_conf) if partition_conf else PartitionConf()
+    assert conf.interval in {"day", "month"}, (
+        f"POSTGRES_PARTITION_CONFIG 的 interval 只支持 day 或 month，当前为 {conf.interval}"
+    )
+    return conf
+
+
+def to_partition_value(value: Any) -> datetime.date | None:
+    """将分区字段的值转换为 date 或 datetime，不能转换时返回 None
+
+    Args:
+        value: 分区字段的值，可以是 date，datetime，时间戳或 ISO 格式的时间字符串
+
+    Returns:
+        1). 转换后的值
+
+    Examples:
+        >>> to_partition_value("2024-05-06 07:08:09")
+        datetime.datetime(2024, 5, 6, 7, 8, 9)
+        >>> to_partition_value("2024-05-06")
+        datetime.date(2024, 5, 6)
+        >>> to_partition_value("abc") is None
+        True
+    """
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, int | float) and not isinstance(value, bool):
+        return datetime.datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        try:
+            if len(value) == 10:
+                return datetime.date.fromisoformat(value)
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def coerce_partition_value(value: datetime.date, column_type: str) -> datetime.date:
+    """将分区字段的值转换为与其字段类型一致的 date 或 datetime
+
+    Args:
+        value: to_partition_value 转换后的值
+        column_type: 分区字段在数据库中的类型
+
+    Returns:
+        1). 转换后的值
+
+    Examples:
+        >>> coerce_partition_value(datetime.date(2024, 5, 6), "timestamp without time zone")
+        datetime.datetime(2024, 5, 6, 0, 0)
+        >>> coerce_partition_value(datetime.datetime(2024, 5, 6, 7), "date")
+        datetime.date(2024, 5, 6)
+    """
+    if column_type.lower().startswith("date"):
+        return value.date() if isinstance(value, datetime.datetime) else value
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def get_partition_bounds(
+    value: datetime.date, interval: str
+) -> tuple[str, datetime.date, datetime.date]:
+    """获取 value 所在分区的名称后缀及其范围
+
+    Args:
+        value: 分区字段的值
+        interval: 每个分区的时间范围，day 或 month
+
+    Returns:
+        1). 分区名称后缀
+        2). 分区的开始日期（包含）
+        3). 分区的结束日期（不包含）
+
+    Examples:
+        >>> get_partition_bounds(datetime.date(2024, 12, 6), "month")
+        ('202412', datetime.date(2024, 12, 1), datetime.date(2025, 1, 1))
+        >>> get_partition_bounds(datetime.datetime(2024, 5, 6, 7), "day")
+        ('20240506', datetime.date(2024, 5, 6), datetime.date(2024, 5, 7))
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if interval == "day":
+        return f"{value:%Y%m%d}", value, value + datetime.timedelta(days=1)
+
+    start = value.replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return f"{start:%Y%m}", start, end
+
+
+class PostgresPartitioner:
+    """按 POSTGRES_PARTITION_CONFIG 将 item 写入按时间分区的 postgresql 数据表
+
+    写入前会确保数据表为声明式分区的父表，并提前创建分区字段值所在的分区及其之后的 premake 个分区，
+    已创建的分区名会缓存在进程中，之后的写入只需检查缓存。分区字段的值会按其在数据库中的实际类型转换，
+    ON CONFLICT 的冲突字段也会加上分区字段，以匹配分区表包含分区字段的主键。数据表已存在且不是分区表时，
+    会记录日志并不再处理此表的分区，item 也不会做任何修改。
+    """
+
+    def __init__(self, conf: PartitionConf) -> None:
+        self.conf = conf
+        # 已确认存在的分区父表及分区
+        self._created: set[str] = set()
+        # 不能按分区写入的数据表
+        self._disabled: set[str] = set()
+        # 数据表 -> 分区字段在数据库中的类型
+        self._column_types: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get_value(self, alter_item: AlterItem) -> datetime.date | None:
+        """获取 alter_item 需要分区写入时的分区字段值，不需要时返回 None"""
+        if alter_item.table.name in self._disabled:
+            return None
+        return to_partition_value(alter_item.new_item.get(self.conf.column))
+
+    def plan(
+        self, alter_item: AlterItem, value: datetime.date
+    ) -> list[tuple[str, str]]:
+        """获取写入 alter_item 前还需要执行的 DDL
+
+        Args:
+            alter_item: 需要写入的 item
+            value: 分区字段的值
+
+        Returns:
+            1). 需要创建的分区父表或分区名，及其 DDL 语句
+        """
+        table = alter_item.table.name
+        column = self.conf.column
+        ddl = []
+        if table not in self._created:
+            column_type = alter_item.types_dic.get(column) or DEFAULT_PARTITION_TYPE
+            ddl.append(
+                (
+                    table,
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"id BIGSERIAL NOT NULL, {column} {column_type} NOT NULL, "
+                    f"PRIMARY KEY (id, {column})) PARTITION BY RANGE ({column});"
+                    f"COMMENT ON TABLE {table} IS {alter_item.table.notes!r};",
+                )
+            )
+
+        for _ in range(self.conf.premake + 1):
+            suffix, start, end = get_partition_bounds(value, self.conf.interval)
+            if (partition := f"{table}_p{suffix}") not in self._created:
+                ddl.append(
+                    (
+                        partition,
+                        f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start}') TO ('{end}');",
+                    )
+                )
+            value = end
+        return ddl
+
+    def apply(self, alter_item: AlterItem, value: datetime.date) -> AlterItem:
+        """获取按分区写入的 alter_item，不会修改原 alter_item
+
+        分区字段的值转换为与字段类型一致的值，ON CONFLICT 的冲突字段加上分区字段。
+
+        Args:
+            alter_item: 需要写入的 item
+            value: 分区字段的值
+
+        Returns:
+            1). 按分区写入的 alter_item
+        """
+        table = alter_item.table.name
+        column = self.conf.column
+        column_type = self._column_types.get(table, DEFAULT_PARTITION_TYPE)
+        new_item = {
+            **alter_item.new_item,
+            column: coerce_partition_value(value, column_type),
+        }
+        conflict_cols = alter_item.conflict_cols
+        if conflict_cols and column not in conflict_cols:
+            conflict_cols = {*conflict_cols, column}
+        return alter_item._replace(new_item=new_item, conflict_cols=conflict_cols)
+
+    def _set_column_type(self, table: str, column_type: str | None) -> None:
+        if column_type:
+            self._column_types[table] = column_type
+
+    def _disable(self, table: str, err: Exception) -> None:
+        logger.warning(f"数据表 {table} 创建分区失败，将不再按分区写入，err: {err}")
+        self._disabled.add(table)
+
+    def ensure_partitions(self, conn: Connection, alter_item: AlterItem) -> AlterItem:
+        """确保 alter_item 所在的分区已存在，并返回按分区写入的 alter_item
+
+        Args:
+            conn: psycopg connection，每条 DDL 都在各自的事务中执行
+            alter_item: 需要写入的 item
+
+        Returns:
+            1). 按分区写入的 alter_item，不需要或不能按分区写入时为原 alter_item
+        """
+        if (value := self.get_value(alter_item)) is None:
+            return alter_item
+
+        table = alter_item.table.name
+        if ddl := self.plan(alter_item, value):
+            with self._lock:
+                for name, sql in ddl:
+                    if name in self._created:
+                        continue
+                    try:
+                        with conn.transaction():
+                            conn.execute(sql)
+                            if name == table:
+                                row = conn.execute(
+                                    _COLUMN_TYPE_SQL.format("%s", "%s"),
+                                    (table, self.conf.column.lower()),
+                                ).fetchone()
+                                self._set_column_type(table, row and row[0])
+                    except Exception as e:
+                        self._disable(table, e)
+                        return alter_item
+                    self._created.add(name)
+        return self.apply(alter_item, value)
+
+
+class AsyncPostgresPartitioner(PostgresPartitioner):
+    """PostgresPartitioner 的 asyncio 版本，用于 AyuAsyncPostgresPipeline
+
+    只有在需要创建分区时才会从连接池中获取连接，同一个数据表的 DDL 由表级别的 asyncio.Lock 串行执行。
+    """
+
+    def __init__(self, conf: PartitionConf) -> None:
+        super().__init__(conf)
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _get_lock(self, table: str) -> asyncio.Lock:
+        if (lock := self._locks.get(table)) is None:
+            lock = self._locks[table] = asyncio.Lock()
+        return lock
+
+    async def ensure_partitions(  # type: ignore[override]
+        self, pool: PGPool | StatsPool, alter_item: AlterItem
+    ) -> AlterItem:
+        """确保 alter_item 所在的分区已存在，并返回按分区写入的 alter_item
+
+        Args:
+            pool: asyncpg pool
+            alter_item: 需要写入的 item
+
+        Returns:
+            1). 按分区写入的 alter_item，不需要或不能按分区写入时为原 alter_item
+        """
+        if (value := self.get_value(alter_item)) is None:
+            return alter_item
+
+        table = alter_item.table.name
+        if ddl := self.plan(alter_item, value):
+            async with self._get_lock(table), pool.acquire() as conn:
+                for name, sql in ddl:
+                    if name in self._created:
+                        continue
+                    try:
+                        await conn.execute(sql)
+                        if name == table:
+                            column_type = await conn.fetchval(
+                                _COLUMN_TYPE_SQL.format("$1", "$2"),
+                                table,
+                                self.conf.column.lower(),
+                            )
+                            self._set_column_type(table, column_type)
+                    except Exception as e:
+                        self._disable(table, e)
+                        return alter_item
+                    self._created.add(name)
+        return self.apply(alter_item, value)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import decimal
+from typing import TYPE_CHECKING, Any
+
+from ayugespidertools.config import logger
+
+__all__ = [
+    "AsyncPostgresSchemaCache",
+    "infer_column_type",
+]
+
+if TYPE_CHECKING:
+    from asyncpg.connection import Connection
+
+    from ayugespidertools.common.typevars import AlterItem
+
+DEFAULT_COLUMN_TYPE = "VARCHAR(255)"
+
+
+def infer_column_type(value: Any, column_type: str | None = None) -> str:
+    """根据字段值推断 postgresql 自动添加字段时的字段类型
+
+    asyncpg 写入时会严格校验参数类型，所以非字符串的字段不能像其它场景一样统一添加为 VARCHAR 类型。
+
+    Args:
+        value: 首次写入时的字段值
+        column_type: 指定的字段类型，比如 DataItem 中的 column_type，指定时直接使用
+
+    Returns:
+        1). 字段类型
+
+    Examples:
+        >>> infer_column_type(1)
+        'BIGINT'
+        >>> infer_column_type("abc")
+        'VARCHAR(255)'
+        >>> infer_column_type("a" * 1000)
+        'TEXT'
+        >>> infer_column_type({"a": 1})
+        'JSONB'
+        >>> infer_column_type("abc", "INT")
+        'INT'
+    """
+    if column_type:
+        return column_type
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "BIGINT"
+    if isinstance(value, float):
+        return "DOUBLE PRECISION"
+    if isinstance(value, decimal.Decimal):
+        return "NUMERIC"
+    if isinstance(value, datetime.datetime):
+        return "TIMESTAMPTZ" if value.tzinfo else "TIMESTAMP"
+    if isinstance(value, datetime.date):
+        return "DATE"
+    if isinstance(value, dict | list):
+        return "JSONB"
+    if isinstance(value, bytes | bytearray):
+        return "BYTEA"
+    if isinstance(value, str) and len(value) * 2 > 255:
+        return "TEXT"
+    return DEFAULT_COLUMN_TYPE
+
+
+def _split_table(table: str) -> tuple[str, str]:
+    """拆分 schema.table 形式的表名，未加双引号的标识符在 postgresql 中会转为小写"""
+    schema, _, name = table.rpartition(".")
+    return schema.lower(), name.lower()
+
+
+def _get_add_columns_sql(table: str, columns: list[str], alter_item: AlterItem) -> str:
+    """获取一次添加多个字段的 ALTER TABLE 语句及其字段注释
+
+    Args:
+        table: 数据表名
+        columns: 需要添加的字段
+        alter_item: 需要写入的 item，用于获取字段注释及推断字段类型
+
+    Returns:
+        1). ALTER TABLE 及 COMMENT ON COLUMN 语句
+    """
+    add_columns = []
+    for col in columns:
+        column_type = infer_column_type(
+            alter_item.new_item.get(col), alter_item.types_dic.get(col)
+        )
+        default = " DEFAULT ''" if column_type.upper().startswith("VARCHAR") else ""
+        add_columns.append(f"ADD COLUMN IF NOT EXISTS {col} {column_type}{default}")
+    comments = "".join(
+        f"COMMENT ON COLUMN {table}.{col} IS {alter_item.notes_dic.get(col, '')!r};"
+        for col in columns
+    )
+    return f"ALTER TABLE {table} {', '.join(add_columns)};{comments}"
+
+
+class AsyncPostgresSchemaCache:
+    """缓存 postgresql 数据表已有的字段，用于 AyuAsyncPostgresPipeline 在写入前一次性补全表结构
+
+    每个数据表只在首次写入时从 information_schema.columns 中加载一次字段信息，数据表不存在时会先创建，
+    item 中缺少的字段合并为一条 ALTER TABLE 语句添加。同一个数据表的 DDL 操作由表级别的 asyncio.Lock
+    串行执行，多个协程同时遇到同一个表结构问题时只有第一个协程会执行 DDL。
+    """
+
+    def __init__(self) -> None:
+        # 数据表 -> 已有字段（小写）
+        self._columns: dict[str, set[str]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        # 数据表每执行一次 DDL 加 1，用于判断报错后是否已被其它协程处理
+        self._versions: dict[str, int] = {}
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def _get_lock(self, table: str) -> asyncio.Lock:
+        if (lock := self._locks.get(table)) is None:
+            lock = self._locks[table] = asyncio.Lock()
+        return lock
+
+    async def ensure_columns(self, conn: Connection, alter_item: AlterItem) -> None:
+        """确保 alter_item 对应的数据表及字段都已存在
+
+        Args:
+            conn: asyncpg connection
+            alter_item: 需要写入的 item
+        """
+        cached = self._columns.get(alter_item.table.name)
+        if cached is not None and all(
+            col.lower() in cached for col in alter_item.new_item
+        ):
+            return
+
+        async with self._get_lock(alter_item.table.name):
+            await self._ensure_columns(conn, alter_item)
+
+    async def deal_postgres_err(
+        self, conn: Connection, err_msg: str, alter_item: AlterItem, version: int
+    ) -> None:
+        """处理写入时的表或字段缺失问题，处理后（或已被其它协程处理后）返回，由调用方重试写入
+
+        Args:
+            conn: asyncpg connection
+            err_msg: 写入时的报错内容
+            alter_item: 需要写入的 item
+            version: 写入前获取的数据表 DDL 版本
+
+        Raises:
+            Exception: 不是表或字段缺失的问题
+        """
+        if "does not exist" not in err_msg or "relation" not in err_msg:
+            raise Exception(f"POSTGRES OTHER ERROR: {err_msg}")
+
+        table = alter_item.table.name
+        async with self._get_lock(table):
+            if self.version(table) != version:
+                return
+
+            # 字段缓存已过期，比如数据表被删除或修改，重新加载后补全
+            self._columns.pop(table, None)
+            await self._ensure_columns(conn, alter_item)
+            self._bump_version(table)
+
+    async def _ensure_columns(self, conn: Connection, alter_item: AlterItem) -> None:
+        table = alter_item.table.name
+        if (cached := self._columns.get(table)) is None:
+            cached = await self._load_columns(conn, table)
+            if not cached:
+                sql = (
+                    f"CREATE TABLE IF NOT EXISTS {table} (id SERIAL NOT NULL PRIMARY KEY);"
+                    f"COMMENT ON TABLE {table} IS {alter_item.table.notes!r};"
+                    f"COMMENT ON COLUMN {table}.id IS 'id';"
+                )
+                if await self._exec_sql(conn, sql, f"创建表 {table} 失败"):
+                    logger.info(f"创建数据表 {alter_item.table.notes}: {table} 成功！")
+                    self._bump_version(table)
+                cached = await self._load_columns(conn, table)
+            self._columns[table] = cached
+
+        if missing := [col for col in alter_item.new_item if col.lower() not in cached]:
+            sql = _get_add_columns_sql(table, missing, alter_item)
+            if await self._exec_sql(
+                conn, sql, f"数据表 {table} 添加字段 {missing} 失败"
+            ):
+                logger.info(f"数据表 {table} 添加字段 {missing} 成功！")
+                cached.update(col.lower() for col in missing)
+                self._bump_version(table)
+            else:
+                self._columns.pop(table, None)
+
+    def _bump_version(self, table: str) -> None:
+        self._versions[table] = self.version(table) + 1
+
+    @staticmethod
+    async def _load_columns(conn: Connection, table: str) -> set[str]:
+        schema, name = _split_table(table)
+        sql = (
+            "select column_name from information_schema.columns"
+            " where table_schema = coalesce(nullif($1, ''), current_schema())"
+            " and table_name = $2;"
+        )
+        return {row[0].lower() for row in await conn.fetch(sql, schema, name)}
+
+    @staticmethod
+    async def _exec_sql(conn: Connection, sql: str, possible_err: str) -> bool:
+        try:
+            await conn.execute(sql)
+        except Exception as e:
+            logger.warning(
+                f"asyncio postgres exec sql err: {e!s}\npossible_err: {possible_err}"
+            )
+            return False
+        return True
@@ -269,6 +269,39 @@ class GenPostgresqlAsyncpg:
         sql = f"INSERT INTO {db_table} ({insert_cols}) VALUES ({placeholders}) {conflict_sql};"
         return sql, tuple(data.values())
 
+    @staticmethod
+    def copy_upsert_generate(
+        db_table: str,
+        staging_table: str,
+        keys: list[str],
+        conflict_cols: set[str],
+        update_cols: set[str] | None = None,
+    ) -> tuple[str, str]:
+        """生成 COPY 批量写入所需的 sql，与 upsert_generate 的冲突处理规则一致
+
+        Returns:
+            1). 创建临时表的 sql，临时表只包含 keys 字段且在事务提交时删除
+            2). 将临时表数据合并到 db_table 的 INSERT ... SELECT ... ON CONFLICT 语句
+        """
+        insert_cols = ", ".join(keys)
+        create_sql = (
+            f"CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS"
+            f" SELECT {insert_cols} FROM {db_table} WITH NO DATA;"
+        )
+        if update_cols:
+            update_set = ", ".join([f"{col} = EXCLUDED.{col}" for col in update_cols])
+            conflict_sql = (
+                f"ON CONFLICT ({', '.join(conflict_cols)}) DO UPDATE SET {update_set}"
+            )
+        else:
+            conflict_sql = f"ON CONFLICT ({', '.join(conflict_cols)}) DO NOTHING"
+
+        merge_sql = (
+            f"INSERT INTO {db_table} ({insert_cols})"
+            f" SELECT {insert_cols} FROM {staging_table} {conflict_sql};"
+        )
+        return create_sql, merge_sql
+
     @staticmethod
     def merge_generate(
         db_table: str,
@@ -94,6 +94,13 @@ class MysqlConf(NamedTuple):
     collate: str = "utf8mb4_general_ci"
     odku_enable: bool = False
     insert_ignore: bool = False
+    cp_min: int = 3
+    cp_max: int = 5
+    # aiomysql 连接池的配置，默认值与 aiomysql 一致，pool_timeout 为获取连接的超时时间
+    pool_min_size: int = 1
+    pool_max_size: int = 10
+    pool_recycle: int = -1
+    pool_timeout: float | None = None
 
     @property
     def insert_prefix(self) -> InsertPrefixStr:
@@ -118,6 +125,12 @@ class PostgreSQLConf(NamedTuple):
     password: str
     database: str | None = None
     charset: str = "UTF8"
+    # asyncpg 连接池的配置，默认值与 asyncpg 一致，pool_timeout 为获取连接的超时时间
+    pool_min_size: int = 10
+    pool_max_size: int = 10
+    pool_timeout: float | None = None
+    statement_cache_size: int = 100
+    max_inactive_lifetime: float = 300.0
 
 
 class ESConf(NamedTuple):
@@ -142,6 +155,10 @@ class OracleConf(NamedTuple):
     thick_lib_dir: bool | str = False
     disable_oob: bool = False
     authentication_mode: OracleAuthenticationModesStr = "DEFAULT"
+    # oracledb 异步连接池的配置，默认值与 oracledb 一致
+    pool_min: int = 1
+    pool_max: int = 2
+    pool_increment: int = 1
 
 
 class AiohttpConf(NamedTuple):
@@ -191,12 +208,49 @@ class AlterItem(NamedTuple):
     update_rule: dict[str, Any] = {}
     update_keys: set[str] = set()
     conflict_cols: set[str] = set()
+    types_dic: dict[str, str] = {}
 
     @property
     def _update_rule(self) -> dict[str, Any]:
         return self.update_rule or {}
 
 
+class BatchConf(NamedTuple):
+    """用于描述 pipelines 批量写入的配置
+
+    Attributes:
+        size: 每批最多缓存的条数，为 0 时不开启批量写入
+        max_bytes: 每批最多缓存的（估算）字节数
+        interval: 每批最长的缓存时间，单位为秒
+    """
+
+    size: int = 0
+    max_bytes: int = 4 * 1024 * 1024
+    interval: float = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+
+class PartitionConf(NamedTuple):
+    """用于描述 postgresql pipelines 按时间分区写入的配置
+
+    Attributes:
+        column: 分区字段，为空时不开启分区写入
+        interval: 每个分区的时间范围，可选 day 或 month
+        premake: 除当前分区外需要提前创建的分区数量
+    """
+
+    column: str = ""
+    interval: Literal["day", "month"] = "month"
+    premake: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.column)
+
+
 class MQConf(NamedTuple):
     host: str
     port: int
@@ -32,10 +32,13 @@ class DataItem(NamedTuple):
     Attributes:
         key_value: 参数值
         notes: 对参数的注释
+        column_type: 数据库字段类型，比如 BIGINT，MEDIUMTEXT，只在 mysql 场景自动添加字段时使用，
+            不设置时会根据参数值推断
     """
 
     key_value: Any
     notes: Any = ""
+    column_type: str | None = None
 
 
 class AyuItem(MutableMapping[str, Any]):
@@ -6,12 +6,14 @@ _MODULES = {
     "es.fantasy": ["AyuFtyESPipeline"],
     "mongo.asynced": ["AyuAsyncMongoPipeline"],
     "mongo.fantasy": ["AyuFtyMongoPipeline"],
+    "mongo.gridfs": ["AyuAsyncGridFSPipeline"],
     "mongo.twisted": ["AyuTwistedMongoPipeline"],
     "msgproducer.kafkapub": ["AyuKafkaPipeline"],
     "msgproducer.mqpub": ["AyuMQPipeline"],
     "msgproducer.mqasyncpub": ["AyuAsyncMQPipeline"],
     "mysql.asynced": ["AyuAsyncMysqlPipeline"],
     "mysql.fantasy": ["AyuFtyMysqlPipeline"],
+    "mysql.loadinfile": ["AyuLoadInfileMysqlPipeline"],
     "mysql.stats": ["AyuStatisticsMysqlPipeline"],
     "mysql.turbo": ["AyuTurboMysqlPipeline"],
     "mysql.twisted": ["AyuTwistedMysqlPipeline"],
@@ -3,12 +3,16 @@ from ayugespidertools.scraper.pipelines.es.asynced import AyuAsyncESPipeline
 from ayugespidertools.scraper.pipelines.es.fantasy import AyuFtyESPipeline
 from ayugespidertools.scraper.pipelines.mongo.asynced import AyuAsyncMongoPipeline
 from ayugespidertools.scraper.pipelines.mongo.fantasy import AyuFtyMongoPipeline
+from ayugespidertools.scraper.pipelines.mongo.gridfs import AyuAsyncGridFSPipeline
 from ayugespidertools.scraper.pipelines.mongo.twisted import AyuTwistedMongoPipeline
 from ayugespidertools.scraper.pipelines.msgproducer.kafkapub import AyuKafkaPipeline
 from ayugespidertools.scraper.pipelines.msgproducer.mqasyncpub import AyuAsyncMQPipeline
 from ayugespidertools.scraper.pipelines.msgproducer.mqpub import AyuMQPipeline
 from ayugespidertools.scraper.pipelines.mysql.asynced import AyuAsyncMysqlPipeline
 from ayugespidertools.scraper.pipelines.mysql.fantasy import AyuFtyMysqlPipeline
+from ayugespidertools.scraper.pipelines.mysql.loadinfile import (
+    AyuLoadInfileMysqlPipeline,
+)
 from ayugespidertools.scraper.pipelines.mysql.stats import AyuStatisticsMysqlPipeline
 from ayugespidertools.scraper.pipelines.mysql.turbo import AyuTurboMysqlPipeline
 from ayugespidertools.scraper.pipelines.mysql.twisted import AyuTwistedMysqlPipeline
@@ -25,6 +29,7 @@ from ayugespidertools.scraper.pipelines.postgres.twisted import (
 
 __all__ = [
     "AyuAsyncESPipeline",
+    "AyuAsyncGridFSPipeline",
     "AyuAsyncMQPipeline",
     "AyuAsyncMongoPipeline",
     "AyuAsyncMysqlPipeline",
@@ -38,6 +43,7 @@ __all__ = [
     "AyuFtyOraclePipeline",
     "AyuFtyPostgresPipeline",
     "AyuKafkaPipeline",
+    "AyuLoadInfileMysqlPipeline",
     "AyuMQPipeline",
     "AyuStatisticsMysqlPipeline",
     "AyuTurboMysqlPipeline",
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+from functools import partial
 from typing import TYPE_CHECKING, Any, cast
 
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.exceptions import NotConfigured
 from ayugespidertools.items import AyuItem
@@ -24,18 +27,31 @@ if TYPE_CHECKING:
     from scrapy.crawler import Crawler
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import ESConf
+    from ayugespidertools.common.typevars import BatchConf, ESConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
     DocumentType = type[Document] | type
 
 
 class AyuAsyncESPipeline:
+    """elasticsearch 异步存储 pipeline
+
+    配置 ES_BATCH_CONFIG 后 item 会按索引缓存，满足条数，字节数或时间阈值时使用一次 async_bulk 写入，最多
+    同时进行 ES_BULK_CONCURRENCY 个 bulk 请求；未配置时为逐条写入。
+    """
+
     es_conf: ESConf
     client: AsyncElasticsearch
     es_type: DocumentType
-    running_tasks: set
+    running_tasks: set[asyncio.Task]
     crawler: Crawler
+    slog: slogT
+    batch_conf: BatchConf
+    buffer: BatchBuffer[str, dict]
+    semaphore: asyncio.Semaphore
+    flush_task: asyncio.Task | None = None
+    flushing: asyncio.Future | None = None
+    failed_count: int
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -46,7 +62,9 @@ class AyuAsyncESPipeline:
     async def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "es_conf"), "未配置 elasticsearch 连接信息！"
+        self.slog = spider.slog
         self.running_tasks = set()
+        self.failed_count = 0
         self.es_conf = spider.es_conf
         _hosts_lst = self.es_conf.hosts.split(",")
         if any([self.es_conf.user is not None, self.es_conf.password is not None]):
@@ -63,6 +81,15 @@ class AyuAsyncESPipeline:
             ssl_assert_fingerprint=self.es_conf.ssl_assert_fingerprint,
         )
 
+        settings = self.crawler.settings
+        self.batch_conf = get_batch_conf(settings, "ES_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.semaphore = asyncio.Semaphore(
+                max(settings.getint("ES_BULK_CONCURRENCY", 2), 1)
+            )
+            self.flush_task = asyncio.create_task(self._flush_periodically())
+
     async def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
         insert_data = ReuseOperation.get_items_except_keys(
@@ -81,10 +108,16 @@ class AyuAsyncESPipeline:
             if self.es_conf.init:
                 self.es_type.init()
 
-        task = asyncio.create_task(self.insert_item(new_item, _index))
-        self.running_tasks.add(task)
-        await task
-        task.add_done_callback(lambda t: self.running_tasks.discard(t))
+        if not self.batch_conf.enabled:
+            task = asyncio.create_task(self.insert_item(new_item, _index))
+            self.running_tasks.add(task)
+            await task
+            task.add_done_callback(lambda t: self.running_tasks.discard(t))
+            return item
+
+        docs = self.buffer.add(_index, new_item, estimate_size(new_item))
+        if docs is not None:
+            await self.start_bulk(_index, docs)
         return item
 
     async def insert_item(self, new_item: dict, index: str) -> None:
@@ -96,5 +129,71 @@ class AyuAsyncESPipeline:
 
         await async_bulk(self.client, gendata())
 
+    async def bulk_insert(self, index: str, docs: list[dict]) -> None:
+        """使用一次 bulk 请求写入 docs，个别文档写入失败时只记录日志，不影响同一批的其它文档
+
+        Args:
+            index: 索引名
+            docs: 需要写入的文档
+        """
+        actions = ({"_index": index, "doc": doc} for doc in docs)
+        _, errors = await async_bulk(
+            self.client,
+            actions,
+            chunk_size=len(docs),
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        if errors:
+            self.failed_count += len(errors)
+            self.slog.error(
+                f"ES 批量写入 {len(errors)}/{len(docs)} 条数据失败 & Index: {index} & "
+                f"Error: {errors[0]}"
+            )
+
+    async def start_bulk(self, index: str, docs: list[dict]) -> None:
+        # 只在同时进行的 bulk 请求数已满时等待，写入结果在任务完成时处理
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self.bulk_insert(index, docs))
+        self.running_tasks.add(task)
+        task.add_done_callback(partial(self._task_done, index, len(docs)))
+
+    def _task_done(self, index: str, count: int, task: asyncio.Task) -> None:
+        self.running_tasks.discard(task)
+        self.semaphore.release()
+        if task.cancelled():
+            return
+        if err := task.exception():
+            self.failed_count += count
+            self.slog.error(f"Pipe Error: {err} & Index: {index} & Items: {count}")
+
+    async def flush_expired(self) -> None:
+        for index, docs in self.buffer.pop_expired():
+            await self.start_bulk(index, docs)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_conf.interval)
+            self.flushing = asyncio.ensure_future(self.flush_expired())
+            try:
+                # 关闭时取消此任务不会中断正在提交的写入，close_spider 会等待其完成
+                await asyncio.shield(self.flushing)
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+
     async def close_spider(self) -> None:
+        if self.flush_task:
+            self.flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.flush_task
+        if self.flushing:
+            with contextlib.suppress(Exception):
+                await self.flushing
+        if self.batch_conf.enabled:
+            for index, docs in self.buffer.pop_all():
+                await self.start_bulk(index, docs)
+        if self.running_tasks:
+            await asyncio.gather(*self.running_tasks, return_exceptions=True)
+        if self.failed_count:
+            self.slog.error(f"ES 批量写入共有 {self.failed_count} 条数据失败")
         await self.client.close()
@@ -1,8 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 from typing import TYPE_CHECKING, Any, cast
 
-from ayugespidertools.common.mongodbpipe import AsyncStorageHandler, store_process_async
+from pymongo.errors import BulkWriteError
+
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
+from ayugespidertools.common.mongodbpipe import (
+    AsyncMongoIndexCache,
+    AsyncStorageHandler,
+    get_bulk_write_errors,
+    get_write_operation,
+    store_process_async,
+)
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.typevars import PortalTag
 from ayugespidertools.utils.database import MongoDBAsyncPortal
@@ -11,9 +22,11 @@ __all__ = ["AyuAsyncMongoPipeline"]
 
 if TYPE_CHECKING:
     from motor.core import AgnosticClient, AgnosticDatabase
+    from pymongo import InsertOne, UpdateOne
     from scrapy.crawler import Crawler
     from typing_extensions import Self
 
+    from ayugespidertools.common.typevars import BatchConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
@@ -21,6 +34,13 @@ class AyuAsyncMongoPipeline:
     client: AgnosticClient
     db: AgnosticDatabase
     crawler: Crawler
+    slog: slogT
+    batch_conf: BatchConf
+    buffer: BatchBuffer[str, InsertOne | UpdateOne]
+    flush_task: asyncio.Task | None = None
+    flushing: asyncio.Future | None = None
+    index_cache: AsyncMongoIndexCache | None = None
+    index_tasks: set[asyncio.Task]
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -28,21 +48,117 @@ class AyuAsyncMongoPipeline:
         s.crawler = crawler
         return s
 
-    def open_spider(self) -> None:
+    async def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "mongodb_conf"), "未配置 MongoDB 连接信息！"
+        self.slog = spider.slog
         mongo_portal = MongoDBAsyncPortal(
             db_conf=spider.mongodb_conf, tag=PortalTag.LIBRARY
         )
         self.client = mongo_portal.get_client()
         self.db = mongo_portal.connect()
 
+        settings = self.crawler.settings
+        self.index_tasks = set()
+        if settings.getbool("MONGODB_AUTO_INDEX", False):
+            self.index_cache = AsyncMongoIndexCache(
+                unique=settings.getbool("MONGODB_AUTO_INDEX_UNIQUE", False)
+            )
+
+        # 开启批量写入时，item 按集合转换为 InsertOne 或 UpdateOne 缓存，达到阈值后使用 bulk_write 写入
+        self.batch_conf = get_batch_conf(settings, "MONGODB_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def bulk_write(
+        self, collection: str, operations: list[InsertOne | UpdateOne]
+    ) -> None:
+        """使用无序的 bulk_write 批量写入 operations
+
+        个别操作写入失败时不影响同一批的其它操作，只记录写入失败的操作及其在批次中的偏移量。
+
+        Args:
+            collection: 集合名
+            operations: 需要执行的写入操作
+        """
+        try:
+            await self.db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in get_bulk_write_errors(collection, e):
+                self.slog.error(error)
+        except Exception as e:
+            self.slog.error(
+                f"Pipe Error: {e} & Collection: {collection} & Items: {len(operations)}"
+            )
+
+    def ensure_index(self, item_dict: dict, collection: str) -> None:
+        """开启 MONGODB_AUTO_INDEX 时，在后台确保 _update_rule 的查询字段在集合中有可用的索引"""
+        if self.index_cache and (
+            keys := self.index_cache.pending(collection, item_dict)
+        ):
+            task = asyncio.create_task(
+                self.index_cache.ensure_index(self.db, collection, keys)
+            )
+            self.index_tasks.add(task)
+            task.add_done_callback(self.index_tasks.discard)
+
+    def buffer_item(
+        self, item_dict: dict
+    ) -> tuple[str, list[InsertOne | UpdateOne]] | None:
+        insert_data, collection = ReuseOperation.get_insert_data(item_dict)
+        self.ensure_index(item_dict, collection)
+        operations = self.buffer.add(
+            collection,
+            get_write_operation(item_dict, insert_data),
+            estimate_size(insert_data),
+        )
+        return None if operations is None else (collection, operations)
+
+    async def flush_expired(self) -> None:
+        for collection, operations in self.buffer.pop_expired():
+            await self.bulk_write(collection, operations)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_conf.interval)
+            self.flushing = asyncio.ensure_future(self.flush_expired())
+            try:
+                # 关闭时取消此任务不会中断正在进行的写入，close_spider 会等待其完成
+                await asyncio.shield(self.flushing)
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+            self.flushing = None
+
     async def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
-        await store_process_async(
-            item_dict=item_dict, db=self.db, handler=AsyncStorageHandler
-        )
+        if not self.batch_conf.enabled:
+            if self.index_cache and item_dict.get("_update_rule"):
+                _, collection = ReuseOperation.get_insert_data(item_dict)
+                self.ensure_index(item_dict, collection)
+            await store_process_async(
+                item_dict=item_dict, db=self.db, handler=AsyncStorageHandler
+            )
+            return item
+
+        if group := self.buffer_item(item_dict):
+            await self.bulk_write(*group)
         return item
 
-    def close_spider(self) -> None:
+    async def close_spider(self) -> None:
+        if self.flush_task:
+            self.flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.flush_task
+        if self.flushing:
+            # flush_expired 已从缓存中取出的分组不在 pop_all 中，需要等待其写入完成
+            try:
+                await self.flushing
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+        if self.batch_conf.enabled:
+            for collection, operations in self.buffer.pop_all():
+                await self.bulk_write(collection, operations)
+        if self.index_tasks:
+            await asyncio.gather(*self.index_tasks)
         self.client.close()
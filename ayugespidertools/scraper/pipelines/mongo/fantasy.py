@@ -2,7 +2,15 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any, cast
 
-from ayugespidertools.common.mongodbpipe import SyncStorageHandler, store_process
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
+from twisted.internet.defer import DeferredList
+
+from ayugespidertools.common.mongodbpipe import (
+    MongoIndexCache,
+    SyncStorageHandler,
+    store_process,
+)
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.typevars import PortalTag
 from ayugespidertools.utils.database import MongoDBPortal
@@ -13,6 +21,7 @@ if TYPE_CHECKING:
     import pymongo
     from pymongo import database
     from scrapy.crawler import Crawler
+    from twisted.internet.defer import Deferred
     from typing_extensions import Self
 
     from ayugespidertools.spiders import AyuSpider
@@ -22,6 +31,8 @@ class AyuFtyMongoPipeline:
     client: pymongo.MongoClient
     db: database.Database
     crawler: Crawler
+    index_cache: MongoIndexCache | None = None
+    index_queries: set[Deferred]
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -35,11 +46,52 @@ class AyuFtyMongoPipeline:
         mongo_portal = MongoDBPortal(db_conf=spider.mongodb_conf, tag=PortalTag.LIBRARY)
         self.client = mongo_portal.get_client()
         self.db = mongo_portal.connect()
+        self.index_queries = set()
+        if self.crawler.settings.getbool("MONGODB_AUTO_INDEX", False):
+            self.index_cache = MongoIndexCache(
+                unique=self.crawler.settings.getbool("MONGODB_AUTO_INDEX_UNIQUE", False)
+            )
 
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
+        self.ensure_index_in_thread(item_dict)
         store_process(item_dict=item_dict, db=self.db, handler=SyncStorageHandler)
         return item
 
-    def close_spider(self) -> None:
+    def _pending_index(
+        self, item_dict: dict, collection: str | None = None
+    ) -> tuple[str, list[str]] | None:
+        """获取 item 需要确保索引的集合及查询字段，未开启 MONGODB_AUTO_INDEX 或不需要处理时返回 None"""
+        if not self.index_cache or not item_dict.get("_update_rule"):
+            return None
+
+        if collection is None:
+            _, collection = ReuseOperation.get_insert_data(item_dict)
+        if keys := self.index_cache.pending(collection, item_dict):
+            return collection, keys
+        return None
+
+    def ensure_index(self, item_dict: dict, collection: str | None = None) -> None:
+        """开启 MONGODB_AUTO_INDEX 时，在当前线程中确保 _update_rule 的查询字段在集合中有可用的索引"""
+        if pending := self._pending_index(item_dict, collection):
+            cast("MongoIndexCache", self.index_cache).ensure_index(self.db, *pending)
+
+    def ensure_index_in_thread(self, item_dict: dict) -> None:
+        """与 ensure_index 相同，但在 reactor 线程池中创建索引，大集合创建索引耗时较长时不会阻塞 reactor"""
+        if pending := self._pending_index(item_dict):
+            d = threads.deferToThread(
+                cast("MongoIndexCache", self.index_cache).ensure_index,
+                self.db,
+                *pending,
+            )
+            self.index_queries.add(d)
+            d.addBoth(self._untrack_index, d)
+
+    def _untrack_index(self, result: Any, d: Deferred) -> Any:
+        self.index_queries.discard(d)
+        return result
+
+    async def close_spider(self) -> None:
+        if self.index_queries:
+            await maybe_deferred_to_future(DeferredList(list(self.index_queries)))
         self.client.close()
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, cast
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.typevars import PortalTag
+from ayugespidertools.items import DataItem
+from ayugespidertools.scraper.pipelines.oss.ali import files_download_by_scrapy
+from ayugespidertools.utils.database import MongoDBAsyncPortal
+
+__all__ = ["AyuAsyncGridFSPipeline"]
+
+if TYPE_CHECKING:
+    from bson import ObjectId
+    from motor.core import AgnosticClient, AgnosticCollection, AgnosticDatabase
+    from scrapy.crawler import Crawler
+    from scrapy.http.response import Response
+    from typing_extensions import Self
+
+    from ayugespidertools.common.typevars import AlterItem, slogT
+    from ayugespidertools.spiders import AyuSpider
+
+
+class AyuAsyncGridFSPipeline:
+    """将 item 中 _file_url 结尾字段的文件下载后上传至 MongoDB 的 GridFS 存储桶
+
+    文件按 sha256 去重：先查询进程内的 LRU 缓存，未命中时再根据 files 集合中 metadata.sha256 的唯一索引
+    查询，都不存在时才以 chunk_size 分块流式写入存储桶。同一内容的文件同时上传时只会上传一次，上传后直接
+    使用写入时的文件 id，不需要再次读取文件信息。文件 id 会添加至 item 的 {key}_gridfs 字段中。
+    """
+
+    client: AgnosticClient
+    db: AgnosticDatabase
+    bucket: AsyncIOMotorGridFSBucket
+    files: AgnosticCollection
+    chunks: AgnosticCollection
+    chunk_size: int
+    cache_size: int
+    cache: OrderedDict[str, ObjectId]
+    uploading: dict[str, asyncio.Future]
+    slog: slogT
+    crawler: Crawler
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        s = cls()
+        s.crawler = crawler
+        return s
+
+    async def open_spider(self) -> None:
+        spider = cast("AyuSpider", self.crawler.spider)
+        assert hasattr(spider, "mongodb_conf"), "未配置 MongoDB 连接信息！"
+        self.slog = spider.slog
+        mongo_portal = MongoDBAsyncPortal(
+            db_conf=spider.mongodb_conf, tag=PortalTag.LIBRARY
+        )
+        self.client = mongo_portal.get_client()
+        self.db = mongo_portal.connect()
+
+        settings = self.crawler.settings
+        bucket_name = settings.get("MONGODB_GRIDFS_BUCKET", "fs")
+        self.chunk_size = settings.getint("MONGODB_GRIDFS_CHUNK_SIZE", 255 * 1024)
+        self.cache_size = settings.getint("MONGODB_GRIDFS_CACHE_SIZE", 10000)
+        self.bucket = AsyncIOMotorGridFSBucket(
+            self.db, bucket_name=bucket_name, chunk_size_bytes=self.chunk_size
+        )
+        self.files = self.db[f"{bucket_name}.files"]
+        self.chunks = self.db[f"{bucket_name}.chunks"]
+        self.cache = OrderedDict()
+        self.uploading = {}
+        await self.files.create_index("metadata.sha256", unique=True, sparse=True)
+
+    def _get_cache(self, digest: str) -> ObjectId | None:
+        if (file_id := self.cache.get(digest)) is not None:
+            self.cache.move_to_end(digest)
+        return file_id
+
+    def _set_cache(self, digest: str, file_id: ObjectId) -> None:
+        self.cache[digest] = file_id
+        self.cache.move_to_end(digest)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _find_file_id(self, digest: str) -> ObjectId | None:
+        if doc := await self.files.find_one({"metadata.sha256": digest}, {"_id": 1}):
+            return doc["_id"]
+        return None
+
+    async def _upload(self, response: Response, filename: str, digest: str) -> ObjectId:
+        """以 chunk_size 分块将文件流式写入存储桶，已有相同内容的文件时返回其 id
+
+        Args:
+            response: 文件的下载响应
+            filename: 文件名
+            digest: 文件内容的 sha256
+
+        Returns:
+            1). 文件在 GridFS 中的 id
+        """
+        if (file_id := await self._find_file_id(digest)) is not None:
+            return file_id
+
+        content_type = response.headers.get("Content-Type", b"").decode()
+        grid_in = self.bucket.open_upload_stream(
+            filename,
+            metadata={
+                "sha256": digest,
+                "url": response.url,
+                "contentType": content_type,
+            },
+        )
+        body = memoryview(response.body)
+        try:
+            for start in range(0, len(body), self.chunk_size):
+                await grid_in.write(body[start : start + self.chunk_size])
+            await grid_in.close()
+        except DuplicateKeyError:
+            # 其它进程已上传相同内容的文件，删除本次写入的分块后使用已有的文件
+            await self.chunks.delete_many({"files_id": grid_in._id})
+            if (file_id := await self._find_file_id(digest)) is not None:
+                return file_id
+            raise
+        except BaseException:
+            # 包括上传任务被取消的情况，删除已写入的分块
+            await grid_in.abort()
+            raise
+        return grid_in._id
+
+    async def upload_file(self, response: Response, filename: str) -> ObjectId:
+        """上传文件并返回其在 GridFS 中的 id，相同内容的文件只会上传一次
+
+        Args:
+            response: 文件的下载响应
+            filename: 文件名
+
+        Returns:
+            1). 文件在 GridFS 中的 id
+        """
+        digest = hashlib.sha256(response.body).hexdigest()
+        if (file_id := self._get_cache(digest)) is not None:
+            return file_id
+
+        # 相同内容的文件正在上传时，等待其完成即可
+        if (future := self.uploading.get(digest)) is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 只有负责上传的任务被取消时才由当前协程重新上传，当前协程被取消时直接抛出
+                if not future.cancelled():
+                    raise
+                return await self.upload_file(response, filename)
+
+        future = self.uploading[digest] = asyncio.get_running_loop().create_future()
+        try:
+            file_id = await self._upload(response, filename, digest)
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved" 的警告
+            future.exception()
+            raise
+        else:
+            self._set_cache(digest, file_id)
+            future.set_result(file_id)
+            return file_id
+        finally:
+            del self.uploading[digest]
+            # 上传任务被取消（CancelledError 不是 Exception）时也要通知等待者，避免其一直阻塞
+            if not future.done():
+                future.cancel()
+
+    async def _upload_and_add_field(
+        self, alter_item: AlterItem, item: Any, spider: AyuSpider
+    ) -> None:
+        if not (new_item := alter_item.new_item):
+            return
+
+        file_url_keys = {
+            key: url for key, url in new_item.items() if key.endswith("_file_url")
+        }
+        _is_namedtuple = alter_item.is_namedtuple
+        for key, url in file_url_keys.items():
+            if not all([isinstance(url, str), url]):
+                continue
+
+            r, filename = await files_download_by_scrapy(spider, url)
+            try:
+                file_id = str(await self.upload_file(r, filename))
+            except Exception as e:
+                self.slog.error(f"GridFS 上传文件失败: {e} & Url: {url}")
+                continue
+
+            if not _is_namedtuple:
+                item[f"{key}_gridfs"] = file_id
+            else:
+                item[f"{key}_gridfs"] = DataItem(
+                    key_value=file_id, notes=f"{key} 对应的 GridFS 文件 id"
+                )
+
+    async def process_item(self, item: Any) -> Any:
+        item_dict = ReuseOperation.item_to_dict(item)
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        spider = cast("AyuSpider", self.crawler.spider)
+        await self._upload_and_add_field(alter_item, item, spider)
+        return item
+
+    def close_spider(self) -> None:
+        self.client.close()
@@ -1,20 +1,158 @@
+from __future__ import annotations
+
 import asyncio
-from typing import Any
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, cast
+
+from pymongo.errors import BulkWriteError
 
-from ayugespidertools.common.mongodbpipe import SyncStorageHandler, store_process
+from ayugespidertools.common.batch import estimate_size, get_batch_conf
+from ayugespidertools.common.mongodbpipe import (
+    SyncStorageHandler,
+    get_bulk_write_errors,
+    get_write_operation,
+    store_process,
+)
 from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.typevars import BatchConf
 from ayugespidertools.scraper.pipelines.mongo.fantasy import AyuFtyMongoPipeline
 
 __all__ = [
     "AyuTwistedMongoPipeline",
 ]
 
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from pymongo import InsertOne, UpdateOne
+
+    from ayugespidertools.common.typevars import slogT
+    from ayugespidertools.spiders import AyuSpider
+
+# 通知写入线程退出
+_STOP = object()
+
 
 class AyuTwistedMongoPipeline(AyuFtyMongoPipeline):
+    """使用独立线程池批量写入的 MongoDB pipeline
+
+    item 会放入写入队列，由 MONGODB_WRITER_THREADS 个写入线程取出，每个线程按 MONGODB_BATCH_CONFIG 的
+    阈值攒批后按集合使用无序的 bulk_write 写入；未配置 MONGODB_BATCH_CONFIG 时只合并队列中已有的 item，
+    不会额外等待。队列中未写入的 item 超过 MONGODB_WRITER_QUEUE_SIZE 时，process_item 会等待写入线程。
+    """
+
+    slog: slogT
+    batch_conf: BatchConf
+    write_queue: queue.SimpleQueue
+    slots: asyncio.Semaphore
+    executor: ThreadPoolExecutor
+    workers: list[Future]
+    loop: asyncio.AbstractEventLoop
+
+    async def open_spider(self) -> None:  # type: ignore[override]
+        super().open_spider()
+        spider = cast("AyuSpider", self.crawler.spider)
+        self.slog = spider.slog
+        settings = self.crawler.settings
+        threads = settings.getint("MONGODB_WRITER_THREADS", 4)
+        self.batch_conf = get_batch_conf(settings, "MONGODB_BATCH_CONFIG")
+        if not self.batch_conf.enabled:
+            self.batch_conf = BatchConf(size=100, interval=0)
+
+        self.loop = asyncio.get_running_loop()
+        self.write_queue = queue.SimpleQueue()
+        self.slots = asyncio.Semaphore(
+            settings.getint("MONGODB_WRITER_QUEUE_SIZE", 1000)
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="AyuTwistedMongoPipeline"
+        )
+        self.workers = [self.executor.submit(self._write_loop) for _ in range(threads)]
+
     async def process_item(self, item: Any) -> Any:
-        await asyncio.to_thread(self.db_insert, item)
+        # 写入队列已满时等待写入线程，避免 item 在内存中无限堆积
+        await self.slots.acquire()
+        self.write_queue.put(ReuseOperation.item_to_dict(item))
         return item
 
     def db_insert(self, item: Any) -> None:
         item_dict = ReuseOperation.item_to_dict(item)
         store_process(item_dict=item_dict, db=self.db, handler=SyncStorageHandler)
+
+    def _next_batch(self) -> tuple[list[dict], bool]:
+        """从写入队列中取出一批 item，满足条数，字节数或时间阈值时返回
+
+        Returns:
+            1). 取出的 item
+            2). 是否需要退出写入线程
+        """
+        first = self.write_queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch, size = [first], estimate_size(first)
+        deadline = time.monotonic() + self.batch_conf.interval
+        while len(batch) < self.batch_conf.size and size < self.batch_conf.max_bytes:
+            try:
+                timeout = deadline - time.monotonic()
+                item_dict = (
+                    self.write_queue.get(timeout=timeout)
+                    if timeout > 0
+                    else self.write_queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item_dict is _STOP:
+                return batch, True
+            batch.append(item_dict)
+            size += estimate_size(item_dict)
+        return batch, False
+
+    def _write_loop(self) -> None:
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                self.slog.error(f"批量插入数据失败: {e}, items: {len(batch)}")
+            finally:
+                for _ in batch:
+                    self.loop.call_soon_threadsafe(self.slots.release)
+
+    def write_batch(self, item_dicts: list[dict]) -> None:
+        """将一批 item 按集合分组，每个集合使用一次无序的 bulk_write 写入
+
+        Args:
+            item_dicts: 写入线程取出的一批 item
+        """
+        groups: dict[str, list[InsertOne | UpdateOne]] = {}
+        for item_dict in item_dicts:
+            insert_data, collection = ReuseOperation.get_insert_data(item_dict)
+            self.ensure_index(item_dict, collection)
+            groups.setdefault(collection, []).append(
+                get_write_operation(item_dict, insert_data)
+            )
+
+        for collection, operations in groups.items():
+            try:
+                SyncStorageHandler.store_many(self.db, collection, operations)
+            except BulkWriteError as e:
+                for error in get_bulk_write_errors(collection, e):
+                    self.slog.error(error)
+            except Exception as e:
+                self.slog.error(
+                    f"Pipe Error: {e} & Collection: {collection} & "
+                    f"Items: {len(operations)}"
+                )
+
+    async def close_spider(self) -> None:
+        for _ in self.workers:
+            self.write_queue.put(_STOP)
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in self.workers))
+        self.executor.shutdown()
+        await super().close_spider()
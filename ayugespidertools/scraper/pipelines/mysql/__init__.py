@@ -4,10 +4,18 @@ import warnings
 from typing import TYPE_CHECKING, Any, cast
 
 import pymysql
+from twisted.internet import task
 
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
 from ayugespidertools.common.expend import MysqlPipeEnhanceMixin
 from ayugespidertools.common.multiplexing import ReuseOperation
-from ayugespidertools.common.mysqlerrhandle import Synchronize, deal_mysql_err
+from ayugespidertools.common.mysqlerrhandle import (
+    Synchronize,
+    deal_mysql_err,
+    get_column_types,
+    is_schema_err,
+)
+from ayugespidertools.common.mysqlschema import MysqlSchemaCache
 
 # 将 pymysql 中 Data truncated for column 警告类型置为 Error，其他警告忽略
 warnings.filterwarnings(
@@ -22,9 +30,10 @@ if TYPE_CHECKING:
     from pymysql.connections import Connection
     from pymysql.cursors import Cursor
     from scrapy.crawler import Crawler
+    from twisted.python.failure import Failure
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import AlterItem, MysqlConf, slogT
+    from ayugespidertools.common.typevars import AlterItem, BatchConf, MysqlConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
@@ -34,6 +43,10 @@ class AyuMysqlPipeline(MysqlPipeEnhanceMixin):
     slog: slogT
     cursor: Cursor
     crawler: Crawler
+    schema_cache: MysqlSchemaCache
+    batch_conf: BatchConf
+    buffer: BatchBuffer[tuple, AlterItem]
+    flush_loop: task.LoopingCall | None = None
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -48,41 +61,62 @@ class AyuMysqlPipeline(MysqlPipeEnhanceMixin):
         self.mysql_conf = spider.mysql_conf
         self.conn = self._connect(self.mysql_conf)
         self.cursor = self.conn.cursor()
+        self.schema_cache = MysqlSchemaCache(self.mysql_conf, Synchronize())
+        self._setup_batch()
+
+    def _setup_batch(self) -> None:
+        """根据 MYSQL_BATCH_CONFIG 配置来开启批量写入模式"""
+        self.batch_conf = get_batch_conf(self.crawler.settings, "MYSQL_BATCH_CONFIG")
+        if not self.batch_conf.enabled:
+            return
+
+        self.buffer = BatchBuffer(self.batch_conf)
+        self.flush_loop = task.LoopingCall(self.flush_expired)
+        self.flush_loop.start(self.batch_conf.interval, now=False).addErrback(
+            self._flush_loop_err
+        )
+
+    def _flush_loop_err(self, failure: Failure) -> None:
+        self.slog.error(f"Mysql 定时批量写入失败: {failure}")
 
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
         alter_item = ReuseOperation.reshape_item(item_dict)
-        self.insert_item(alter_item)
+        if self.batch_conf.enabled:
+            self.buffer_item(alter_item)
+        else:
+            self._count_rows(alter_item.table.name, self.insert_item(alter_item))
         return item
 
-    def insert_item(self, alter_item: AlterItem) -> None:
+    def insert_item(self, alter_item: AlterItem) -> int:
+        """写入单条 item，写入条数由调用方在提交后统计
+
+        Args:
+            alter_item: 需要写入的 item
+
+        Returns:
+            1). 写入成功的条数
+        """
         if not (new_item := alter_item.new_item):
-            return None
+            return 0
 
         _table_name = alter_item.table.name
         _table_notes = alter_item.table.notes
         note_dic = alter_item.notes_dic
-        duplicate = None
-        if update_keys := alter_item.update_keys:
-            duplicate = ReuseOperation.get_items_by_keys(
-                data=new_item, keys=update_keys
-            )
-        sql, args = self._get_sql_by_item(
-            table=_table_name,
-            item=new_item,
-            odku_enable=self.mysql_conf.odku_enable,
-            insert_prefix=self.mysql_conf.insert_prefix,
-            duplicate=duplicate,
-        )
+        sql, args = self._get_sql_by_alter_item(alter_item, self.mysql_conf)
 
         try:
+            self.schema_cache.ensure_columns(self.cursor, alter_item)
             self.cursor.execute(sql, args)
             self.conn.commit()
+            return 1
         except Exception as e:
             self.slog.warning(
                 f"Pipe Warn: {e} & Table: {_table_name} & Item: {new_item}"
             )
             self.conn.rollback()
+            if is_schema_err(str(e)):
+                self.schema_cache.invalidate(_table_name)
             deal_mysql_err(
                 Synchronize(),
                 err_msg=str(e),
@@ -92,8 +126,99 @@ class AyuMysqlPipeline(MysqlPipeEnhanceMixin):
                 table=_table_name,
                 table_notes=_table_notes,
                 note_dic=note_dic,
+                column_dic=get_column_types(alter_item),
             )
             return self.insert_item(alter_item)
 
+    def buffer_item(self, alter_item: AlterItem) -> None:
+        """将 item 按数据表及字段分组缓存，分组满足阈值时批量写入"""
+        if not (new_item := alter_item.new_item):
+            return
+
+        key = (
+            alter_item.table.name,
+            tuple(new_item),
+            tuple(sorted(alter_item.update_keys)),
+        )
+        if alter_items := self.buffer.add(key, alter_item, estimate_size(new_item)):
+            self.write_group(alter_items)
+
+    def flush_expired(self) -> None:
+        for _, alter_items in self.buffer.pop_expired():
+            # 在 LoopingCall 中执行，异常需要在此处理，否则定时写入会停止
+            try:
+                self.write_group(alter_items)
+            except Exception as e:
+                self.slog.error(
+                    f"Mysql 定时批量写入失败: {e} & Table: {alter_items[0].table.name}"
+                    f" & Items: {len(alter_items)}"
+                )
+
+    def write_group(self, alter_items: list[AlterItem]) -> None:
+        """写入缓存中满足阈值的一组 item，子类可重写此方法来改变其写入方式"""
+        self._count_rows(alter_items[0].table.name, self.insert_items(alter_items))
+
+    def insert_items(self, alter_items: list[AlterItem]) -> int:
+        """批量写入数据表及字段都相同的一组 item，整批只提交一次
+
+        Args:
+            alter_items: 需要写入的同一分组的 item
+
+        Returns:
+            1). 写入成功的条数
+        """
+        first_item = alter_items[0]
+        _table_name = first_item.table.name
+        sql_args = [
+            self._get_sql_by_alter_item(alter_item, self.mysql_conf)
+            for alter_item in alter_items
+        ]
+        sql = sql_args[0][0]
+
+        try:
+            self.schema_cache.ensure_columns(self.cursor, first_item)
+            self.cursor.executemany(sql, [args for _, args in sql_args])
+            self.conn.commit()
+            return len(alter_items)
+        except Exception as e:
+            self.slog.warning(
+                f"Pipe Warn: {e} & Table: {_table_name} & Items: {len(alter_items)}"
+            )
+            self.conn.rollback()
+            if is_schema_err(str(e)):
+                self.schema_cache.invalidate(_table_name)
+            try:
+                deal_mysql_err(
+                    Synchronize(),
+                    err_msg=str(e),
+                    conn=self.conn,
+                    cursor=self.cursor,
+                    mysql_conf=self.mysql_conf,
+                    table=_table_name,
+                    table_notes=first_item.table.notes,
+                    note_dic=first_item.notes_dic,
+                    column_dic=get_column_types(first_item),
+                )
+            except Exception:
+                # 不是表结构问题时，改为逐条写入，避免个别数据导致整批数据写入失败
+                return self._insert_one_by_one(alter_items)
+            return self.insert_items(alter_items)
+
+    def _insert_one_by_one(self, alter_items: list[AlterItem]) -> int:
+        written = 0
+        for alter_item in alter_items:
+            try:
+                written += self.insert_item(alter_item)
+            except Exception as e:
+                self.slog.error(
+                    f"Pipe Error: {e} & Table: {alter_item.table.name} & Item: {alter_item.new_item}"
+                )
+        return written
+
     def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for _, alter_items in self.buffer.pop_all():
+                self.write_group(alter_items)
         self.conn.close()
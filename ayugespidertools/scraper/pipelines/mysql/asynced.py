@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import asyncio
+from functools import partial
 from typing import TYPE_CHECKING, Any, cast
 
 from ayugespidertools.common.expend import MysqlPipeEnhanceMixin
 from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.mysqlschema import AsyncMysqlSchemaCache
 from ayugespidertools.common.typevars import PortalTag
 from ayugespidertools.utils.database import MysqlAsyncPortal
 
@@ -17,15 +19,22 @@ if TYPE_CHECKING:
     from scrapy.crawler import Crawler
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import MysqlConf
+    from ayugespidertools.common.typevars import MysqlConf, slogT
     from ayugespidertools.spiders import AyuSpider
+    from ayugespidertools.utils.database import StatsPool
 
 
 class AyuAsyncMysqlPipeline(MysqlPipeEnhanceMixin):
     mysql_conf: MysqlConf
-    pool: aiomysql.Pool
-    running_tasks: set
+    pool: aiomysql.Pool | StatsPool
+    slog: slogT
+    running_tasks: set[asyncio.Task]
+    concurrency: int
+    semaphore: asyncio.Semaphore
+    failed_count: int
     crawler: Crawler
+    schema_cache: AsyncMysqlSchemaCache
+    max_retry_times: int = 5
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -36,39 +45,71 @@ class AyuAsyncMysqlPipeline(MysqlPipeEnhanceMixin):
     async def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "mysql_conf"), "未配置 Mysql 连接信息！"
+        self.slog = spider.slog
         self.running_tasks = set()
+        self.failed_count = 0
         self.mysql_conf = spider.mysql_conf
+        self._connect(self.mysql_conf).close()
+        self.schema_cache = AsyncMysqlSchemaCache(self.mysql_conf)
         self.pool = await MysqlAsyncPortal(
-            db_conf=self.mysql_conf, tag=PortalTag.LIBRARY
+            db_conf=self.mysql_conf, tag=PortalTag.LIBRARY, stats=self.crawler.stats
         ).connect()
 
+        # 同时写入的最大任务数，不能超过连接池的大小；为 0 时使用连接池的大小
+        concurrency = self.crawler.settings.getint("MYSQL_ASYNC_CONCURRENCY", 1)
+        self.concurrency = min(concurrency or self.pool.maxsize, self.pool.maxsize)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
     async def insert_item(self, item_dict: dict) -> None:
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not alter_item.new_item:
+            return
+
+        table = alter_item.table.name
+        sql, args = self._get_sql_by_alter_item(alter_item, self.mysql_conf)
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                alter_item = ReuseOperation.reshape_item(item_dict)
-                insert_data = alter_item.new_item
-                duplicate = None
-                if update_keys := alter_item.update_keys:
-                    duplicate = ReuseOperation.get_items_by_keys(
-                        data=insert_data, keys=update_keys
-                    )
-                sql, args = self._get_sql_by_item(
-                    table=alter_item.table.name,
-                    item=insert_data,
-                    odku_enable=self.mysql_conf.odku_enable,
-                    insert_prefix=self.mysql_conf.insert_prefix,
-                    duplicate=duplicate,
-                )
-                await cursor.execute(sql, args)
+                for _ in range(self.max_retry_times):
+                    version = self.schema_cache.version(table)
+                    try:
+                        await self.schema_cache.ensure_columns(cursor, alter_item)
+                        await cursor.execute(sql, args)
+                    except Exception as e:
+                        self.slog.warning(f"Pipe Warn: {e} & Table: {table}")
+                        await self.schema_cache.deal_mysql_err(
+                            cursor, str(e), alter_item, version
+                        )
+                    else:
+                        self._count_rows(table)
+                        return
+                raise Exception(f"Mysql 写入重试 {self.max_retry_times} 次后仍然失败")
 
     async def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
+        if self.concurrency <= 1:
+            await self.insert_item(item_dict)
+            return item
+
+        # 只在同时写入的任务数已满时等待，写入结果在任务完成时处理
+        await self.semaphore.acquire()
         task = asyncio.create_task(self.insert_item(item_dict))
         self.running_tasks.add(task)
-        await task
-        task.add_done_callback(lambda t: self.running_tasks.discard(t))
+        task.add_done_callback(partial(self._task_done, item_dict))
         return item
 
+    def _task_done(self, item_dict: dict, task: asyncio.Task) -> None:
+        self.running_tasks.discard(task)
+        self.semaphore.release()
+        if task.cancelled():
+            return
+        if err := task.exception():
+            self.failed_count += 1
+            self.slog.error(f"Pipe Error: {err} & Item: {item_dict}")
+
     async def close_spider(self) -> None:
+        if self.running_tasks:
+            await asyncio.gather(*self.running_tasks, return_exceptions=True)
+        if self.failed_count:
+            self.slog.error(f"Mysql 异步写入共有 {self.failed_count} 条数据失败")
         self.pool.close()
         await self.pool.wait_closed()
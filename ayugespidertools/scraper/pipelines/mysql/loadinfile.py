@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, cast
+
+import pymysql
+from pymysql.charset import charset_by_name
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import task, threads
+from twisted.internet.defer import DeferredList
+from twisted.python.threadpool import ThreadPool
+
+from ayugespidertools.common.batch import get_batch_conf
+from ayugespidertools.common.jsoncodec import json_dumps
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.mysqlerrhandle import Synchronize
+from ayugespidertools.common.mysqlschema import MysqlSchemaCache
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.scraper.pipelines.mysql import AyuMysqlPipeline
+
+__all__ = [
+    "AyuLoadInfileMysqlPipeline",
+]
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymysql.connections import Connection
+    from pymysql.cursors import Cursor
+    from scrapy.crawler import Crawler
+    from twisted.internet.defer import Deferred
+    from twisted.python.failure import Failure
+    from typing_extensions import Self
+
+    from ayugespidertools.common.typevars import AlterItem, MysqlConf, slogT
+    from ayugespidertools.spiders import AyuSpider
+
+# LOAD DATA 默认格式（FIELDS TERMINATED BY '\t' ESCAPED BY '\\' LINES TERMINATED BY '\n'）
+# 中需要转义的字符
+_ESCAPE_TABLE = {
+    ord("\\"): "\\\\",
+    ord("\t"): "\\t",
+    ord("\n"): "\\n",
+    ord("\r"): "\\r",
+    ord("\0"): "\\0",
+}
+_BYTES_ESCAPES = [(bytes([k]), v.encode()) for k, v in _ESCAPE_TABLE.items()]
+# 导入有警告时最多记录的警告条数
+_MAX_LOGGED_WARNINGS = 10
+
+
+def _escape_field(value: Any, encoding: str) -> bytes:
+    r"""将字段值转换为 LOAD DATA 可识别的 TSV 字段内容
+
+    Args:
+        value: 字段值
+        encoding: 数据写入文件时的编码
+
+    Returns:
+        1). 转义后的字段内容，None 为 \\N，dict 和 list 为 json
+
+    Examples:
+        >>> _escape_field("a\tb\\c", "utf8")
+        b'a\\tb\\\\c'
+        >>> _escape_field({"a": [1, "中"]}, "utf8").decode()
+        '{"a":[1,"中"]}'
+    """
+    if value is None:
+        return b"\\N"
+    if isinstance(value, bytes | bytearray):
+        value = bytes(value)
+        # 反斜杠需要最先转义，避免重复转义其它字符的转义结果
+        for char, escaped in _BYTES_ESCAPES:
+            value = value.replace(char, escaped)
+        return value
+    if isinstance(value, bool):
+        return b"1" if value else b"0"
+    if isinstance(value, dict | list):
+        value = json_dumps(value).decode()
+    return str(value).translate(_ESCAPE_TABLE).encode(encoding)
+
+
+class _InfileChunk:
+    __slots__ = ("created", "file", "path", "rows", "size")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file: BinaryIO = path.open("wb")
+        self.rows = 0
+        self.size = 0
+        self.created = time.monotonic()
+
+
+class AyuLoadInfileMysqlPipeline(AyuMysqlPipeline):
+    """使用 LOAD DATA LOCAL INFILE 批量导入数据的 Mysql pipeline，适用于大量数据的回填场景
+
+    item 会按数据表及字段写入本地的 TSV 分块文件中，分块文件满足 MYSQL_INFILE_CONFIG 中的阈值时会导入到
+    数据表中，导入成功后删除此文件，导入失败的文件会保留以便排查及手动导入。导入在独立的单线程线程池中使
+    用单独的连接执行，不会阻塞 reactor。
+    """
+
+    mysql_conf: MysqlConf
+    conn: Connection
+    slog: slogT
+    cursor: Cursor
+    load_conn: Connection
+    threadpool: ThreadPool
+    running_loads: set[Deferred]
+    crawler: Crawler
+    infile_conf: BatchConf
+    infile_dir: Path
+    encoding: str
+    chunks: dict[tuple[str, tuple[str, ...]], _InfileChunk]
+    chunk_count: int
+    remove_infile_dir: bool
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        s = cls()
+        s.crawler = crawler
+        return s
+
+    def open_spider(self) -> None:
+        spider = cast("AyuSpider", self.crawler.spider)
+        assert hasattr(spider, "mysql_conf"), "未配置 Mysql 连接信息！"
+        self.slog = spider.slog
+        self.mysql_conf = spider.mysql_conf
+        self._connect(self.mysql_conf).close()
+
+        # self.conn 只在 reactor 中用于维护表结构，导入使用的 load_conn 只在导入线程中使用
+        self.conn = self._connect_infile()
+        self.cursor = self.conn.cursor()
+        self.load_conn = self._connect_infile()
+        self.running_loads = set()
+        self.threadpool = ThreadPool(
+            minthreads=1, maxthreads=1, name="AyuLoadInfileMysqlPipeline"
+        )
+        self.threadpool.start()
+        self.schema_cache = MysqlSchemaCache(self.mysql_conf, Synchronize())
+        self.encoding = charset_by_name(self.mysql_conf.charset).encoding
+
+        settings = self.crawler.settings
+        self.infile_conf = get_batch_conf(settings, "MYSQL_INFILE_CONFIG")
+        if not self.infile_conf.enabled:
+            self.infile_conf = BatchConf(
+                size=100000, max_bytes=64 * 1024 * 1024, interval=10.0
+            )
+        if infile_dir := settings.get("MYSQL_INFILE_DIR"):
+            self.infile_dir = Path(infile_dir)
+            self.infile_dir.mkdir(parents=True, exist_ok=True)
+            self.remove_infile_dir = False
+        else:
+            self.infile_dir = Path(tempfile.mkdtemp(prefix="ayu_infile_"))
+            self.remove_infile_dir = True
+        self.chunks = {}
+        self.chunk_count = 0
+
+        self.flush_loop = task.LoopingCall(self.flush_expired)
+        self.flush_loop.start(self.infile_conf.interval, now=False).addErrback(
+            self._flush_loop_err
+        )
+
+    def _connect_infile(self) -> Connection:
+        return pymysql.connect(
+            user=self.mysql_conf.user,
+            password=self.mysql_conf.password,
+            host=self.mysql_conf.host,
+            port=self.mysql_conf.port,
+            database=self.mysql_conf.database,
+            charset=self.mysql_conf.charset,
+            local_infile=True,
+        )
+
+    def process_item(self, item: Any) -> Any:
+        item_dict = ReuseOperation.item_to_dict(item)
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not (new_item := alter_item.new_item):
+            return item
+
+        key = (alter_item.table.name, tuple(new_item))
+        if (chunk := self.chunks.get(key)) is None:
+            # 数据表及字段需要在导入前就存在
+            self.schema_cache.ensure_columns(self.cursor, alter_item)
+            chunk = self.chunks[key] = self._new_chunk(alter_item)
+
+        line = (
+            b"\t".join(_escape_field(v, self.encoding) for v in new_item.values())
+            + b"\n"
+        )
+        chunk.file.write(line)
+        chunk.rows += 1
+        chunk.size += len(line)
+        if (
+            chunk.rows >= self.infile_conf.size
+            or chunk.size >= self.infile_conf.max_bytes
+        ):
+            del self.chunks[key]
+            self.load_chunk(key, chunk)
+        return item
+
+    def _new_chunk(self, alter_item: AlterItem) -> _InfileChunk:
+        self.chunk_count += 1
+        path = self.infile_dir / f"{alter_item.table.name}_{self.chunk_count:06d}.tsv"
+        return _InfileChunk(path)
+
+    def flush_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key
+            for key, chunk in self.chunks.items()
+            if now - chunk.created >= self.infile_conf.interval
+        ]
+        for key in expired:
+            chunk = self.chunks.pop(key)
+            # 在 LoopingCall 中执行，异常需要在此处理，否则定时导入会停止
+            try:
+                self.load_chunk(key, chunk)
+            except Exception as e:
+                self.slog.error(
+                    f"Pipe Error: {e} & Table: {key[0]} & 导入失败的文件: {chunk.path}"
+                )
+
+    def load_chunk(
+        self, key: tuple[str, tuple[str, ...]], chunk: _InfileChunk
+    ) -> Deferred:
+        """在导入线程中将分块文件导入到数据表中，导入成功后删除此文件
+
+        Args:
+            key: 分块文件对应的数据表及字段
+            chunk: 需要导入的分块文件
+
+        Returns:
+            1). 导入完成的 Deferred，close_spider 时会等待其完成
+        """
+        chunk.file.close()
+        table, columns = key
+        if self.mysql_conf.odku_enable:
+            modifier = "REPLACE "
+        elif self.mysql_conf.insert_ignore:
+            modifier = "IGNORE "
+        else:
+            modifier = ""
+        keys = f"""`{"`, `".join(columns)}`"""
+        sql = (
+            f"LOAD DATA LOCAL INFILE %s {modifier}INTO TABLE `{table}`"
+            f" CHARACTER SET {self.mysql_conf.charset} ({keys})"
+        )
+
+        d = self._run_in_thread(self._load_file, sql, chunk)
+        self.running_loads.add(d)
+        d.addBoth(self._untrack, d)
+        # 日志及写入数量的统计在 reactor 中的回调里处理
+        d.addCallbacks(
+            self._loaded,
+            self._load_err,
+            callbackArgs=(table, chunk),
+            errbackArgs=(table, chunk),
+        )
+        return d
+
+    def _run_in_thread(self, func: Callable[..., Any], *args: Any) -> Deferred:
+        from twisted.internet import reactor  # noqa: PLC0415
+
+        return threads.deferToThreadPool(reactor, self.threadpool, func, *args)
+
+    def _untrack(self, result: Any, d: Deferred) -> Any:
+        self.running_loads.discard(d)
+        return result
+
+    def _load_file(self, sql: str, chunk: _InfileChunk) -> tuple[int, tuple]:
+        """在导入线程中执行 LOAD DATA 并提交
+
+        Returns:
+            1). 导入的数据条数
+            2). 导入时产生的警告
+        """
+        cursor = self.load_conn.cursor()
+        try:
+            cursor.execute(sql, (str(chunk.path),))
+            # REPLACE 时被替换的行会计为 2 行，所以不能超过文件中的行数；警告需要在提交前查询
+            loaded = min(cursor.rowcount, chunk.rows)
+            warnings = self.load_conn.show_warnings()
+            self.load_conn.commit()
+        except Exception:
+            self.load_conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return loaded, warnings
+
+    def _loaded(
+        self, result: tuple[int, tuple], table: str, chunk: _InfileChunk
+    ) -> None:
+        loaded, warnings = result
+        if warnings:
+            # IGNORE 及 LOCAL 模式下被跳过或截断的数据只会产生警告
+            self.slog.warning(
+                f"数据表 {table} 导入时有 {len(warnings)} 条警告，文件共 {chunk.rows} 条，"
+                f"导入 {loaded} 条，警告: {warnings[:_MAX_LOGGED_WARNINGS]}"
+            )
+        self.slog.info(f"数据表 {table} 导入 {loaded} 条数据成功")
+        self._count_rows(table, loaded)
+        chunk.path.unlink(missing_ok=True)
+
+    def _load_err(self, failure: Failure, table: str, chunk: _InfileChunk) -> None:
+        self.slog.error(
+            f"Pipe Error: {failure.value} & Table: {table} & 导入失败的文件: {chunk.path}"
+        )
+
+    async def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        for key, chunk in list(self.chunks.items()):
+            self.load_chunk(key, chunk)
+        self.chunks.clear()
+        # 导入线程中的导入完成后才能关闭其连接
+        if self.running_loads:
+            await maybe_deferred_to_future(DeferredList(list(self.running_loads)))
+        self.threadpool.stop()
+        self.load_conn.close()
+        self.conn.close()
+        if self.remove_infile_dir and not any(self.infile_dir.iterdir()):
+            self.infile_dir.rmdir()
@@ -3,6 +3,8 @@ from __future__ import annotations
 import datetime
 from typing import TYPE_CHECKING, Any, cast
 
+from scrapy import signals
+
 from ayugespidertools.common.expend import MysqlPipeEnhanceMixin
 
 __all__ = [
@@ -26,11 +28,13 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
     cursor: Cursor
     crawl_time: datetime.date
     crawler: Crawler
+    reconcile: bool
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
         s = cls()
         s.crawler = crawler
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def open_spider(self) -> None:
@@ -40,6 +44,32 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
         self.mysql_conf = spider.mysql_conf
         self.conn = self._connect(self.mysql_conf)
         self.cursor = self.conn.cursor()
+        self.reconcile = self.crawler.settings.getbool("MYSQL_STATS_RECONCILE", False)
+
+    def table_rows_statistics(
+        self, spider_name: str, database: str, crawl_time: datetime.date
+    ) -> None:
+        """根据 mysql pipelines 在 crawler stats 中记录的各数据表写入条数来统计本次运行的入库数据
+
+        Args:
+            spider_name: 爬虫脚本名称
+            database: 数据库，保存程序采集记录保存的数据库
+            crawl_time: 采集时间，程序运行时间
+        """
+        stats = self.crawler.stats.get_stats()
+        prefix = self.table_rows_stats_prefix
+        if rows := [
+            {
+                "spider_name": spider_name,
+                "database": database,
+                "table_name": k[len(prefix) :],
+                "number": v,
+                "crawl_time": str(crawl_time),
+            }
+            for k, v in stats.items()
+            if k.startswith(prefix)
+        ]:
+            self.insert_tables_statistics(rows)
 
     def table_collection_statistics(
         self, spider_name: str, database: str, crawl_time: datetime.date
@@ -65,15 +95,18 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
             self.cursor.execute(sql_all)
             results = self.cursor.fetchall()
 
-            for row in results:
-                table_statistics = {
-                    "spider_name": spider_name,
-                    "database": database,
-                    "table_name": row[0],
-                    "number": row[1],
-                    "crawl_time": str(row[2] or crawl_time),
-                }
-                self.insert_table_statistics(table_statistics)
+            self.insert_tables_statistics(
+                [
+                    {
+                        "spider_name": spider_name,
+                        "database": database,
+                        "table_name": row[0],
+                        "number": row[1],
+                        "crawl_time": str(row[2] or crawl_time),
+                    }
+                    for row in results
+                ]
+            )
 
     def insert_table_statistics(
         self, data: dict, table: str = "table_collection_statistics"
@@ -84,6 +117,20 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
             data: 需要统计的入库信息
             table: 存储表的名称
         """
+        self.insert_tables_statistics([data], table)
+
+    def insert_tables_statistics(
+        self, rows: list[dict], table: str = "table_collection_statistics"
+    ) -> None:
+        """批量插入多个数据表的统计数据到表中
+
+        Args:
+            rows: 需要统计的各数据表的入库信息
+            table: 存储表的名称
+        """
+        if not rows:
+            return
+
         create_table_sql = f"""
         CREATE TABLE IF NOT EXISTS `{table}` (
             `id` int(11) NOT NULL AUTO_INCREMENT,
@@ -97,12 +144,17 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
         """
         self.cursor.execute(create_table_sql)
 
-        sql, args = self._get_sql_by_item(
+        sql, _ = self._get_sql_by_item(
             table=table,
-            item=data,
+            item=rows[0],
             odku_enable=self.mysql_conf.odku_enable,
         )
-        self._log_record(sql=sql, data=args)
+        try:
+            self.cursor.executemany(sql, [tuple(row.values()) for row in rows])
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self.slog.warning(f"日志记录存储错误: {e}")
 
     def insert_script_statistics(
         self, data: dict, table: str = "script_collection_statistics"
@@ -163,11 +215,19 @@ class AyuStatisticsMysqlPipeline(MysqlPipeEnhanceMixin):
 
         # 运行脚本统计信息
         self.insert_script_statistics(log_info)
-        self.table_collection_statistics(
-            spider_name=spider.name,
-            database=spider.mysql_conf.database,
-            crawl_time=self.crawl_time,
-        )
+
+    def spider_closed(self) -> None:
+        # 各数据表的写入条数需在所有 pipelines 关闭后统计，避免遗漏其它 pipelines 中未完成的写入
+        spider = cast("AyuSpider", self.crawler.spider)
+        statistics_kwargs = {
+            "spider_name": spider.name,
+            "database": spider.mysql_conf.database,
+            "crawl_time": self.crawl_time,
+        }
+        if self.reconcile:
+            self.table_collection_statistics(**statistics_kwargs)
+        else:
+            self.table_rows_statistics(**statistics_kwargs)
 
         if self.conn:
             self.conn.close()
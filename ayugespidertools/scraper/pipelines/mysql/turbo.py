@@ -1,10 +1,18 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, cast
+import threading
+from typing import TYPE_CHECKING, Any, cast
 
 import pymysql
 from dbutils.pooled_db import PooledDB
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
+from twisted.internet.defer import DeferredList, DeferredSemaphore
+from twisted.python.threadpool import ThreadPool
 
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.mysqlerrhandle import Synchronize
+from ayugespidertools.common.mysqlschema import MysqlSchemaCache
 from ayugespidertools.scraper.pipelines.mysql import AyuMysqlPipeline
 
 __all__ = [
@@ -12,22 +20,39 @@ __all__ = [
 ]
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from pymysql.connections import Connection
     from pymysql.cursors import Cursor
     from scrapy.crawler import Crawler
+    from twisted.internet.defer import Deferred
+    from twisted.python.failure import Failure
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import MysqlConf, slogT
+    from ayugespidertools.common.typevars import AlterItem, MysqlConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
 class AyuTurboMysqlPipeline(AyuMysqlPipeline):
+    """使用 PooledDB 连接池及独立线程池并发写入的 Mysql pipeline
+
+    写入操作都在独立的线程池中执行，不会阻塞 reactor，每个写入线程都会从 PooledDB 中获取自己的连接，
+    线程数与 POOL_DB_CONFIG 中的 maxconnections 一致。开启批量写入时，同时进行的批量写入数不超过线程数，
+    都在写入时 process_item 会等待，避免待写入的批次在内存中无限堆积。
+    """
+
     mysql_conf: MysqlConf
-    conn: Connection
     slog: slogT
-    cursor: Cursor
     pool_db_conf: dict
     crawler: Crawler
+    pool: PooledDB
+    threadpool: ThreadPool
+    running_writes: set[Deferred]
+    write_slots: DeferredSemaphore
+    failed_count: int
+    _local: threading.local
+    _connections: list[Connection]
+    _connections_lock: threading.Lock
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -52,7 +77,7 @@ class AyuTurboMysqlPipeline(AyuMysqlPipeline):
         self._connect(spider.mysql_conf).close()
 
         # 添加 PooledDB 的配置
-        self.conn = PooledDB(
+        self.pool = PooledDB(
             creator=pymysql,
             user=self.mysql_conf.user,
             password=self.mysql_conf.password,
@@ -61,5 +86,97 @@ class AyuTurboMysqlPipeline(AyuMysqlPipeline):
             database=self.mysql_conf.database,
             charset=self.mysql_conf.charset,
             **self.pool_db_conf,
-        ).connection()
-        self.cursor = self.conn.cursor()
+        )
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.running_writes = set()
+        self.failed_count = 0
+
+        # 写入线程数与连接池的最大连接数保持一致，为 0（不限制）时使用默认的 5 个线程
+        max_workers = self.pool_db_conf.get("maxconnections") or 5
+        self.write_slots = DeferredSemaphore(max_workers)
+        self.threadpool = ThreadPool(
+            minthreads=1, maxthreads=max_workers, name="AyuTurboMysqlPipeline"
+        )
+        self.threadpool.start()
+        self.schema_cache = MysqlSchemaCache(self.mysql_conf, Synchronize())
+        self._setup_batch()
+
+    def _get_local(self) -> threading.local:
+        """获取当前写入线程的连接信息，首次使用时从 PooledDB 中获取连接"""
+        if not hasattr(self._local, "conn"):
+            self._local.conn = self.pool.connection()
+            self._local.cursor = self._local.conn.cursor()
+            with self._connections_lock:
+                self._connections.append(self._local.conn)
+        return self._local
+
+    @property
+    def conn(self) -> Connection:
+        return self._get_local().conn
+
+    @property
+    def cursor(self) -> Cursor:
+        return self._get_local().cursor
+
+    def _run_in_thread(self, func: Callable[..., Any], *args: Any) -> Deferred:
+        """在写入线程池中执行 func，并记录未完成的写入"""
+        from twisted.internet import reactor  # noqa: PLC0415
+
+        return self._track(
+            threads.deferToThreadPool(reactor, self.threadpool, func, *args)
+        )
+
+    def _track(self, d: Deferred) -> Deferred:
+        self.running_writes.add(d)
+        d.addBoth(self._untrack, d)
+        return d
+
+    def _untrack(self, result: Any, d: Deferred) -> Any:
+        self.running_writes.discard(d)
+        return result
+
+    async def process_item(self, item: Any) -> Any:
+        item_dict = ReuseOperation.item_to_dict(item)
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if self.batch_conf.enabled:
+            self.buffer_item(alter_item)
+            if self.write_slots.tokens == 0:
+                # 同时进行的批量写入数已满时，等待排在前面的批次开始写入后再返回
+                await maybe_deferred_to_future(self.write_slots.acquire())
+                self.write_slots.release()
+        else:
+            written = await maybe_deferred_to_future(
+                self._run_in_thread(self.insert_item, alter_item)
+            )
+            self._count_rows(alter_item.table.name, written)
+        return item
+
+    def write_group(self, alter_items: list[AlterItem]) -> None:
+        # 等待写入名额的批次也需要记录，close_spider 时要等待其完成
+        d = self._track(
+            self.write_slots.run(self._run_in_thread, self.insert_items, alter_items)
+        )
+        # 写入线程中不更新 stats，在 reactor 中的回调里统计，close_spider 等待写入完成时即已统计完毕
+        d.addCallback(self._count_written, alter_items[0].table.name)
+        d.addErrback(self._write_group_err, alter_items)
+
+    def _write_group_err(self, failure: Failure, alter_items: list[AlterItem]) -> None:
+        self.failed_count += len(alter_items)
+        self.slog.error(f"批量插入数据失败:{failure}, items: {len(alter_items)}")
+
+    async def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for _, alter_items in self.buffer.pop_all():
+                self.write_group(alter_items)
+        if self.running_writes:
+            await maybe_deferred_to_future(DeferredList(list(self.running_writes)))
+        if self.failed_count:
+            self.slog.error(f"Mysql 批量写入共有 {self.failed_count} 条数据失败")
+        self.threadpool.stop()
+        for conn in self._connections:
+            conn.close()
+        self.pool.close()
@@ -3,11 +3,21 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, Any, cast
 
 from pymysql import cursors
+from scrapy.utils.defer import maybe_deferred_to_future
 from twisted.enterprise import adbapi
+from twisted.internet import task
+from twisted.internet.defer import DeferredList
 
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
 from ayugespidertools.common.expend import MysqlPipeEnhanceMixin
 from ayugespidertools.common.multiplexing import ReuseOperation
-from ayugespidertools.common.mysqlerrhandle import TwistedAsynchronous, deal_mysql_err
+from ayugespidertools.common.mysqlerrhandle import (
+    TwistedAsynchronous,
+    deal_mysql_err,
+    get_column_types,
+    is_schema_err,
+)
+from ayugespidertools.common.mysqlschema import MysqlSchemaCache
 
 __all__ = [
     "AyuTwistedMysqlPipeline",
@@ -15,18 +25,28 @@ __all__ = [
 
 if TYPE_CHECKING:
     from scrapy.crawler import Crawler
+    from twisted.internet.defer import Deferred
     from twisted.python.failure import Failure
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import MysqlConf, slogT
+    from ayugespidertools.common.typevars import AlterItem, BatchConf, MysqlConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
+# db_insert_many 中整批写入及失败后逐条写入时使用的 savepoint
+_BATCH_SAVEPOINT = "ayu_batch"
+_ITEM_SAVEPOINT = "ayu_item"
+
 
 class AyuTwistedMysqlPipeline(MysqlPipeEnhanceMixin):
     mysql_conf: MysqlConf
     slog: slogT
     dbpool: adbapi.ConnectionPool
     crawler: Crawler
+    schema_cache: MysqlSchemaCache
+    batch_conf: BatchConf
+    buffer: BatchBuffer[tuple, AlterItem]
+    flush_loop: task.LoopingCall | None = None
+    running_queries: set[Deferred]
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -40,6 +60,7 @@ class AyuTwistedMysqlPipeline(MysqlPipeEnhanceMixin):
         self.slog = spider.slog
         self.mysql_conf = spider.mysql_conf
         self._connect(self.mysql_conf).close()
+        self.schema_cache = MysqlSchemaCache(self.mysql_conf, TwistedAsynchronous())
 
         _mysql_conf = {
             "user": self.mysql_conf.user,
@@ -50,48 +71,196 @@ class AyuTwistedMysqlPipeline(MysqlPipeEnhanceMixin):
             "charset": self.mysql_conf.charset,
             "cursorclass": cursors.DictCursor,
         }
-        self.dbpool = adbapi.ConnectionPool("pymysql", cp_reconnect=True, **_mysql_conf)
+        self.dbpool = adbapi.ConnectionPool(
+            "pymysql",
+            cp_reconnect=True,
+            cp_min=self.mysql_conf.cp_min,
+            cp_max=self.mysql_conf.cp_max,
+            **_mysql_conf,
+        )
         query = self.dbpool.runInteraction(self.db_create)
         query.addErrback(self.db_create_err)
 
+        self.running_queries = set()
+        self.batch_conf = get_batch_conf(self.crawler.settings, "MYSQL_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_loop = task.LoopingCall(self.flush_expired)
+            self.flush_loop.start(self.batch_conf.interval, now=False).addErrback(
+                self._flush_loop_err
+            )
+
     def db_create(self, cursor: Any) -> None: ...
 
     def db_create_err(self, failure: Failure) -> None:
         self.slog.error(f"创建数据表失败: {failure}")
 
+    def _flush_loop_err(self, failure: Failure) -> None:
+        self.slog.error(f"Mysql 定时批量写入失败: {failure}")
+
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
-        query = self.dbpool.runInteraction(self.db_insert, item_dict)
+        if self.batch_conf.enabled:
+            self.buffer_item(item_dict)
+            return item
+
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not alter_item.new_item:
+            return item
+
+        query = self.dbpool.runInteraction(self.db_insert, alter_item)
+        # 在事务提交后（即 Deferred 回调时）再统计写入条数
+        query.addCallback(self._count_written, alter_item.table.name)
         query.addErrback(self.handle_error, item)
+        self._track(query)
         return item
 
-    def db_insert(self, cursor: Any, item: Any) -> Any:
-        alter_item = ReuseOperation.reshape_item(item)
+    def _track(self, query: Deferred) -> None:
+        """记录未完成的写入，close_spider 时需要等待其完成"""
+        self.running_queries.add(query)
+        query.addBoth(self._untrack, query)
+
+    def _untrack(self, result: Any, query: Deferred) -> Any:
+        self.running_queries.discard(query)
+        return result
+
+    def buffer_item(self, item_dict: dict) -> None:
+        """将 item 按数据表及字段分组缓存，分组满足阈值时在一个事务中批量写入"""
+        alter_item = ReuseOperation.reshape_item(item_dict)
         if not (new_item := alter_item.new_item):
-            return None
+            return
+
+        key = (
+            alter_item.table.name,
+            tuple(new_item),
+            tuple(sorted(alter_item.update_keys)),
+        )
+        if alter_items := self.buffer.add(key, alter_item, estimate_size(new_item)):
+            self.insert_group(alter_items)
+
+    def flush_expired(self) -> None:
+        for _, alter_items in self.buffer.pop_expired():
+            self.insert_group(alter_items)
+
+    def insert_group(self, alter_items: list[AlterItem]) -> None:
+        query = self.dbpool.runInteraction(self.db_insert_many, alter_items)
+        query.addCallback(self._count_written, alter_items[0].table.name)
+        query.addErrback(self.handle_group_error, alter_items)
+        self._track(query)
+
+    def db_insert_many(self, cursor: Any, alter_items: list[AlterItem]) -> int:
+        """在同一个事务中用 executemany 写入数据表及字段都相同的一组 item
+
+        Args:
+            cursor: twisted Transaction
+            alter_items: 需要写入的同一分组的 item
 
+        Returns:
+            1). 写入成功的条数
+        """
+        first_item = alter_items[0]
+        _table_name = first_item.table.name
+        sql_args = [
+            self._get_sql_by_alter_item(alter_item, self.mysql_conf)
+            for alter_item in alter_items
+        ]
+        sql = sql_args[0][0]
+
+        savepoint = False
+        try:
+            self.schema_cache.ensure_columns(cursor, first_item)
+            # 建表及修改字段等 DDL 会隐式提交事务，所以需要在其之后设置 savepoint
+            cursor.execute(f"SAVEPOINT {_BATCH_SAVEPOINT}")
+            savepoint = True
+            cursor.executemany(sql, [args for _, args in sql_args])
+            return len(alter_items)
+        except Exception as e:
+            self.slog.warning(
+                f"Pipe Warn: {e} & Table: {_table_name} & Items: {len(alter_items)}"
+            )
+            if savepoint:
+                # executemany 拆分为多条语句执行时，撤销失败前已写入的部分数据，避免重试时重复写入
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {_BATCH_SAVEPOINT}")
+            if is_schema_err(str(e)):
+                self.schema_cache.invalidate(_table_name)
+            try:
+                deal_mysql_err(
+                    TwistedAsynchronous(),
+                    err_msg=str(e),
+                    cursor=cursor,
+                    mysql_conf=self.mysql_conf,
+                    table=_table_name,
+                    table_notes=first_item.table.notes,
+                    note_dic=first_item.notes_dic,
+                    column_dic=get_column_types(first_item),
+                )
+            except Exception:
+                # 不是表结构问题时，改为逐条写入，避免个别数据导致整批数据写入失败
+                return self._insert_one_by_one(cursor, sql_args, alter_items)
+            return self.db_insert_many(cursor, alter_items)
+
+    def _insert_one_by_one(
+        self,
+        cursor: Any,
+        sql_args: list[tuple[str, tuple]],
+        alter_items: list[AlterItem],
+    ) -> int:
+        """每条数据在各自的 savepoint 中重新写入，写入失败时只回滚此条数据
+
+        Args:
+            cursor: twisted Transaction
+            sql_args: 每条数据的 sql 及其参数
+            alter_items: sql_args 对应的 item
+
+        Returns:
+            1). 写入成功的条数
+        """
+        written = 0
+        for (sql, args), alter_item in zip(sql_args, alter_items, strict=True):
+            # 同名的 savepoint 会覆盖之前的，不需要逐条 RELEASE
+            cursor.execute(f"SAVEPOINT {_ITEM_SAVEPOINT}")
+            try:
+                cursor.execute(sql, args)
+            except Exception as e:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {_ITEM_SAVEPOINT}")
+                self.slog.error(
+                    f"Pipe Error: {e} & Table: {alter_item.table.name} & Item: {alter_item.new_item}"
+                )
+            else:
+                written += 1
+        return written
+
+    def handle_group_error(
+        self, failure: Failure, alter_items: list[AlterItem]
+    ) -> None:
+        self.slog.error(f"批量插入数据失败:{failure}, items: {len(alter_items)}")
+
+    def db_insert(self, cursor: Any, alter_item: AlterItem) -> int:
+        """写入单条 item
+
+        Args:
+            cursor: twisted Transaction
+            alter_item: 需要写入的 item
+
+        Returns:
+            1). 写入成功的条数
+        """
+        new_item = alter_item.new_item
         _table_name = alter_item.table.name
         _table_notes = alter_item.table.notes
         note_dic = alter_item.notes_dic
-        duplicate = None
-        if update_keys := alter_item.update_keys:
-            duplicate = ReuseOperation.get_items_by_keys(
-                data=new_item, keys=update_keys
-            )
-        sql, args = self._get_sql_by_item(
-            table=_table_name,
-            item=new_item,
-            odku_enable=self.mysql_conf.odku_enable,
-            insert_prefix=self.mysql_conf.insert_prefix,
-            duplicate=duplicate,
-        )
+        sql, args = self._get_sql_by_alter_item(alter_item, self.mysql_conf)
 
         try:
+            self.schema_cache.ensure_columns(cursor, alter_item)
             cursor.execute(sql, args)
+            return 1
         except Exception as e:
             self.slog.warning(
                 f"Pipe Warn: {e} & Table: {_table_name} & Item: {new_item}"
             )
+            if is_schema_err(str(e)):
+                self.schema_cache.invalidate(_table_name)
             deal_mysql_err(
                 TwistedAsynchronous(),
                 err_msg=str(e),
@@ -100,11 +269,19 @@ class AyuTwistedMysqlPipeline(MysqlPipeEnhanceMixin):
                 table=_table_name,
                 table_notes=_table_notes,
                 note_dic=note_dic,
+                column_dic=get_column_types(alter_item),
             )
-            return self.db_insert(cursor, item)
+            return self.db_insert(cursor, alter_item)
 
     def handle_error(self, failure: Failure, item: Any) -> None:
         self.slog.error(f"插入数据失败:{failure}, item: {item}")
 
-    def close_spider(self) -> None:
+    async def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for _, alter_items in self.buffer.pop_all():
+                self.insert_group(alter_items)
+        if self.running_queries:
+            await maybe_deferred_to_future(DeferredList(list(self.running_queries)))
         self.dbpool.close()
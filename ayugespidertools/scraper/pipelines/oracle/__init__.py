@@ -2,6 +2,9 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any, cast
 
+from twisted.internet import task
+
+from ayugespidertools.common.batch import BatchBuffer, get_batch_conf
 from ayugespidertools.common.expend import OraclePipeEnhanceMixin
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.sqlformat import GenOracle
@@ -12,9 +15,11 @@ if TYPE_CHECKING:
     from oracledb.connection import Connection
     from oracledb.cursor import Cursor
     from scrapy.crawler import Crawler
+    from twisted.python.failure import Failure
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import AlterItem
+    from ayugespidertools.common.expend import OracleSqlKeyT
+    from ayugespidertools.common.typevars import AlterItem, BatchConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
@@ -22,6 +27,10 @@ class AyuOraclePipeline(OraclePipeEnhanceMixin):
     conn: Connection
     cursor: Cursor
     crawler: Crawler
+    slog: slogT
+    batch_conf: BatchConf
+    buffer: BatchBuffer[OracleSqlKeyT, tuple]
+    flush_loop: task.LoopingCall | None = None
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -32,13 +41,30 @@ class AyuOraclePipeline(OraclePipeEnhanceMixin):
     def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "oracle_conf"), "未配置 Oracle 连接信息！"
+        self.slog = spider.slog
         self.conn = self._connect(spider.oracle_conf)
         self.cursor = self.conn.cursor()
+        self.input_sizes = {}
+
+        # 开启批量写入时，item 按数据表及字段缓存，达到阈值后以数组绑定的方式批量 MERGE
+        self.batch_conf = get_batch_conf(self.crawler.settings, "ORACLE_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_loop = task.LoopingCall(self.flush_expired)
+            self.flush_loop.start(self.batch_conf.interval, now=False).addErrback(
+                self._flush_loop_err
+            )
+
+    def _flush_loop_err(self, failure: Failure) -> None:
+        self.slog.error(f"Oracle 定时批量写入失败: {failure}")
 
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
         alter_item = ReuseOperation.reshape_item(item_dict)
-        self.insert_item(alter_item)
+        if self.batch_conf.enabled:
+            self.buffer_item(alter_item)
+        else:
+            self.insert_item(alter_item)
         return item
 
     def insert_item(self, alter_item: AlterItem) -> None:
@@ -56,5 +82,46 @@ class AyuOraclePipeline(OraclePipeEnhanceMixin):
         self.cursor.execute(sql, args)
         self.conn.commit()
 
+    def buffer_item(self, alter_item: AlterItem) -> None:
+        """将 item 按 MERGE 语句结构分组缓存，分组满足阈值时批量写入"""
+        if not alter_item.new_item:
+            return
+
+        key = self._get_oracle_sql_key(alter_item)
+        if rows := self.buffer.add(key, tuple(alter_item.new_item.values())):
+            self.insert_items(key, rows)
+
+    def flush_expired(self) -> None:
+        for key, rows in self.buffer.pop_expired():
+            self.insert_items(key, rows)
+
+    def insert_items(self, key: OracleSqlKeyT, rows: list[tuple]) -> None:
+        """在同一个连接上用 executemany 以数组绑定的方式批量 MERGE，整批只提交一次
+
+        Args:
+            key: rows 对应的 MERGE 语句结构
+            rows: 需要写入的数据
+        """
+        try:
+            sql = self._prepare_merge_many(self.cursor, key, rows)
+            self.cursor.executemany(sql, rows, batcherrors=True)
+            batch_errors = self.cursor.getbatcherrors()
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self.slog.error(f"Pipe Error: {e} & Table: {key[0]} & Items: {len(rows)}")
+            return
+
+        for error in batch_errors:
+            self.slog.error(
+                f"Pipe Error: {error.message} & Table: {key[0]} & "
+                f"Offset: {error.offset} & Item: {rows[error.offset]}"
+            )
+
     def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for key, rows in self.buffer.pop_all():
+                self.insert_items(key, rows)
         self.conn.close()
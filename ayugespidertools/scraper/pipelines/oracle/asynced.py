@@ -1,26 +1,51 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 from typing import TYPE_CHECKING, Any, cast
 
-from ayugespidertools.common.expend import OraclePipeEnhanceMixin
+from ayugespidertools.common.batch import BatchBuffer, get_batch_conf
+from ayugespidertools.common.expend import (
+    OraclePipeEnhanceMixin,
+    get_oracle_input_sizes,
+)
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.sqlformat import GenOracle
 from ayugespidertools.common.typevars import PortalTag
+from ayugespidertools.exceptions import NotConfigured
 from ayugespidertools.utils.database import OracleAsyncPortal
 
 __all__ = ["AyuAsyncOraclePipeline"]
 
-if TYPE_CHECKING:
+try:
     import oracledb
+except ImportError:
+    raise NotConfigured(
+        "missing oracledb library, please install it. "
+        "install command: pip install ayugespidertools[database]"
+    )
+
+# 以这些类型绑定时需要 setinputsizes，不能放在 oracledb pipeline 中执行
+_LOB_TYPES = (oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_BLOB)
+
+if TYPE_CHECKING:
     from scrapy.crawler import Crawler
     from typing_extensions import Self
 
+    from ayugespidertools.common.expend import OracleSqlKeyT
+    from ayugespidertools.common.typevars import AlterItem, BatchConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
 class AyuAsyncOraclePipeline(OraclePipeEnhanceMixin):
     crawler: Crawler
     pool: oracledb.AsyncConnectionPool
+    slog: slogT
+    batch_conf: BatchConf
+    buffer: BatchBuffer[OracleSqlKeyT, tuple]
+    flush_task: asyncio.Task | None = None
+    flushing: asyncio.Future | None = None
+    pipeline_mode: bool = False
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -31,9 +56,24 @@ class AyuAsyncOraclePipeline(OraclePipeEnhanceMixin):
     async def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "oracle_conf"), "未配置 Oracle 连接信息！"
-        self.pool = OracleAsyncPortal(
-            db_conf=spider.oracle_conf, tag=PortalTag.LIBRARY
-        ).connect()
+        self.slog = spider.slog
+        portal = OracleAsyncPortal(db_conf=spider.oracle_conf, tag=PortalTag.LIBRARY)
+        self.pool = portal.connect()
+        await portal.warmup()
+        self.input_sizes = {}
+
+        # 开启批量写入时，item 按数据表及字段缓存，达到阈值后以数组绑定的方式批量 MERGE
+        settings = self.crawler.settings
+        self.batch_conf = get_batch_conf(settings, "ORACLE_BATCH_CONFIG")
+        self.pipeline_mode = settings.getbool("ORACLE_PIPELINE_MODE", False)
+        if self.pipeline_mode and not self.batch_conf.enabled:
+            self.slog.warning(
+                "开启 ORACLE_PIPELINE_MODE 时需要配置 ORACLE_BATCH_CONFIG"
+            )
+            self.pipeline_mode = False
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_task = asyncio.create_task(self._flush_periodically())
 
     async def insert_item(self, item_dict: dict) -> None:
         async with self.pool.acquire() as conn:
@@ -47,10 +87,169 @@ class AyuAsyncOraclePipeline(OraclePipeEnhanceMixin):
             )
             await conn.execute(sql, args)
 
+    async def insert_items(self, key: OracleSqlKeyT, rows: list[tuple]) -> None:
+        """使用 executemany 以数组绑定的方式执行一次 MERGE 写入 rows，整批只提交一次
+
+        开启了 batcherrors，个别数据写入失败时不影响其它数据，只记录写入失败的数据及其偏移量。
+
+        Args:
+            key: rows 对应的数据表，字段，MERGE 的匹配字段及匹配时需要更新的字段
+            rows: 需要写入的数据
+        """
+        async with self.pool.acquire() as conn:
+            cursor = conn.cursor()
+            try:
+                sql = self._prepare_merge_many(cursor, key, rows)
+                await cursor.executemany(sql, rows, batcherrors=True)
+                batch_errors = cursor.getbatcherrors()
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                self.slog.error(
+                    f"Pipe Error: {e} & Table: {key[0]} & Items: {len(rows)}"
+                )
+                return
+            finally:
+                cursor.close()
+
+        for error in batch_errors:
+            self.slog.error(
+                f"Pipe Error: {error.message} & Table: {key[0]} & "
+                f"Offset: {error.offset} & Item: {rows[error.offset]}"
+            )
+
+    async def write_groups(
+        self, groups: list[tuple[OracleSqlKeyT, list[tuple]]]
+    ) -> None:
+        if not groups:
+            return
+        if self.pipeline_mode:
+            await self.run_pipeline(groups)
+        else:
+            for key, rows in groups:
+                await self.insert_items(key, rows)
+
+    async def run_pipeline(
+        self, groups: list[tuple[OracleSqlKeyT, list[tuple]]]
+    ) -> None:
+        """将各分组的 MERGE 及提交放在同一个 oracledb pipeline 中执行，不必等待每个操作的响应
+
+        需要 oracledb thin 模式，数据库版本为 23ai 及以上时才是真正的 pipeline，否则 oracledb 会依次执行。
+        pipeline 中不能设置 setinputsizes 及 batcherrors，所以需要以 CLOB 或 BLOB 类型绑定的分组改为使用
+        insert_items 写入；某个分组写入失败时 executemany 会在失败的数据处停止，其之前的数据仍会提交，记录
+        失败的数据后，其之后的数据也改为使用 insert_items 写入。pipeline 执行失败或最后的提交失败时，其中
+        的数据都未提交，所有分组都改为使用 insert_items 写入。
+
+        Args:
+            groups: 需要写入的各分组及其数据
+        """
+        pipeline = oracledb.create_pipeline()
+        pipelined, remaining = [], []
+        for key, rows in groups:
+            input_sizes = self.input_sizes[key] = get_oracle_input_sizes(
+                rows, self.input_sizes.get(key)
+            )
+            if any(size in _LOB_TYPES for size in input_sizes):
+                remaining.append((key, rows))
+                continue
+
+            sql, _ = GenOracle.merge_generate(
+                db_table=key[0],
+                match_cols=key[2],
+                data=dict.fromkeys(key[1]),
+                update_cols=key[3],
+            )
+            pipeline.add_executemany(sql, rows)
+            pipelined.append((key, rows))
+
+        if pipelined:
+            pipeline.add_commit()
+            if results := await self._run_pipeline(pipeline, len(pipelined)):
+                for (key, rows), result in zip(pipelined, results, strict=False):
+                    if not result.error:
+                        continue
+                    offset = result.error.offset
+                    self.slog.error(
+                        f"Pipe Error: {result.error.message} & Table: {key[0]} & "
+                        f"Offset: {offset} & Item: {rows[offset]}"
+                    )
+                    if rest := rows[offset + 1 :]:
+                        remaining.append((key, rest))
+            else:
+                # pipeline 执行或提交失败时其中的数据都未提交，全部改为使用 insert_items 写入
+                remaining.extend(pipelined)
+
+        for key, rows in remaining:
+            await self.insert_items(key, rows)
+
+    async def _run_pipeline(
+        self, pipeline: oracledb.Pipeline, groups: int
+    ) -> list[oracledb.PipelineOpResult] | None:
+        """执行 run_pipeline 中生成的 pipeline，执行或最后的提交失败时回滚并返回 None
+
+        Args:
+            pipeline: 以提交结尾的 oracledb pipeline
+            groups: pipeline 中的分组数，用于记录日志
+
+        Returns:
+            1). pipeline 中各操作的结果
+        """
+        async with self.pool.acquire() as conn:
+            try:
+                results = await conn.run_pipeline(pipeline, continue_on_error=True)
+            except Exception as e:
+                self.slog.error(f"Oracle pipeline 写入失败: {e} & Groups: {groups}")
+            else:
+                if not (commit_error := results[-1].error):
+                    return results
+                self.slog.error(f"Oracle pipeline 提交失败: {commit_error.message}")
+            with contextlib.suppress(Exception):
+                await conn.rollback()
+        return None
+
+    def buffer_item(
+        self, alter_item: AlterItem
+    ) -> tuple[OracleSqlKeyT, list[tuple]] | None:
+        key = self._get_oracle_sql_key(alter_item)
+        rows = self.buffer.add(key, tuple(alter_item.new_item.values()))
+        return None if rows is None else (key, rows)
+
+    async def flush_expired(self) -> None:
+        await self.write_groups(self.buffer.pop_expired())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_conf.interval)
+            self.flushing = asyncio.ensure_future(self.flush_expired())
+            try:
+                # 关闭时取消此任务不会中断正在进行的写入，close_spider 会等待其完成
+                await asyncio.shield(self.flushing)
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+            self.flushing = None
+
     async def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
-        await self.insert_item(item_dict)
+        if not self.batch_conf.enabled:
+            await self.insert_item(item_dict)
+            return item
+
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if alter_item.new_item and (group := self.buffer_item(alter_item)):
+            await self.write_groups([group])
         return item
 
     async def close_spider(self) -> None:
+        if self.flush_task:
+            self.flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.flush_task
+        if self.flushing:
+            # flush_expired 已从缓存中取出的分组不在 pop_all 中，需要等待其写入完成
+            try:
+                await self.flushing
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+        if self.batch_conf.enabled:
+            await self.write_groups(self.buffer.pop_all())
         await self.pool.close()
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
 
+from scrapy.utils.defer import maybe_deferred_to_future
 from twisted.enterprise import adbapi
+from twisted.internet import task
+from twisted.internet.defer import DeferredList
 
+from ayugespidertools.common.batch import BatchBuffer, get_batch_conf
 from ayugespidertools.common.expend import OraclePipeEnhanceMixin
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.sqlformat import GenOracle
@@ -14,9 +18,11 @@ __all__ = [
 
 if TYPE_CHECKING:
     from oracledb.connection import Connection
+    from twisted.internet.defer import Deferred
     from twisted.python.failure import Failure
 
-    from ayugespidertools.common.typevars import OracleConf, slogT
+    from ayugespidertools.common.expend import OracleSqlKeyT
+    from ayugespidertools.common.typevars import BatchConf, OracleConf, slogT
     from ayugespidertools.spiders import AyuSpider
 
 
@@ -25,6 +31,10 @@ class AyuTwistedOraclePipeline(OraclePipeEnhanceMixin):
     slog: slogT
     conn: Connection
     dbpool: adbapi.ConnectionPool
+    batch_conf: BatchConf
+    buffer: BatchBuffer[OracleSqlKeyT, tuple]
+    flush_loop: task.LoopingCall | None = None
+    running_queries: set[Deferred]
 
     def open_spider(self, spider: AyuSpider) -> None:
         assert hasattr(spider, "oracle_conf"), "未配置 Oracle 连接信息！"
@@ -45,17 +55,44 @@ class AyuTwistedOraclePipeline(OraclePipeEnhanceMixin):
         query = self.dbpool.runInteraction(self.db_create)
         query.addErrback(self.db_create_err)
 
+        self.input_sizes = {}
+        self.running_queries = set()
+        self.batch_conf = get_batch_conf(spider.crawler.settings, "ORACLE_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_loop = task.LoopingCall(self.flush_expired)
+            self.flush_loop.start(self.batch_conf.interval, now=False).addErrback(
+                self._flush_loop_err
+            )
+
     def db_create(self, cursor: Any) -> None: ...
 
     def db_create_err(self, failure: Failure) -> None:
         self.slog.error(f"创建数据表失败: {failure}")
 
+    def _flush_loop_err(self, failure: Failure) -> None:
+        self.slog.error(f"Oracle 定时批量写入失败: {failure}")
+
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
+        if self.batch_conf.enabled:
+            self.buffer_item(item_dict)
+            return item
+
         query = self.dbpool.runInteraction(self.db_insert, item_dict)
         query.addErrback(self.handle_error, item)
+        self._track(query)
         return item
 
+    def _track(self, query: Deferred) -> None:
+        """记录未完成的写入，close_spider 时需要等待其完成"""
+        self.running_queries.add(query)
+        query.addBoth(self._untrack, query)
+
+    def _untrack(self, result: Any, query: Deferred) -> Any:
+        self.running_queries.discard(query)
+        return result
+
     def db_insert(self, cursor: Any, item: Any) -> Any:
         alter_item = ReuseOperation.reshape_item(item)
         if not (new_item := alter_item.new_item):
@@ -73,3 +110,57 @@ class AyuTwistedOraclePipeline(OraclePipeEnhanceMixin):
 
     def handle_error(self, failure: Failure, item: Any) -> None:
         self.slog.error(f"插入数据失败:{failure}, item: {item}")
+
+    def buffer_item(self, item_dict: dict) -> None:
+        """将 item 按 MERGE 语句结构分组缓存，分组满足阈值时在一个事务中批量写入"""
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not alter_item.new_item:
+            return
+
+        key = self._get_oracle_sql_key(alter_item)
+        if rows := self.buffer.add(key, tuple(alter_item.new_item.values())):
+            self.insert_group(key, rows)
+
+    def flush_expired(self) -> None:
+        for key, rows in self.buffer.pop_expired():
+            self.insert_group(key, rows)
+
+    def insert_group(self, key: OracleSqlKeyT, rows: list[tuple]) -> None:
+        query = self.dbpool.runInteraction(self.db_insert_many, key, rows)
+        query.addErrback(self.handle_group_error, key, rows)
+        self._track(query)
+
+    def db_insert_many(
+        self, cursor: Any, key: OracleSqlKeyT, rows: list[tuple]
+    ) -> None:
+        """在同一个事务中用 executemany 以数组绑定的方式批量 MERGE
+
+        Args:
+            cursor: twisted Transaction
+            key: rows 对应的 MERGE 语句结构
+            rows: 需要写入的数据
+        """
+        sql = self._prepare_merge_many(cursor, key, rows)
+        cursor.executemany(sql, rows, batcherrors=True)
+        for error in cursor.getbatcherrors():
+            self.slog.error(
+                f"Pipe Error: {error.message} & Table: {key[0]} & "
+                f"Offset: {error.offset} & Item: {rows[error.offset]}"
+            )
+
+    def handle_group_error(
+        self, failure: Failure, key: OracleSqlKeyT, rows: list[tuple]
+    ) -> None:
+        self.slog.error(
+            f"批量插入数据失败:{failure}, table: {key[0]}, items: {len(rows)}"
+        )
+
+    async def close_spider(self, spider: AyuSpider) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for key, rows in self.buffer.pop_all():
+                self.insert_group(key, rows)
+        if self.running_queries:
+            await maybe_deferred_to_future(DeferredList(list(self.running_queries)))
+        self.dbpool.close()
@@ -3,8 +3,13 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, Any, cast
 
 from ayugespidertools.common.expend import PostgreSQLPipeEnhanceMixin
+from ayugespidertools.common.jsoncodec import register_psycopg_json
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.postgreserrhandle import Synchronize, deal_postgres_err
+from ayugespidertools.common.postgrespartition import (
+    PostgresPartitioner,
+    get_partition_conf,
+)
 from ayugespidertools.common.sqlformat import GenPostgresql
 
 __all__ = ["AyuPostgresPipeline"]
@@ -24,6 +29,8 @@ class AyuPostgresPipeline(PostgreSQLPipeEnhanceMixin):
     slog: slogT
     cursor: Cursor
     crawler: Crawler
+    partitioner: PostgresPartitioner | None = None
+    list_as_jsonb: bool = False
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -36,7 +43,14 @@ class AyuPostgresPipeline(PostgreSQLPipeEnhanceMixin):
         assert hasattr(spider, "postgres_conf"), "未配置 PostgreSQL 连接信息！"
         self.slog = spider.slog
         self.conn = self._connect(spider.postgres_conf)
+        self.list_as_jsonb = self.crawler.settings.getbool(
+            "POSTGRES_LIST_AS_JSONB", False
+        )
+        register_psycopg_json(self.conn, list_as_jsonb=self.list_as_jsonb)
         self.cursor = self.conn.cursor()
+        partition_conf = get_partition_conf(self.crawler.settings)
+        if partition_conf.enabled:
+            self.partitioner = PostgresPartitioner(partition_conf)
 
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
@@ -48,6 +62,9 @@ class AyuPostgresPipeline(PostgreSQLPipeEnhanceMixin):
         if not (new_item := alter_item.new_item):
             return None
 
+        if self.partitioner:
+            alter_item = self.partitioner.ensure_partitions(self.conn, alter_item)
+            new_item = alter_item.new_item
         _table_name = alter_item.table.name
         _table_notes = alter_item.table.notes
         note_dic = alter_item.notes_dic
@@ -75,6 +92,8 @@ class AyuPostgresPipeline(PostgreSQLPipeEnhanceMixin):
                 table=_table_name,
                 table_notes=_table_notes,
                 note_dic=note_dic,
+                new_item=new_item,
+                list_as_jsonb=self.list_as_jsonb,
             )
             return self.insert_item(alter_item)
 
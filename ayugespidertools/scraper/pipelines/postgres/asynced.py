@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 from typing import TYPE_CHECKING, Any, cast
 
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
 from ayugespidertools.common.expend import PostgreSQLPipeEnhanceMixin
+from ayugespidertools.common.jsoncodec import init_asyncpg_connection
 from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.postgrespartition import (
+    AsyncPostgresPartitioner,
+    get_partition_conf,
+)
+from ayugespidertools.common.postgresschema import AsyncPostgresSchemaCache
 from ayugespidertools.common.sqlformat import GenPostgresqlAsyncpg
 from ayugespidertools.common.typevars import PortalTag
 from ayugespidertools.exceptions import NotConfigured
 from ayugespidertools.utils.database import PostgreSQLAsyncPortal
 
 try:
+    from asyncpg.connection import Connection  # noqa: TC002
     from asyncpg.pool import Pool as PGPool  # noqa: TC002
 except ImportError:
     raise NotConfigured(
@@ -25,12 +35,25 @@ if TYPE_CHECKING:
     from scrapy.crawler import Crawler
     from typing_extensions import Self
 
+    from ayugespidertools.common.expend import AsyncpgSqlKeyT
+    from ayugespidertools.common.typevars import AlterItem, BatchConf, slogT
     from ayugespidertools.spiders import AyuSpider
+    from ayugespidertools.utils.database import StatsPool
 
 
 class AyuAsyncPostgresPipeline(PostgreSQLPipeEnhanceMixin):
-    pool: PGPool
+    pool: PGPool | StatsPool
     crawler: Crawler
+    slog: slogT
+    batch_conf: BatchConf
+    buffer: BatchBuffer[AsyncpgSqlKeyT, AlterItem]
+    schema_cache: AsyncPostgresSchemaCache
+    batch_mode: str
+    flush_task: asyncio.Task | None = None
+    flushing: asyncio.Future | None = None
+    partitioner: AsyncPostgresPartitioner | None = None
+    staging_table: str = "_ayu_staging"
+    max_retry_times: int = 5
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -41,25 +64,197 @@ class AyuAsyncPostgresPipeline(PostgreSQLPipeEnhanceMixin):
     async def open_spider(self) -> None:
         spider = cast("AyuSpider", self.crawler.spider)
         assert hasattr(spider, "postgres_conf"), "未配置 PostgreSQL 连接信息！"
+        self.slog = spider.slog
+        self._connect(spider.postgres_conf).close()
         self.pool = await PostgreSQLAsyncPortal(
-            db_conf=spider.postgres_conf, tag=PortalTag.LIBRARY
+            db_conf=spider.postgres_conf,
+            tag=PortalTag.LIBRARY,
+            stats=self.crawler.stats,
+            init=init_asyncpg_connection,
         ).connect()
+        self.schema_cache = AsyncPostgresSchemaCache()
+        partition_conf = get_partition_conf(self.crawler.settings)
+        if partition_conf.enabled:
+            self.partitioner = AsyncPostgresPartitioner(partition_conf)
+
+        # 开启批量写入时，item 按数据表及字段缓存，达到阈值后使用 COPY 或 executemany 写入
+        settings = self.crawler.settings
+        self.batch_conf = get_batch_conf(settings, "POSTGRES_BATCH_CONFIG")
+        self.batch_mode = settings.get("POSTGRES_BATCH_MODE", "copy")
+        assert self.batch_mode in {"copy", "executemany"}, (
+            f"POSTGRES_BATCH_MODE 只支持 copy 或 executemany，当前为 {self.batch_mode}"
+        )
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_task = asyncio.create_task(self._flush_periodically())
 
     async def insert_item(self, item_dict: dict) -> None:
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not alter_item.new_item:
+            return
+
+        if self.partitioner:
+            alter_item = await self.partitioner.ensure_partitions(self.pool, alter_item)
+        sql = self._get_asyncpg_sql(self._get_asyncpg_sql_key(alter_item))
+        async with self.pool.acquire() as conn:
+            await self._execute(conn, sql, alter_item)
+
+    async def _execute(self, conn: Connection, sql: str, alter_item: AlterItem) -> None:
+        """写入单条数据，遇到表或字段缺失的问题时补全表结构后重试"""
+        table = alter_item.table.name
+        for _ in range(self.max_retry_times):
+            version = self.schema_cache.version(table)
+            try:
+                await self.schema_cache.ensure_columns(conn, alter_item)
+                await conn.execute(sql, *alter_item.new_item.values())
+            except Exception as e:
+                self.slog.warning(f"Pipe Warn: {e} & Table: {table}")
+                await self.schema_cache.deal_postgres_err(
+                    conn, str(e), alter_item, version
+                )
+            else:
+                return
+        raise Exception(f"PostgreSQL 写入重试 {self.max_retry_times} 次后仍然失败")
+
+    async def write_group(
+        self, key: AsyncpgSqlKeyT, alter_items: list[AlterItem]
+    ) -> None:
+        table = key[0]
         async with self.pool.acquire() as conn:
-            alter_item = ReuseOperation.reshape_item(item_dict)
-            sql, args = GenPostgresqlAsyncpg.upsert_generate(
-                db_table=alter_item.table.name,
-                conflict_cols=alter_item.conflict_cols,
-                data=alter_item.new_item,
-                update_cols=alter_item.update_keys,
+            for _ in range(self.max_retry_times):
+                version = self.schema_cache.version(table)
+                try:
+                    await self.schema_cache.ensure_columns(conn, alter_items[0])
+                    if self.batch_mode == "copy":
+                        await self.copy_items(conn, key, alter_items)
+                    else:
+                        await self.insert_items(conn, key, alter_items)
+                except Exception as e:
+                    self.slog.warning(f"Pipe Warn: {e} & Table: {table}")
+                    try:
+                        await self.schema_cache.deal_postgres_err(
+                            conn, str(e), alter_items[0], version
+                        )
+                    except Exception:
+                        break
+                else:
+                    return
+
+            # 不是表结构问题时，改为逐条写入，避免个别数据导致整批数据写入失败
+            self.slog.warning(f"数据表 {table} 批量写入失败，将逐条写入")
+            await self._insert_one_by_one(conn, key, alter_items)
+
+    async def insert_items(
+        self, conn: Connection, key: AsyncpgSqlKeyT, alter_items: list[AlterItem]
+    ) -> None:
+        """使用 executemany 在一个事务中批量写入 alter_items
+
+        结构相同的 item 共用同一条 sql，asyncpg 会将其缓存为连接上的 prepared statement，只需解析一次，
+        executemany 也会以管道的方式发送所有数据，整批只需少量的网络往返。
+
+        Args:
+            conn: asyncpg connection
+            key: alter_items 对应的数据表，字段，冲突字段及冲突时需要更新的字段
+            alter_items: 需要写入的数据
+        """
+        rows = [tuple(alter_item.new_item.values()) for alter_item in alter_items]
+        async with conn.transaction():
+            await conn.executemany(self._get_asyncpg_sql(key), rows)
+
+    async def copy_items(
+        self, conn: Connection, key: AsyncpgSqlKeyT, alter_items: list[AlterItem]
+    ) -> None:
+        """使用 COPY 将 alter_items 写入临时表，再通过一条 INSERT ... SELECT ... ON CONFLICT 合并到数据表中
+
+        Args:
+            conn: asyncpg connection
+            key: alter_items 对应的数据表，字段，冲突字段及冲突时需要更新的字段
+            alter_items: 需要写入的数据
+        """
+        table, keys, conflict_cols, update_cols = key
+        rows = [tuple(alter_item.new_item.values()) for alter_item in alter_items]
+        # 同一条 INSERT 语句不能多次更新同一行，冲突字段相同的数据只保留最后一条
+        indexes = [keys.index(col) for col in conflict_cols if col in keys]
+        if update_cols and indexes:
+            rows = list({tuple(row[i] for i in indexes): row for row in rows}.values())
+        create_sql, merge_sql = GenPostgresqlAsyncpg.copy_upsert_generate(
+            db_table=table,
+            staging_table=self.staging_table,
+            keys=list(keys),
+            conflict_cols=set(conflict_cols),
+            update_cols=set(update_cols),
+        )
+        async with conn.transaction():
+            await conn.execute(create_sql)
+            await conn.copy_records_to_table(
+                self.staging_table, records=rows, columns=keys
             )
-            await conn.execute(sql, *args)
+            await conn.execute(merge_sql)
+
+    async def _insert_one_by_one(
+        self, conn: Connection, key: AsyncpgSqlKeyT, alter_items: list[AlterItem]
+    ) -> None:
+        sql = self._get_asyncpg_sql(key)
+        for alter_item in alter_items:
+            try:
+                await self._execute(conn, sql, alter_item)
+            except Exception as e:
+                self.slog.error(
+                    f"Pipe Error: {e} & Table: {key[0]} & Item: {alter_item.new_item}"
+                )
+
+    def buffer_item(
+        self, alter_item: AlterItem
+    ) -> tuple[AsyncpgSqlKeyT, list[AlterItem]] | None:
+        key = self._get_asyncpg_sql_key(alter_item)
+        alter_items = self.buffer.add(
+            key, alter_item, estimate_size(alter_item.new_item)
+        )
+        return None if alter_items is None else (key, alter_items)
+
+    async def flush_expired(self) -> None:
+        for key, alter_items in self.buffer.pop_expired():
+            await self.write_group(key, alter_items)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_conf.interval)
+            self.flushing = asyncio.ensure_future(self.flush_expired())
+            try:
+                # 关闭时取消此任务不会中断正在进行的写入，close_spider 会等待其完成
+                await asyncio.shield(self.flushing)
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+            self.flushing = None
 
     async def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
-        await self.insert_item(item_dict)
+        if not self.batch_conf.enabled:
+            await self.insert_item(item_dict)
+            return item
+
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not alter_item.new_item:
+            return item
+
+        if self.partitioner:
+            alter_item = await self.partitioner.ensure_partitions(self.pool, alter_item)
+        if group := self.buffer_item(alter_item):
+            await self.write_group(*group)
         return item
 
     async def close_spider(self) -> None:
+        if self.flush_task:
+            self.flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.flush_task
+        if self.flushing:
+            # flush_expired 已从缓存中取出的分组不在 pop_all 中，需要等待其写入完成
+            try:
+                await self.flushing
+            except Exception as e:
+                self.slog.error(f"定时批量写入数据失败: {e}")
+        if self.batch_conf.enabled:
+            for key, alter_items in self.buffer.pop_all():
+                await self.write_group(key, alter_items)
         await self.pool.close()
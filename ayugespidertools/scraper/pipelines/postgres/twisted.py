@@ -1,25 +1,41 @@
 from __future__ import annotations
 
+from functools import partial
 from typing import TYPE_CHECKING, Any, cast
 
+from scrapy.utils.defer import maybe_deferred_to_future
 from twisted.enterprise import adbapi
+from twisted.internet import task
+from twisted.internet.defer import DeferredList
 
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
 from ayugespidertools.common.expend import PostgreSQLPipeEnhanceMixin
+from ayugespidertools.common.jsoncodec import register_psycopg_json
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.postgreserrhandle import (
     TwistedAsynchronous,
     deal_postgres_err,
 )
+from ayugespidertools.common.postgrespartition import (
+    PostgresPartitioner,
+    get_partition_conf,
+)
 from ayugespidertools.common.sqlformat import GenPostgresql
 
 __all__ = ["AyuTwistedPostgresPipeline"]
 
 if TYPE_CHECKING:
     from scrapy.crawler import Crawler
+    from twisted.internet.defer import Deferred
     from twisted.python.failure import Failure
     from typing_extensions import Self
 
-    from ayugespidertools.common.typevars import PostgreSQLConf, slogT
+    from ayugespidertools.common.typevars import (
+        AlterItem,
+        BatchConf,
+        PostgreSQLConf,
+        slogT,
+    )
     from ayugespidertools.spiders import AyuSpider
 
 
@@ -28,6 +44,12 @@ class AyuTwistedPostgresPipeline(PostgreSQLPipeEnhanceMixin):
     dbpool: adbapi.ConnectionPool
     slog: slogT
     crawler: Crawler
+    batch_conf: BatchConf
+    buffer: BatchBuffer[tuple, AlterItem]
+    flush_loop: task.LoopingCall | None = None
+    running_queries: set[Deferred]
+    partitioner: PostgresPartitioner | None = None
+    list_as_jsonb: bool = False
 
     @classmethod
     def from_crawler(cls, crawler: Crawler) -> Self:
@@ -41,6 +63,9 @@ class AyuTwistedPostgresPipeline(PostgreSQLPipeEnhanceMixin):
         self.slog = spider.slog
         self.postgres_conf = spider.postgres_conf
         self._connect(self.postgres_conf).close()
+        self.list_as_jsonb = self.crawler.settings.getbool(
+            "POSTGRES_LIST_AS_JSONB", False
+        )
 
         _postgres_conf = {
             "user": self.postgres_conf.user,
@@ -50,27 +75,154 @@ class AyuTwistedPostgresPipeline(PostgreSQLPipeEnhanceMixin):
             "dbname": self.postgres_conf.database,
         }
         self.dbpool = adbapi.ConnectionPool(
-            "psycopg", cp_reconnect=True, **_postgres_conf
+            "psycopg",
+            cp_reconnect=True,
+            cp_openfun=partial(register_psycopg_json, list_as_jsonb=self.list_as_jsonb),
+            **_postgres_conf,
         )
         query = self.dbpool.runInteraction(self.db_create)
         query.addErrback(self.db_create_err)
 
+        self.running_queries = set()
+        partition_conf = get_partition_conf(self.crawler.settings)
+        if partition_conf.enabled:
+            self.partitioner = PostgresPartitioner(partition_conf)
+        self.batch_conf = get_batch_conf(self.crawler.settings, "POSTGRES_BATCH_CONFIG")
+        if self.batch_conf.enabled:
+            self.buffer = BatchBuffer(self.batch_conf)
+            self.flush_loop = task.LoopingCall(self.flush_expired)
+            self.flush_loop.start(self.batch_conf.interval, now=False).addErrback(
+                self._flush_loop_err
+            )
+
     def db_create(self, cursor: Any) -> None: ...
 
     def db_create_err(self, failure: Failure) -> None:
         self.slog.error(f"创建数据表失败: {failure}")
 
+    def _flush_loop_err(self, failure: Failure) -> None:
+        self.slog.error(f"PostgreSQL 定时批量写入失败: {failure}")
+
     def process_item(self, item: Any) -> Any:
         item_dict = ReuseOperation.item_to_dict(item)
+        if self.batch_conf.enabled:
+            self.buffer_item(item_dict)
+            return item
+
         query = self.dbpool.runInteraction(self.db_insert, item_dict)
         query.addErrback(self.handle_error, item)
+        self._track(query)
         return item
 
+    def _track(self, query: Deferred) -> None:
+        """记录未完成的写入，close_spider 时需要等待其完成"""
+        self.running_queries.add(query)
+        query.addBoth(self._untrack, query)
+
+    def _untrack(self, result: Any, query: Deferred) -> Any:
+        self.running_queries.discard(query)
+        return result
+
+    def buffer_item(self, item_dict: dict) -> None:
+        """将 item 按数据表，字段及冲突处理规则分组缓存，分组满足阈值时在一个事务中批量写入"""
+        alter_item = ReuseOperation.reshape_item(item_dict)
+        if not (new_item := alter_item.new_item):
+            return
+
+        key = (
+            alter_item.table.name,
+            tuple(new_item),
+            tuple(sorted(alter_item.conflict_cols)),
+            tuple(sorted(alter_item.update_keys or ())),
+        )
+        if alter_items := self.buffer.add(key, alter_item, estimate_size(new_item)):
+            self.insert_group(alter_items)
+
+    def flush_expired(self) -> None:
+        for _, alter_items in self.buffer.pop_expired():
+            self.insert_group(alter_items)
+
+    def insert_group(self, alter_items: list[AlterItem]) -> None:
+        query = self.dbpool.runInteraction(self.db_insert_many, alter_items)
+        query.addErrback(self.handle_group_error, alter_items)
+        self._track(query)
+
+    def db_insert_many(self, cursor: Any, alter_items: list[AlterItem]) -> None:
+        """在同一个事务中用 executemany 写入结构相同的一组 item
+
+        libpq 支持时 psycopg 的 executemany 会自动使用 pipeline 模式，减少批量写入时的网络往返。
+
+        Args:
+            cursor: twisted Transaction
+            alter_items: 需要写入的同一分组的 item
+        """
+        if self.partitioner:
+            alter_items = [
+                self.partitioner.ensure_partitions(cursor.connection, alter_item)
+                for alter_item in alter_items
+            ]
+        first_item = alter_items[0]
+        _table_name = first_item.table.name
+        sql, _ = GenPostgresql.upsert_generate(
+            db_table=_table_name,
+            conflict_cols=first_item.conflict_cols,
+            data=first_item.new_item,
+            update_cols=first_item.update_keys,
+        )
+        args_list = [tuple(alter_item.new_item.values()) for alter_item in alter_items]
+
+        try:
+            cursor.executemany(sql, args_list)
+        except Exception as e:
+            self.slog.warning(
+                f"Pipe Warn: {e} & Table: {_table_name} & Items: {len(alter_items)}"
+            )
+            cursor.execute("ROLLBACK")
+            try:
+                deal_postgres_err(
+                    TwistedAsynchronous(),
+                    err_msg=str(e),
+                    cursor=cursor,
+                    table=_table_name,
+                    table_notes=first_item.table.notes,
+                    note_dic=first_item.notes_dic,
+                    new_item=first_item.new_item,
+                    list_as_jsonb=self.list_as_jsonb,
+                )
+            except Exception:
+                # 不是表结构问题时，每条数据在各自的 savepoint 中重新写入，只丢弃写入失败的数据
+                self._insert_one_by_one(cursor, sql, args_list, _table_name)
+                return None
+            return self.db_insert_many(cursor, alter_items)
+
+    def _insert_one_by_one(
+        self, cursor: Any, sql: str, args_list: list[tuple], table: str
+    ) -> None:
+        conn = cursor.connection
+        with conn.transaction():
+            for args in args_list:
+                try:
+                    # 嵌套的 transaction 为 savepoint，写入失败时只回滚此条数据
+                    with conn.transaction():
+                        cursor.execute(sql, args)
+                except Exception as e:
+                    self.slog.error(f"Pipe Error: {e} & Table: {table} & Item: {args}")
+
+    def handle_group_error(
+        self, failure: Failure, alter_items: list[AlterItem]
+    ) -> None:
+        self.slog.error(f"批量插入数据失败:{failure}, items: {len(alter_items)}")
+
     def db_insert(self, cursor: Any, item: Any) -> Any:
         alter_item = ReuseOperation.reshape_item(item)
         if not (new_item := alter_item.new_item):
             return None
 
+        if self.partitioner:
+            alter_item = self.partitioner.ensure_partitions(
+                cursor.connection, alter_item
+            )
+            new_item = alter_item.new_item
         _table_name = alter_item.table.name
         _table_notes = alter_item.table.notes
         note_dic = alter_item.notes_dic
@@ -96,8 +248,20 @@ class AyuTwistedPostgresPipeline(PostgreSQLPipeEnhanceMixin):
                 table=_table_name,
                 table_notes=_table_notes,
                 note_dic=note_dic,
+                new_item=new_item,
+                list_as_jsonb=self.list_as_jsonb,
             )
             return self.db_insert(cursor, item)
 
     def handle_error(self, failure: Failure, item: Any) -> None:
         self.slog.error(f"插入数据失败:{failure}, item: {item}")
+
+    async def close_spider(self) -> None:
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.batch_conf.enabled:
+            for _, alter_items in self.buffer.pop_all():
+                self.insert_group(alter_items)
+        if self.running_queries:
+            await maybe_deferred_to_future(DeferredList(list(self.running_queries)))
+        self.dbpool.close()
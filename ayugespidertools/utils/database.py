@@ -4,6 +4,7 @@ import asyncio
 import hashlib
 import json
 import threading
+import time
 import urllib.parse
 from typing import TYPE_CHECKING, Any, Generic, NamedTuple, TypeVar
 
@@ -52,15 +53,20 @@ __all__ = [
     "PostgreSQLPortal",
     "RabbitMQAsyncPortal",
     "RabbitMQPortal",
+    "StatsPool",
 ]
 
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Generator
+
     from aio_pika.abc import AbstractRobustConnection
     from aiomysql import Pool as MysqlPool
+    from asyncpg.connection import Connection as PGConnection
     from motor.motor_asyncio import AsyncIOMotorDatabase
     from psycopg.connection import Connection as PsycopgConnection
     from pymongo import MongoClient, database
     from pymysql.connections import Connection as PymysqlConnection
+    from scrapy.statscollectors import StatsCollector
 
 DataBaseConf = TypeVar(
     "DataBaseConf",
@@ -116,6 +122,87 @@ class PortalSingletonMeta(type, Generic[T, DataBaseConf]):
         return cls._instances[unique_id]
 
 
+class _StatsPoolAcquireContext:
+    """StatsPool.acquire 的返回值，与 aiomysql 和 asyncpg 一样支持 await 及 async with 两种用法"""
+
+    __slots__ = ("_conn", "_pool")
+
+    def __init__(self, pool: StatsPool) -> None:
+        self._pool = pool
+        self._conn: Any = None
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        return self._pool._acquire().__await__()
+
+    async def __aenter__(self) -> Any:
+        self._conn = await self._pool._acquire()
+        return self._conn
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class StatsPool:
+    """代理 aiomysql 或 asyncpg 的连接池，将连接池的使用情况记录到 crawler stats 中
+
+    只在传入了 stats 或配置了 pool_timeout 时才会使用此代理。除 acquire 外的属性及方法（包括 release）都直接
+    使用原连接池的，acquire 与原连接池一样支持 ``conn = await pool.acquire()`` 和 ``async with
+    pool.acquire() as conn`` 两种用法。记录的 stats 如下（prefix 为 mysql/pool 等）：
+        - {prefix}/size: 连接池当前的连接数
+        - {prefix}/idle: 最近一次获取连接时空闲的连接数
+        - {prefix}/acquire_count: 获取连接的次数
+        - {prefix}/acquire_wait_ms: 获取连接的总等待时间，单位为毫秒
+        - {prefix}/acquire_wait_max_ms: 单次获取连接的最长等待时间，单位为毫秒
+        - {prefix}/acquire_timeouts: 获取连接超时的次数
+    """
+
+    def __init__(
+        self,
+        pool: MysqlPool | PGPool,
+        prefix: str,
+        stats: StatsCollector | None = None,
+        timeout: float | None = None,
+    ) -> None:
+        self._pool = pool
+        self.prefix = prefix
+        self.stats = stats
+        self.timeout = timeout
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def _get_size(self) -> tuple[int, int]:
+        # aiomysql 的连接池为 size 和 freesize 属性，asyncpg 的为 get_size 和 get_idle_size 方法
+        if hasattr(self._pool, "get_size"):
+            return self._pool.get_size(), self._pool.get_idle_size()
+        return self._pool.size, self._pool.freesize
+
+    def acquire(self) -> _StatsPoolAcquireContext:
+        return _StatsPoolAcquireContext(self)
+
+    async def _acquire(self) -> Any:
+        if self.stats is not None:
+            size, idle = self._get_size()
+            self.stats.set_value(f"{self.prefix}/size", size)
+            self.stats.set_value(f"{self.prefix}/idle", idle)
+
+        start = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            if self.stats is not None:
+                self.stats.inc_value(f"{self.prefix}/acquire_timeouts")
+            raise
+
+        if self.stats is not None:
+            wait_ms = round((time.perf_counter() - start) * 1000, 3)
+            self.stats.inc_value(f"{self.prefix}/acquire_count")
+            self.stats.inc_value(f"{self.prefix}/acquire_wait_ms", wait_ms)
+            self.stats.max_value(f"{self.prefix}/acquire_wait_max_ms", wait_ms)
+        return conn
+
+
 class MysqlPortal(metaclass=PortalSingletonMeta):
     def __init__(
         self,
@@ -143,14 +230,16 @@ class MysqlAsyncPortal(metaclass=PortalSingletonMeta):
         db_conf: MysqlConf,
         tag: PortalTag = PortalTag.DEFAULT,
         singleton: bool = False,
+        stats: StatsCollector | None = None,
     ):
         self.db_conf = db_conf
-        self._pool: MysqlPool | None = None
+        self._pool: MysqlPool | StatsPool | None = None
         self._init_lock = asyncio.Lock()
         self.singleton = singleton
+        self.stats = stats
 
-    async def _create_pool(self) -> MysqlPool:
-        return await aiomysql.create_pool(
+    async def _create_pool(self) -> MysqlPool | StatsPool:
+        pool = await aiomysql.create_pool(
             host=self.db_conf.host,
             port=self.db_conf.port,
             user=self.db_conf.user,
@@ -159,9 +248,15 @@ class MysqlAsyncPortal(metaclass=PortalSingletonMeta):
             charset=self.db_conf.charset,
             cursorclass=aiomysql.DictCursor,
             autocommit=True,
+            minsize=self.db_conf.pool_min_size,
+            maxsize=self.db_conf.pool_max_size,
+            pool_recycle=self.db_conf.pool_recycle,
         )
+        if self.stats is None and self.db_conf.pool_timeout is None:
+            return pool
+        return StatsPool(pool, "mysql/pool", self.stats, self.db_conf.pool_timeout)
 
-    async def connect(self) -> MysqlPool:
+    async def connect(self) -> MysqlPool | StatsPool:
         if not self.singleton:
             return await self._create_pool()
 
@@ -409,11 +504,22 @@ class OracleAsyncPortal(metaclass=PortalSingletonMeta):
             service_name=db_conf.service_name,
             disable_oob=db_conf.disable_oob,
             mode=oracle_authentication_mode,
+            min=db_conf.pool_min,
+            max=db_conf.pool_max,
+            increment=db_conf.pool_increment,
         )
 
     def connect(self) -> oracledb.AsyncConnectionPool:
         return self.pool
 
+    async def warmup(self) -> None:
+        """预先建立连接池的最小连接数，避免在爬取过程中的写入时才建立连接"""
+        conns = await asyncio.gather(
+            *(self.pool.acquire() for _ in range(self.pool.min))
+        )
+        for conn in conns:
+            await self.pool.release(conn)
+
     async def close(self) -> None:
         await self.pool.close()
 
@@ -457,19 +563,32 @@ class PostgreSQLAsyncPortal(metaclass=PortalSingletonMeta):
         db_conf: PostgreSQLConf,
         tag: PortalTag = PortalTag.DEFAULT,
         singleton: bool = False,
+        stats: StatsCollector | None = None,
+        init: Callable[[PGConnection], Awaitable[None]] | None = None,
     ):
         self.db_conf = db_conf
-        self._pool: PGPool | None = None
+        self._pool: PGPool | StatsPool | None = None
         self._init_lock = asyncio.Lock()
         self.singleton = singleton
+        self.stats = stats
+        # 连接池中每个新建连接的初始化回调，比如注册 jsonb 编解码
+        self.init = init
 
-    async def _create_pool(self) -> PGPool:
-        return await asyncpg.create_pool(
+    async def _create_pool(self) -> PGPool | StatsPool:
+        pool = await asyncpg.create_pool(
             f"postgresql://{self.db_conf.user}:{self.db_conf.password}"
-            f"@{self.db_conf.host}:{self.db_conf.port}/{self.db_conf.database}"
+            f"@{self.db_conf.host}:{self.db_conf.port}/{self.db_conf.database}",
+            min_size=self.db_conf.pool_min_size,
+            max_size=self.db_conf.pool_max_size,
+            statement_cache_size=self.db_conf.statement_cache_size,
+            max_inactive_connection_lifetime=self.db_conf.max_inactive_lifetime,
+            init=self.init,
         )
+        if self.stats is None and self.db_conf.pool_timeout is None:
+            return pool
+        return StatsPool(pool, "postgresql/pool", self.stats, self.db_conf.pool_timeout)
 
-    async def connect(self) -> PGPool:
+    async def connect(self) -> PGPool | StatsPool:
         if not self.singleton:
             return await self._create_pool()
 
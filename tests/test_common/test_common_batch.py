@@ -0,0 +1,49 @@
+import time
+
+from scrapy.settings import Settings
+
+from ayugespidertools.common.batch import BatchBuffer, estimate_size, get_batch_conf
+from ayugespidertools.common.typevars import BatchConf
+
+
+def test_get_batch_conf():
+    batch_conf = get_batch_conf(Settings(), "MYSQL_BATCH_CONFIG")
+    assert batch_conf == BatchConf()
+    assert not batch_conf.enabled
+
+    settings = Settings({"MYSQL_BATCH_CONFIG": {"size": 100, "interval": 2}})
+    batch_conf = get_batch_conf(settings, "MYSQL_BATCH_CONFIG")
+    assert batch_conf.enabled
+    assert batch_conf.size == 100
+    assert batch_conf.interval == 2
+
+
+def test_estimate_size():
+    assert estimate_size({"a": "abc", "b": 10, "c": None}) == 5
+    assert estimate_size(("abc", b"\x00\x01")) == 5
+
+
+def test_batch_buffer_size_limit():
+    buffer = BatchBuffer(BatchConf(size=2))
+    assert buffer.add("ta", {"a": 1}) is None
+    assert buffer.add("tb", {"b": 1}) is None
+    assert len(buffer) == 2
+    assert buffer.add("ta", {"a": 2}) == [{"a": 1}, {"a": 2}]
+    assert len(buffer) == 1
+    assert buffer.pop_all() == [("tb", [{"b": 1}])]
+    assert len(buffer) == 0
+
+
+def test_batch_buffer_bytes_limit():
+    buffer = BatchBuffer(BatchConf(size=100, max_bytes=10))
+    assert buffer.add("ta", "x", size=6) is None
+    assert buffer.add("ta", "y", size=6) == ["x", "y"]
+
+
+def test_batch_buffer_pop_expired():
+    buffer = BatchBuffer(BatchConf(size=100, interval=0.05))
+    buffer.add("ta", {"a": 1})
+    time.sleep(0.06)
+    buffer.add("tb", {"b": 1})
+    assert buffer.pop_expired() == [("ta", [{"a": 1}])]
+    assert buffer.pop_all() == [("tb", [{"b": 1}])]
@@ -1,9 +1,14 @@
+import oracledb
+
 from ayugespidertools.common.expend import (
     MysqlPipeEnhanceMixin,
     OraclePipeEnhanceMixin,
     PostgreSQLPipeEnhanceMixin,
+    get_oracle_input_sizes,
 )
+from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.items import DataItem
 from tests import PYMYSQL_CONFIG
 
 
@@ -31,13 +36,29 @@ class TestDatabasePipeEnhanceMixin:
         )
         assert no_odku_sql == expect_no_odku_sql, args == ("zhangsan", 18)
         sql, args = self.mpem._get_sql_by_item(
-            self._table, self._item, True, duplicate={"age": 22}
+            self._table, self._item, True, duplicate={"age": 18}
         )
         expect_odku_sql = (
             "INSERT INTO `demo_one` (`nick_name`, `age`) values (%s, %s)"
-            " ON DUPLICATE KEY UPDATE  `age` = %s"
+            " ON DUPLICATE KEY UPDATE `age` = VALUES(`age`)"
+        )
+        assert sql == expect_odku_sql
+        assert args == ("zhangsan", 18)
+        # 更新字段按 item 中的字段顺序，不在 item 中的字段会被忽略
+        sql, args = self.mpem._get_sql_by_item(
+            self._table, self._item, True, duplicate={"age", "nick_name", "other"}
         )
-        assert sql == expect_odku_sql, args == ("zhangsan", 18, 22)
+        expect_odku_sql = (
+            "INSERT INTO `demo_one` (`nick_name`, `age`) values (%s, %s)"
+            " ON DUPLICATE KEY UPDATE `nick_name` = VALUES(`nick_name`),"
+            " `age` = VALUES(`age`)"
+        )
+        assert sql == expect_odku_sql
+        assert args == ("zhangsan", 18)
+        sql, _ = self.mpem._get_sql_by_item(
+            self._table, self._item, False, duplicate={"age"}
+        )
+        assert sql == expect_no_odku_sql
 
     def test_postgresql_get_sql_by_item(self):
         sql = self.ppem._get_sql_by_item(self._table, self._item)
@@ -48,9 +69,59 @@ class TestDatabasePipeEnhanceMixin:
         sql = self.ppem._get_sql_by_item(self._table, self._item, is_psycopg=True)
         assert sql == "INSERT INTO demo_one (nick_name, age) values (%s, %s);"
 
+    def test_postgresql_get_asyncpg_sql(self):
+        alter_item = ReuseOperation.reshape_item(
+            {
+                "_table": DataItem(self._table),
+                "_conflict_cols": {"nick_name"},
+                "_update_keys": {"age"},
+                **{k: DataItem(v) for k, v in self._item.items()},
+            }
+        )
+        key = self.ppem._get_asyncpg_sql_key(alter_item)
+        assert key == (self._table, ("nick_name", "age"), ("nick_name",), ("age",))
+        sql = self.ppem._get_asyncpg_sql(key)
+        assert (
+            sql
+            == "INSERT INTO demo_one (nick_name, age) VALUES ($1, $2) ON CONFLICT (nick_name) DO UPDATE SET age = EXCLUDED.age;"
+        )
+        # 相同结构的 item 复用缓存的 sql
+        assert self.ppem._get_asyncpg_sql(key) is sql
+
     def test_oracle_get_sql_by_item(self):
         sql = self.opem._get_sql_by_item(self._table, self._item)
         assert (
             sql
             == 'INSERT INTO "demo_one" ("nick_name", "age") values (:nick_name, :age)'
         )
+
+    def test_oracle_prepare_merge_many(self):
+        class FakeCursor:
+            input_sizes = None
+
+            def setinputsizes(self, *args):
+                self.input_sizes = args
+
+        self.opem.input_sizes = {}
+        cursor = FakeCursor()
+        key = (self._table, ("nick_name", "age"), (), ())
+        sql = self.opem._prepare_merge_many(cursor, key, [("zhangsan", 18)])
+        assert sql == ('INSERT INTO "demo_one" ("nick_name", "age") VALUES (:1, :2)')
+        assert cursor.input_sizes == (8, None)
+
+        # 之后的批次只会扩大已缓存的 input sizes
+        self.opem._prepare_merge_many(cursor, key, [("lisi", 20), ("a" * 5000, 1)])
+        assert cursor.input_sizes == (oracledb.DB_TYPE_CLOB, None)
+
+
+def test_get_oracle_input_sizes():
+    rows = [("a", b"x", 1, None), ("abcd", b"x" * 3000, 2, None)]
+    assert get_oracle_input_sizes(rows) == [4, oracledb.DB_TYPE_BLOB, None, None]
+    assert get_oracle_input_sizes(
+        [("ab", b"", 1, None)], cached=[10, None, None, None]
+    ) == [
+        10,
+        None,
+        None,
+        None,
+    ]
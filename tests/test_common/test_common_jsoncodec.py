@@ -0,0 +1,80 @@
+import asyncio
+
+import psycopg
+import pytest
+from psycopg.adapt import AdaptersMap, PyFormat
+
+from ayugespidertools.common.jsoncodec import (
+    init_asyncpg_connection,
+    json_loads,
+    register_psycopg_json,
+)
+
+
+class FakeAsyncpgConnection:
+    def __init__(self):
+        self.codecs = {}
+
+    async def set_type_codec(self, typename, *, encoder, decoder, schema, format):
+        assert schema == "pg_catalog" and format == "binary"
+        self.codecs[typename] = (encoder, decoder)
+
+
+class FakePsycopgConnection:
+    connection = None
+
+    def __init__(self):
+        self.adapters = AdaptersMap(psycopg.adapters)
+
+
+def test_init_asyncpg_connection():
+    conn = FakeAsyncpgConnection()
+    asyncio.run(init_asyncpg_connection(conn))
+    data = {"tags": ["a", "中"], "num": 1}
+
+    encoder, decoder = conn.codecs["jsonb"]
+    assert encoder(data)[:1] == b"\x01"
+    assert decoder(encoder(data)) == data
+    encoder, decoder = conn.codecs["json"]
+    assert json_loads(encoder(data)) == data
+    assert decoder(encoder(data)) == data
+
+
+def test_init_asyncpg_connection_str_value():
+    # 已序列化的 str 值原样写入，不会被重复序列化为 json 字符串
+    conn = FakeAsyncpgConnection()
+    asyncio.run(init_asyncpg_connection(conn))
+    value = '{"tags": ["a", "中"], "num": 1}'
+
+    encoder, decoder = conn.codecs["jsonb"]
+    assert encoder(value) == b"\x01" + value.encode()
+    assert decoder(encoder(value)) == {"tags": ["a", "中"], "num": 1}
+    encoder, decoder = conn.codecs["json"]
+    assert encoder(value) == value.encode()
+    assert decoder(encoder(value.encode())) == {"tags": ["a", "中"], "num": 1}
+
+
+def test_register_psycopg_json():
+    conn = FakePsycopgConnection()
+    register_psycopg_json(conn)
+    dumper_cls = conn.adapters.get_dumper(dict, PyFormat.BINARY)
+    dumper = dumper_cls(dict, conn)
+    assert dumper.oid == psycopg.adapters.types["jsonb"].oid
+    assert json_loads(bytes(dumper.dump({"a": [1, 2]}))[1:]) == {"a": [1, 2]}
+
+    # list 默认仍作为数组写入
+    dumper_cls = conn.adapters.get_dumper(list, PyFormat.BINARY)
+    assert dumper_cls is psycopg.adapters.get_dumper(list, PyFormat.BINARY)
+
+    # 未注册的连接不受影响
+    with pytest.raises(psycopg.ProgrammingError):
+        psycopg.adapters.get_dumper(dict, PyFormat.BINARY)
+
+
+def test_register_psycopg_json_list_as_jsonb():
+    conn = FakePsycopgConnection()
+    register_psycopg_json(conn, list_as_jsonb=True)
+    dumper_cls = conn.adapters.get_dumper(list, PyFormat.BINARY)
+    dumper = dumper_cls(list, conn)
+    assert dumper.oid == psycopg.adapters.types["jsonb"].oid
+    assert json_loads(bytes(dumper.dump([{"a": 1}, "b"]))[1:]) == [{"a": 1}, "b"]
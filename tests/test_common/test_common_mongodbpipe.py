@@ -1,6 +1,10 @@
 import pytest
 
-from ayugespidertools.common.mongodbpipe import SyncStorageHandler, store_process
+from ayugespidertools.common.mongodbpipe import (
+    MongoIndexCache,
+    SyncStorageHandler,
+    store_process,
+)
 from ayugespidertools.common.multiplexing import ReuseOperation
 from ayugespidertools.items import AyuItem, DataItem
 from tests.conftest import generate_random_code, mongodb_database, test_table
@@ -103,3 +107,69 @@ class TestMongoDBPipe:
             {"article_detail_url": "_article_detail_url"}
         )
         assert num >= 2
+
+
+class FakeCollection:
+    def __init__(self, indexes, fail_times=0):
+        self.indexes = indexes
+        self.fail_times = fail_times
+        self.created = []
+
+    def index_information(self):
+        return self.indexes
+
+    def create_index(self, keys, **kwargs):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("E11000 duplicate key error")
+        self.created.append((keys, kwargs))
+
+
+def test_mongo_index_cache():
+    collection = FakeCollection(
+        {"_id_": {"key": [("_id", 1)]}, "a_1_b_1": {"key": [("a", 1), ("b", 1)]}}
+    )
+    db = {test_table: collection}
+    index_cache = MongoIndexCache(unique=True)
+
+    # 已有可用的索引时不会创建
+    for update_rule in ({"_id": 1}, {"b": 1, "a": 2}):
+        keys = index_cache.pending(test_table, {"_update_rule": update_rule})
+        index_cache.ensure_index(db, test_table, keys)
+    assert collection.created == []
+
+    keys = index_cache.pending(test_table, {"_update_rule": {"article_title": "t"}})
+    # 正在处理的查询字段不会重复返回
+    assert (
+        index_cache.pending(test_table, {"_update_rule": {"article_title": 1}}) is None
+    )
+    index_cache.ensure_index(db, test_table, keys)
+    assert collection.created == [([("article_title", 1)], {"unique": True})]
+
+    # 已处理过的查询字段及没有 _update_rule 的 item 不需要处理
+    assert (
+        index_cache.pending(test_table, {"_update_rule": {"article_title": 1}}) is None
+    )
+    assert index_cache.pending(test_table, {"article_title": 1}) is None
+
+
+def test_mongo_index_cache_retry():
+    collection = FakeCollection({}, fail_times=1)
+    db = {test_table: collection}
+    index_cache = MongoIndexCache(max_attempts=2)
+    item_dict = {"_update_rule": {"article_title": 1}}
+
+    # 创建失败时不会缓存，之后的 item 会再次尝试
+    index_cache.ensure_index(db, test_table, index_cache.pending(test_table, item_dict))
+    assert collection.created == []
+    index_cache.ensure_index(db, test_table, index_cache.pending(test_table, item_dict))
+    assert collection.created == [([("article_title", 1)], {"unique": False})]
+    assert index_cache.pending(test_table, item_dict) is None
+
+    # 失败次数达到上限后不再尝试
+    collection = FakeCollection({}, fail_times=2)
+    for _ in range(2):
+        keys = index_cache.pending("other", item_dict)
+        index_cache.ensure_index({"other": collection}, "other", keys)
+    assert index_cache.pending("other", item_dict) is None
+    assert collection.created == []
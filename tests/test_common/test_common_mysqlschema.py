@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.mysqlerrhandle import Synchronize
+from ayugespidertools.common.mysqlschema import AsyncMysqlSchemaCache, MysqlSchemaCache
+from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.items import DataItem
+
+
+class FakeCursor:
+    def __init__(self, columns):
+        self.columns = columns
+        self.sqls = []
+
+    def execute(self, sql, args=None):
+        self.sqls.append(sql)
+
+    def fetchall(self):
+        return [{"COLUMN_NAME": col} for col in self.columns]
+
+
+def _get_alter_item(**fields):
+    return ReuseOperation.reshape_item(
+        {
+            "_table": DataItem("_article_info_list", "文章信息"),
+            **{k: DataItem(v, f"{k} 注释") for k, v in fields.items()},
+        }
+    )
+
+
+def test_mysql_schema_cache():
+    mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    cursor = FakeCursor(["id", "title"])
+    schema_cache = MysqlSchemaCache(mysql_conf, Synchronize())
+
+    schema_cache.ensure_columns(cursor, _get_alter_item(title="t", url="u", num=1))
+    assert len(cursor.sqls) == 2
+    assert cursor.sqls[-1] == (
+        "ALTER TABLE `_article_info_list` ADD COLUMN `url` VARCHAR(255) NULL"
+        " DEFAULT '' COMMENT 'url 注释', ADD COLUMN `num` BIGINT NULL"
+        " DEFAULT NULL COMMENT 'num 注释';"
+    )
+
+    # 已缓存的字段不会再次查询或添加
+    schema_cache.ensure_columns(cursor, _get_alter_item(title="t", url="u", num=2))
+    assert len(cursor.sqls) == 2
+
+    schema_cache.invalidate("_article_info_list")
+    schema_cache.ensure_columns(cursor, _get_alter_item(title="t"))
+    assert len(cursor.sqls) == 3
+
+
+class FakeAsyncCursor:
+    def __init__(self, columns, column_types=None):
+        self.columns = columns
+        self.column_types = column_types or {}
+        self.sqls = []
+
+    async def execute(self, sql, args=None):
+        self.sqls.append(sql)
+        if sql.startswith("ALTER TABLE"):
+            await asyncio.sleep(0.01)
+
+    async def fetchall(self):
+        return [
+            (col, self.column_types.get(col, "varchar(255)")) for col in self.columns
+        ]
+
+
+async def _check_async_mysql_schema_cache():
+    mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    cursor = FakeAsyncCursor(["id", "title"])
+    schema_cache = AsyncMysqlSchemaCache(mysql_conf)
+    alter_item = _get_alter_item(title="t", url="u")
+
+    await asyncio.gather(
+        *(schema_cache.ensure_columns(cursor, alter_item) for _ in range(5))
+    )
+    assert [sql for sql in cursor.sqls if sql.startswith("ALTER")] == [
+        "ALTER TABLE `_article_info_list` ADD COLUMN `url` VARCHAR(255) NULL"
+        " DEFAULT '' COMMENT 'url 注释';"
+    ]
+
+    # 多个协程同时遇到同一个报错时，只有一个协程会执行 DDL
+    version = schema_cache.version("_article_info_list")
+    err_msg = "(1406, \"Data too long for column 'url' at row 1\")"
+    await asyncio.gather(
+        *(
+            schema_cache.deal_mysql_err(cursor, err_msg, alter_item, version)
+            for _ in range(5)
+        )
+    )
+    assert len([sql for sql in cursor.sqls if "CHANGE COLUMN" in sql]) == 1
+    assert schema_cache.version("_article_info_list") == version + 1
+
+
+def test_async_mysql_schema_cache():
+    asyncio.run(_check_async_mysql_schema_cache())
+
+
+async def _check_async_mysql_incorrect_value():
+    mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    cursor = FakeAsyncCursor(["id", "num", "title"], {"num": "int(11)"})
+    schema_cache = AsyncMysqlSchemaCache(mysql_conf)
+    alter_item = _get_alter_item(num=1, title="t")
+    await schema_cache.ensure_columns(cursor, alter_item)
+
+    # 数值超出范围时放宽为同类的更大类型，不会修改为 TEXT
+    err_msg = "(1264, \"Out of range value for column 'num' at row 1\")"
+    version = schema_cache.version("_article_info_list")
+    await schema_cache.deal_mysql_err(cursor, err_msg, alter_item, version)
+    assert cursor.sqls[-1] == (
+        "ALTER TABLE `_article_info_list` MODIFY COLUMN `num` BIGINT"
+        " NULL DEFAULT NULL COMMENT 'num 注释';"
+    )
+
+    # 值与字段类型不是同一类时跳过此条数据，不修改表结构
+    sql_count = len(cursor.sqls)
+    err_msg = "(1366, \"Incorrect integer value: 'abc' for column 'num' at row 1\")"
+    version = schema_cache.version("_article_info_list")
+    with pytest.raises(Exception, match="跳过此条数据"):
+        await schema_cache.deal_mysql_err(cursor, err_msg, alter_item, version)
+    assert len(cursor.sqls) == sql_count
+
+
+def test_async_mysql_incorrect_value():
+    asyncio.run(_check_async_mysql_incorrect_value())
@@ -0,0 +1,124 @@
+import contextlib
+import datetime
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.postgrespartition import PostgresPartitioner
+from ayugespidertools.common.sqlformat import GenPostgresql
+from ayugespidertools.common.typevars import PartitionConf
+from ayugespidertools.items import AyuItem, DataItem
+
+
+class FakeCursor:
+    def __init__(self, row=None):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None, column_type="timestamp without time zone"):
+        self.fail_on = fail_on
+        self.column_type = column_type
+        self.sqls = []
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield
+
+    def execute(self, sql, *args):
+        if self.fail_on and self.fail_on in sql:
+            raise Exception(f'"{self.fail_on}" is not partitioned')
+        if sql.startswith("SELECT format_type"):
+            return FakeCursor((self.column_type,))
+        self.sqls.append(sql)
+        return FakeCursor()
+
+
+def _get_alter_item(**fields):
+    return ReuseOperation.reshape_item(
+        {
+            "_table": DataItem("_article_info_list", "文章信息"),
+            **{k: DataItem(v, f"{k} 注释") for k, v in fields.items()},
+        }
+    )
+
+
+def test_postgres_partitioner():
+    conn = FakeConnection()
+    partitioner = PostgresPartitioner(PartitionConf(column="crawl_time", premake=1))
+    alter_item = _get_alter_item(title="t", crawl_time="2024-12-06 07:08:09")
+
+    partitioned = partitioner.ensure_partitions(conn, alter_item)
+    assert conn.sqls == [
+        "CREATE TABLE IF NOT EXISTS _article_info_list (id BIGSERIAL NOT NULL,"
+        " crawl_time TIMESTAMP NOT NULL, PRIMARY KEY (id, crawl_time))"
+        " PARTITION BY RANGE (crawl_time);"
+        "COMMENT ON TABLE _article_info_list IS '文章信息';",
+        "CREATE TABLE IF NOT EXISTS _article_info_list_p202412 PARTITION OF"
+        " _article_info_list FOR VALUES FROM ('2024-12-01') TO ('2025-01-01');",
+        "CREATE TABLE IF NOT EXISTS _article_info_list_p202501 PARTITION OF"
+        " _article_info_list FOR VALUES FROM ('2025-01-01') TO ('2025-02-01');",
+    ]
+    assert partitioned.new_item["crawl_time"] == datetime.datetime(2024, 12, 6, 7, 8, 9)
+    assert alter_item.new_item["crawl_time"] == "2024-12-06 07:08:09"
+
+    # 已创建的分区只需检查缓存，跨月后只需创建新的预建分区；日期字符串按字段类型转换为 datetime
+    partitioned = partitioner.ensure_partitions(
+        conn, _get_alter_item(crawl_time="2024-12-31")
+    )
+    assert len(conn.sqls) == 3
+    assert partitioned.new_item["crawl_time"] == datetime.datetime(2024, 12, 31)
+    partitioner.ensure_partitions(conn, _get_alter_item(crawl_time="2025-01-02"))
+    assert len(conn.sqls) == 4
+    assert "_article_info_list_p202502" in conn.sqls[-1]
+
+    # 没有分区字段的 item 不做处理
+    alter_item = _get_alter_item(title="t")
+    assert partitioner.ensure_partitions(conn, alter_item) is alter_item
+    assert len(conn.sqls) == 4
+
+
+def test_postgres_partitioner_date_column():
+    # 已存在的数据表中分区字段为 date 类型时，datetime 的值也会转换为 date
+    conn = FakeConnection(column_type="date")
+    partitioner = PostgresPartitioner(PartitionConf(column="crawl_time"))
+    partitioned = partitioner.ensure_partitions(
+        conn, _get_alter_item(crawl_time="2024-12-06 07:08:09")
+    )
+    assert partitioned.new_item["crawl_time"] == datetime.date(2024, 12, 6)
+
+
+def test_postgres_partitioner_conflict_cols():
+    conn = FakeConnection()
+    partitioner = PostgresPartitioner(PartitionConf(column="crawl_time"))
+    item = AyuItem(_table="_article_info_list", title="t", crawl_time="2024-12-06")
+    alter_item = ReuseOperation.reshape_item(ReuseOperation.item_to_dict(item))
+    assert alter_item.conflict_cols == {"id"}
+
+    # 分区父表的主键为 (id, 分区字段)，默认的冲突字段需要加上分区字段
+    ddl = partitioner.plan(alter_item, datetime.date(2024, 12, 6))
+    assert "PRIMARY KEY (id, crawl_time)" in ddl[0][1]
+    partitioned = partitioner.ensure_partitions(conn, alter_item)
+    assert partitioned.conflict_cols == {"id", "crawl_time"}
+    assert alter_item.conflict_cols == {"id"}
+    sql, _ = GenPostgresql.upsert_generate(
+        db_table=partitioned.table.name,
+        conflict_cols=partitioned.conflict_cols,
+        data=partitioned.new_item,
+    )
+    assert sql.endswith(
+        f"ON CONFLICT ({', '.join(partitioned.conflict_cols)}) DO NOTHING;"
+    )
+
+
+def test_postgres_partitioner_not_partitioned():
+    conn = FakeConnection(fail_on="PARTITION OF")
+    partitioner = PostgresPartitioner(PartitionConf(column="crawl_time"))
+    alter_item = _get_alter_item(crawl_time="2024-12-06")
+
+    assert partitioner.ensure_partitions(conn, alter_item) is alter_item
+    assert alter_item.new_item["crawl_time"] == "2024-12-06"
+    alter_item = _get_alter_item(crawl_time="2024-12-06")
+    assert partitioner.ensure_partitions(conn, alter_item) is alter_item
+    assert len(conn.sqls) == 1
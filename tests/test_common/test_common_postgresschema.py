@@ -0,0 +1,62 @@
+import asyncio
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.postgresschema import AsyncPostgresSchemaCache
+from ayugespidertools.items import DataItem
+
+
+class FakeConnection:
+    def __init__(self, columns):
+        self.columns = columns
+        self.sqls = []
+
+    async def execute(self, sql, *args):
+        self.sqls.append(sql)
+        if sql.startswith("ALTER TABLE"):
+            await asyncio.sleep(0.01)
+
+    async def fetch(self, sql, *args):
+        self.sqls.append(sql)
+        return [(col,) for col in self.columns]
+
+
+def _get_alter_item(**fields):
+    return ReuseOperation.reshape_item(
+        {
+            "_table": DataItem("_article_info_list", "文章信息"),
+            **{k: DataItem(v, f"{k} 注释") for k, v in fields.items()},
+        }
+    )
+
+
+async def _check_async_postgres_schema_cache():
+    conn = FakeConnection(["id", "title"])
+    schema_cache = AsyncPostgresSchemaCache()
+    alter_item = _get_alter_item(title="t", url="u", num=1)
+
+    await asyncio.gather(
+        *(schema_cache.ensure_columns(conn, alter_item) for _ in range(5))
+    )
+    assert [sql for sql in conn.sqls if sql.startswith("ALTER")] == [
+        "ALTER TABLE _article_info_list ADD COLUMN IF NOT EXISTS url VARCHAR(255)"
+        " DEFAULT '', ADD COLUMN IF NOT EXISTS num BIGINT;"
+        "COMMENT ON COLUMN _article_info_list.url IS 'url 注释';"
+        "COMMENT ON COLUMN _article_info_list.num IS 'num 注释';"
+    ]
+    assert len([sql for sql in conn.sqls if sql.startswith("select")]) == 1
+
+    # 多个协程同时遇到字段缺失的报错时，只有一个协程会重新加载表结构
+    version = schema_cache.version("_article_info_list")
+    err_msg = 'column "url" of relation "_article_info_list" does not exist'
+    await asyncio.gather(
+        *(
+            schema_cache.deal_postgres_err(conn, err_msg, alter_item, version)
+            for _ in range(5)
+        )
+    )
+    assert len([sql for sql in conn.sqls if sql.startswith("select")]) == 2
+    assert schema_cache.version("_article_info_list") > version
+
+
+def test_async_postgres_schema_cache():
+    asyncio.run(_check_async_postgres_schema_cache())
@@ -0,0 +1,63 @@
+import asyncio
+from unittest import mock
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.es.asynced import AyuAsyncESPipeline
+
+
+class SlowBulk:
+    """替代 async_bulk，每次请求都会等待一段时间，title 为 bad 的文档写入失败"""
+
+    def __init__(self):
+        self.requests = []
+        self.in_flight = self.peak = 0
+
+    async def __call__(self, client, actions, **kwargs):
+        docs = [action["doc"] for action in actions]
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.requests.append(([doc["title"] for doc in docs], kwargs["chunk_size"]))
+        errors = [{"index": {"error": "mapper_parsing_exception"}}] * sum(
+            doc["title"] == "bad" for doc in docs
+        )
+        return len(docs) - len(errors), errors
+
+
+def _get_pipeline(size, concurrency):
+    pipeline = AyuAsyncESPipeline()
+    pipeline.es_type = object
+    pipeline.client = mock.Mock(close=mock.AsyncMock())
+    pipeline.slog = mock.Mock()
+    pipeline.running_tasks = set()
+    pipeline.failed_count = 0
+    pipeline.batch_conf = BatchConf(size=size, interval=60)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+    pipeline.semaphore = asyncio.Semaphore(concurrency)
+    return pipeline
+
+
+def test_bulk_requests_are_bounded_and_drained():
+    bulk = SlowBulk()
+
+    async def run():
+        pipeline = _get_pipeline(size=2, concurrency=1)
+        for title in ("a", "b", "c", "bad", "e"):
+            await pipeline.process_item(AyuItem(_table="article", title=title))
+        # 第二批需要等第一批完成后才能开始，最后一条数据仍在缓存中
+        assert len(bulk.requests) == 1
+        await pipeline.close_spider()
+        return pipeline
+
+    with mock.patch("ayugespidertools.scraper.pipelines.es.asynced.async_bulk", bulk):
+        pipeline = asyncio.run(run())
+
+    assert bulk.peak == 1
+    assert bulk.requests == [(["a", "b"], 2), (["c", "bad"], 2), (["e"], 1)]
+    assert pipeline.running_tasks == set()
+    assert pipeline.failed_count == 1
+    assert "共有 1 条数据失败" in pipeline.slog.error.call_args[0][0]
+    pipeline.client.close.assert_awaited_once()
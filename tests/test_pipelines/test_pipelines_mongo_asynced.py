@@ -0,0 +1,102 @@
+import asyncio
+from collections import defaultdict
+from unittest import mock
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.mongo.asynced import AyuAsyncMongoPipeline
+
+
+class RejectingCollection:
+    """bulk_write 时拒绝 _id 已存在的文档，与无序写入一样继续处理之后的操作"""
+
+    def __init__(self):
+        self.calls = []
+        self.ids = {1}
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append((list(operations), ordered))
+        write_errors = []
+        for index, op in enumerate(operations):
+            doc = op._doc
+            if isinstance(op, InsertOne) and doc["_id"] in self.ids:
+                write_errors.append(
+                    {
+                        "index": index,
+                        "code": 11000,
+                        "errmsg": "E11000 duplicate key error",
+                        "op": doc,
+                    }
+                )
+        if write_errors:
+            raise BulkWriteError(
+                {"writeErrors": write_errors, "writeConcernErrors": []}
+            )
+
+
+def test_bulk_write_logs_failed_offsets():
+    db = defaultdict(RejectingCollection)
+    pipeline = AyuAsyncMongoPipeline()
+    pipeline.db = db
+    pipeline.client = mock.Mock()
+    pipeline.slog = mock.Mock()
+    pipeline.index_tasks = set()
+    pipeline.batch_conf = BatchConf(size=3, interval=60)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+
+    async def run():
+        for _id in (0, 1, 2, 3):
+            await pipeline.process_item(AyuItem(_table="article", _id=_id))
+        await pipeline.process_item(
+            AyuItem(_table="article", _id=4, _update_rule={"_id": 4})
+        )
+        await pipeline.close_spider()
+
+    asyncio.run(run())
+
+    first, second = db["article"].calls
+    assert first[1] is False
+    assert [op._doc["_id"] for op in first[0]] == [0, 1, 2]
+    # 最后不足一批的数据在关闭时写入，有 _update_rule 的数据为 upsert
+    assert isinstance(second[0][0], InsertOne)
+    assert isinstance(second[0][1], UpdateOne)
+    [message] = [c[0][0] for c in pipeline.slog.error.call_args_list]
+    assert "Collection: article" in message
+    assert "Offset: 1" in message
+    assert "'_id': 1" in message
+
+
+class SlowCollection:
+    def __init__(self, events):
+        self.events = events
+
+    async def bulk_write(self, operations, ordered=True):
+        self.events.append("bulk start")
+        await asyncio.sleep(0.05)
+        self.events.append("bulk done")
+
+
+def test_close_spider_waits_for_periodic_flush():
+    events = []
+    pipeline = AyuAsyncMongoPipeline()
+    pipeline.db = defaultdict(lambda: SlowCollection(events))
+    pipeline.client = mock.Mock(close=lambda: events.append("client closed"))
+    pipeline.slog = mock.Mock()
+    pipeline.index_tasks = set()
+    pipeline.batch_conf = BatchConf(size=100, interval=0.01)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+
+    async def run():
+        pipeline.flush_task = asyncio.create_task(pipeline._flush_periodically())
+        await pipeline.process_item(AyuItem(_table="article", _id=1))
+        # 等到定时任务开始写入后再关闭
+        while "bulk start" not in events:
+            await asyncio.sleep(0.005)
+        await pipeline.close_spider()
+
+    asyncio.run(run())
+    assert events == ["bulk start", "bulk done", "client closed"]
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from scrapy.http import Response
+
+from ayugespidertools.scraper.pipelines.mongo.gridfs import AyuAsyncGridFSPipeline
+
+
+class FakeGridIn:
+    def __init__(self, bucket, metadata):
+        self._id = ObjectId()
+        self.bucket = bucket
+        self.metadata = metadata
+        self.chunks = []
+
+    async def write(self, data):
+        await asyncio.sleep(self.bucket.delay)
+        self.chunks.append(bytes(data))
+
+    async def close(self):
+        sha256 = self.metadata["sha256"]
+        if sha256 in self.bucket.files.docs:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.bucket.files.docs[sha256] = self._id
+
+    async def abort(self):
+        self.bucket.aborted.append(self._id)
+
+
+class FakeFiles:
+    def __init__(self):
+        self.docs = {}
+        self.finds = 0
+
+    async def find_one(self, query, projection):
+        self.finds += 1
+        if (file_id := self.docs.get(query["metadata.sha256"])) is not None:
+            return {"_id": file_id}
+        return None
+
+
+class FakeChunks:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_many(self, query):
+        self.deleted.append(query["files_id"])
+
+
+class FakeBucket:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.files = FakeFiles()
+        self.uploads = []
+        self.aborted = []
+
+    def open_upload_stream(self, filename, metadata):
+        grid_in = FakeGridIn(self, metadata)
+        self.uploads.append(grid_in)
+        return grid_in
+
+
+def _get_pipeline(bucket, chunk_size=4, cache_size=10):
+    pipeline = AyuAsyncGridFSPipeline()
+    pipeline.bucket = bucket
+    pipeline.files = bucket.files
+    pipeline.chunks = FakeChunks()
+    pipeline.chunk_size = chunk_size
+    pipeline.cache_size = cache_size
+    pipeline.cache = OrderedDict()
+    pipeline.uploading = {}
+    return pipeline
+
+
+def _response(body):
+    return Response("https://example.com/a.png", body=body)
+
+
+def test_gridfs_upload_dedup():
+    async def run():
+        bucket = FakeBucket(delay=0.01)
+        pipeline = _get_pipeline(bucket)
+        file_ids = await asyncio.gather(
+            *(pipeline.upload_file(_response(b"0123456789"), "a.png") for _ in range(5))
+        )
+        # 同时上传相同内容的文件只会上传一次，并按 chunk_size 分块写入
+        assert len(set(file_ids)) == 1
+        assert len(bucket.uploads) == 1
+        assert bucket.uploads[0].chunks == [b"0123", b"4567", b"89"]
+
+        # 之后的上传直接命中缓存，不需要查询数据库
+        finds = bucket.files.finds
+        assert (
+            await pipeline.upload_file(_response(b"0123456789"), "b.png") == file_ids[0]
+        )
+        assert bucket.files.finds == finds
+
+    asyncio.run(run())
+
+
+def test_gridfs_cache_eviction():
+    async def run():
+        bucket = FakeBucket()
+        pipeline = _get_pipeline(bucket, cache_size=2)
+        first = await pipeline.upload_file(_response(b"a"), "a")
+        await pipeline.upload_file(_response(b"b"), "b")
+        await pipeline.upload_file(_response(b"c"), "c")
+        assert hashlib.sha256(b"a").hexdigest() not in pipeline.cache
+        assert len(pipeline.cache) == 2
+
+        # 被淘汰的文件重新上传时查询数据库得到已有的文件 id，不会重复上传
+        assert await pipeline.upload_file(_response(b"a"), "a") == first
+        assert len(bucket.uploads) == 3
+
+    asyncio.run(run())
+
+
+def test_gridfs_duplicate_key():
+    async def run():
+        bucket = FakeBucket()
+        pipeline = _get_pipeline(bucket)
+        existing = ObjectId()
+        digest = hashlib.sha256(b"abc").hexdigest()
+
+        # 查询时还不存在，写入时其它进程已上传了相同内容的文件
+        async def find_one(query, projection):
+            bucket.files.finds += 1
+            if bucket.files.finds == 1:
+                bucket.files.docs[digest] = existing
+                return None
+            return {"_id": existing}
+
+        bucket.files.find_one = find_one
+        assert await pipeline.upload_file(_response(b"abc"), "a") == existing
+        assert pipeline.chunks.deleted == [bucket.uploads[0]._id]
+        assert pipeline.cache[digest] == existing
+
+    asyncio.run(run())
+
+
+def test_gridfs_leader_cancelled():
+    async def run():
+        bucket = FakeBucket(delay=0.05)
+        pipeline = _get_pipeline(bucket)
+        leader = asyncio.create_task(pipeline.upload_file(_response(b"abc"), "a"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(pipeline.upload_file(_response(b"abc"), "a"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert bucket.aborted == [bucket.uploads[0]._id]
+
+        # 负责上传的任务被取消后，等待者会自己重新上传，而不是一直阻塞
+        file_id = await asyncio.wait_for(waiter, 1)
+        assert bucket.files.docs[hashlib.sha256(b"abc").hexdigest()] == file_id
+        assert not pipeline.uploading
+
+    asyncio.run(run())
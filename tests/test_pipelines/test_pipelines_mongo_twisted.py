@@ -0,0 +1,67 @@
+import queue
+import threading
+import time
+
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.scraper.pipelines.mongo.twisted import (
+    _STOP,
+    AyuTwistedMongoPipeline,
+)
+
+
+def _get_pipeline(**batch_conf):
+    pipeline = AyuTwistedMongoPipeline()
+    pipeline.batch_conf = BatchConf(**batch_conf)
+    pipeline.write_queue = queue.SimpleQueue()
+    return pipeline
+
+
+def _put(pipeline, *item_dicts):
+    for item_dict in item_dicts:
+        pipeline.write_queue.put(item_dict)
+
+
+def test_next_batch_stops_at_size():
+    pipeline = _get_pipeline(size=2, interval=60)
+    _put(pipeline, {"a": 1}, {"a": 2}, {"a": 3})
+    assert pipeline._next_batch() == ([{"a": 1}, {"a": 2}], False)
+    # 剩余的数据留在队列中，由下一批取出
+    assert pipeline.write_queue.qsize() == 1
+
+
+def test_next_batch_stops_at_max_bytes():
+    pipeline = _get_pipeline(size=100, max_bytes=10, interval=60)
+    _put(pipeline, {"a": "x" * 20}, {"a": 2})
+    assert pipeline._next_batch() == ([{"a": "x" * 20}], False)
+
+
+def test_next_batch_waits_for_interval():
+    pipeline = _get_pipeline(size=100, interval=0.2)
+    _put(pipeline, {"a": 1})
+    threading.Timer(0.05, _put, (pipeline, {"a": 2})).start()
+
+    start = time.monotonic()
+    batch, stop = pipeline._next_batch()
+    # 间隔内到达的数据合并为一批，之后等到间隔结束才返回
+    assert batch == [{"a": 1}, {"a": 2}]
+    assert not stop
+    assert time.monotonic() - start >= 0.15
+
+
+def test_next_batch_without_interval_only_drains_queue():
+    pipeline = _get_pipeline(size=100, interval=0)
+    _put(pipeline, {"a": 1}, {"a": 2})
+    start = time.monotonic()
+    assert pipeline._next_batch() == ([{"a": 1}, {"a": 2}], False)
+    assert time.monotonic() - start < 0.1
+
+
+def test_next_batch_stop():
+    pipeline = _get_pipeline(size=100, interval=60)
+    _put(pipeline, {"a": 1}, _STOP, {"a": 2})
+    # 收到 _STOP 时返回已取出的数据，并通知写入线程退出
+    assert pipeline._next_batch() == ([{"a": 1}], True)
+
+    pipeline = _get_pipeline(size=100, interval=60)
+    _put(pipeline, _STOP)
+    assert pipeline._next_batch() == ([], True)
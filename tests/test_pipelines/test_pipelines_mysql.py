@@ -0,0 +1,29 @@
+from unittest import mock
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.mysql import AyuMysqlPipeline
+
+
+def test_flush_expired_keeps_going_after_group_error():
+    pipeline = AyuMysqlPipeline()
+    pipeline.slog = mock.Mock()
+    pipeline.buffer = BatchBuffer(BatchConf(size=10, interval=0))
+    for table in ("a", "b"):
+        alter_item = ReuseOperation.reshape_item(AyuItem(_table=table, n=1).asdict())
+        pipeline.buffer_item(alter_item)
+
+    written = []
+
+    def write_group(alter_items):
+        if alter_items[0].table.name == "a":
+            raise RuntimeError("Lost connection")
+        written.append(alter_items[0].table.name)
+
+    pipeline.write_group = write_group
+    # 其中一个分组写入失败时不影响其它分组，也不会中断 LoopingCall
+    pipeline.flush_expired()
+    assert written == ["b"]
+    assert "Lost connection" in pipeline.slog.error.call_args[0][0]
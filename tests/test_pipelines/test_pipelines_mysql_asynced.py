@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+from unittest import mock
+
+from scrapy.utils.test import get_crawler
+
+from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.mysql.asynced import AyuAsyncMysqlPipeline
+
+
+class GatedPool:
+    """模拟 aiomysql 的连接池，写入会等待 gate 打开，并记录同时进行的最大写入数"""
+
+    maxsize = 10
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.active = self.peak = 0
+        self.written = []
+        self.closed = False
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @contextlib.asynccontextmanager
+    async def cursor(self):
+        yield self
+
+    async def execute(self, sql, args):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await self.gate.wait()
+            if args == ("bad",):
+                raise RuntimeError("(1062, 'Duplicate entry')")
+            self.written.append(args)
+        finally:
+            self.active -= 1
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+def _get_pipeline(pool, concurrency):
+    crawler = get_crawler()
+    crawler.stats.open_spider()
+    pipeline = AyuAsyncMysqlPipeline.from_crawler(crawler)
+    pipeline.mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    pipeline.slog = mock.Mock()
+    pipeline.pool = pool
+    pipeline.running_tasks = set()
+    pipeline.failed_count = 0
+    pipeline.concurrency = concurrency
+    pipeline.semaphore = asyncio.Semaphore(concurrency)
+    pipeline.schema_cache = mock.Mock(
+        ensure_columns=mock.AsyncMock(), deal_mysql_err=mock.AsyncMock()
+    )
+    pipeline.max_retry_times = 1
+    return pipeline
+
+
+def test_concurrent_writes_are_bounded_and_drained():
+    async def run():
+        pool = GatedPool()
+        pipeline = _get_pipeline(pool, concurrency=2)
+        titles = ["a", "b", "bad", "c", "d"]
+        # 写入名额已满时 process_item 会等待，放在后台来模拟 scrapy 的调用
+        feeding = asyncio.gather(
+            *(pipeline.process_item(AyuItem(_table="t", title=t)) for t in titles)
+        )
+        await asyncio.sleep(0.01)
+        assert pool.active == 2
+        assert len(pipeline.running_tasks) == 2
+
+        pool.gate.set()
+        await feeding
+        await pipeline.close_spider()
+        return pool, pipeline
+
+    pool, pipeline = asyncio.run(run())
+    assert pool.peak == 2
+    assert sorted(pool.written) == [("a",), ("b",), ("c",), ("d",)]
+    assert pipeline.running_tasks == set()
+    assert pipeline.failed_count == 1
+    assert pipeline.crawler.stats.get_value("mysql/table_rows/t") == 4
+    assert "共有 1 条数据失败" in pipeline.slog.error.call_args[0][0]
+    assert pool.closed
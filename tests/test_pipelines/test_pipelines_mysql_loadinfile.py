@@ -0,0 +1,150 @@
+from unittest import mock
+
+from twisted.internet.defer import Deferred, maybeDeferred
+
+from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.scraper.pipelines.mysql.loadinfile import (
+    AyuLoadInfileMysqlPipeline,
+    _escape_field,
+    _InfileChunk,
+)
+
+
+def test_escape_field():
+    assert _escape_field(None, "utf8") == b"\\N"
+    assert _escape_field("a\\b", "utf8") == b"a\\\\b"
+    assert _escape_field("a\tb\nc\rd\0e", "utf8") == b"a\\tb\\nc\\rd\\0e"
+    assert _escape_field("中文", "gbk") == "中文".encode("gbk")
+    assert _escape_field(b"\\\t\n\0", "utf8") == b"\\\\\\t\\n\\0"
+    assert _escape_field(True, "utf8") == b"1"
+    assert _escape_field(1.5, "utf8") == b"1.5"
+    # dict 和 list 写入 json，其中的特殊字符同样需要转义
+    assert _escape_field({"a": "x\ty"}, "utf8") == b'{"a":"x\\\\ty"}'
+    assert _escape_field([1, None], "utf8") == b"[1,null]"
+
+
+class FakeCursor:
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+        self.sqls = []
+
+    def execute(self, sql, args=None):
+        self.sqls.append((sql, args))
+
+    def close(self):
+        pass
+
+
+def _get_pipeline():
+    pipeline = AyuLoadInfileMysqlPipeline()
+    pipeline.mysql_conf = MysqlConf(
+        host="localhost",
+        port=3306,
+        user="root",
+        password="",
+        database="test",
+        insert_ignore=True,
+    )
+    pipeline.running_loads = set()
+    pipeline.slog = mock.Mock()
+    pipeline._count_rows = mock.Mock()
+    return pipeline
+
+
+def test_load_chunk_counts_loaded_rows(tmp_path):
+    pipeline = _get_pipeline()
+    cursor = FakeCursor(rowcount=2)
+    pipeline.load_conn = mock.Mock()
+    pipeline.load_conn.cursor.return_value = cursor
+    pipeline.load_conn.show_warnings.return_value = (
+        ("Warning", 1062, "Duplicate entry '1' for key 'PRIMARY'"),
+    )
+    pipeline._run_in_thread = maybeDeferred
+
+    chunk = _InfileChunk(tmp_path / "t.tsv")
+    chunk.file.write(b"1\ta\n1\tb\n2\tc\n")
+    chunk.rows = 3
+    pipeline.load_chunk(("t", ("id", "title")), chunk)
+
+    # IGNORE 跳过的数据不计入写入数量，并记录警告信息
+    assert "IGNORE INTO TABLE `t`" in cursor.sqls[0][0]
+    pipeline._count_rows.assert_called_once_with("t", 2)
+    assert "Duplicate entry" in pipeline.slog.warning.call_args[0][0]
+    pipeline.load_conn.commit.assert_called_once()
+    assert not chunk.path.exists()
+    assert pipeline.running_loads == set()
+
+
+def test_load_chunk_keeps_file_on_error(tmp_path):
+    pipeline = _get_pipeline()
+    pipeline.load_conn = mock.Mock()
+    pipeline.load_conn.cursor.return_value.execute.side_effect = RuntimeError(
+        "Lost connection"
+    )
+    pipeline._run_in_thread = maybeDeferred
+
+    chunk = _InfileChunk(tmp_path / "t.tsv")
+    pipeline.load_chunk(("t", ("id",)), chunk)
+
+    pipeline.load_conn.rollback.assert_called_once()
+    pipeline._count_rows.assert_not_called()
+    assert "Lost connection" in pipeline.slog.error.call_args[0][0]
+    assert chunk.path.exists()
+
+
+# 不依赖已安装的 reactor，直接在 Deferred 驱动的协程中等待
+@mock.patch(
+    "ayugespidertools.scraper.pipelines.mysql.loadinfile.maybe_deferred_to_future",
+    lambda d: d,
+)
+def test_close_spider_waits_for_running_loads(tmp_path):
+    pipeline = _get_pipeline()
+    pipeline.flush_loop = None
+    pipeline.remove_infile_dir = False
+    pipeline.conn = mock.Mock()
+    pipeline.load_conn = mock.Mock()
+    pipeline.threadpool = mock.Mock()
+    loading = []
+
+    def run_in_thread(func, *args):
+        loading.append(d := Deferred())
+        return d
+
+    pipeline._run_in_thread = run_in_thread
+    pipeline.chunks = {("t", ("id",)): _InfileChunk(tmp_path / "t.tsv")}
+
+    closing = Deferred.fromCoroutine(pipeline.close_spider())
+    # 剩余的分块文件导入完成前不会关闭导入连接
+    assert len(loading) == 1
+    assert not closing.called
+    pipeline.load_conn.close.assert_not_called()
+
+    loading[0].callback((1, ()))
+    assert closing.called
+    pipeline._count_rows.assert_called_once_with("t", 1)
+    pipeline.threadpool.stop.assert_called_once()
+    pipeline.load_conn.close.assert_called_once()
+    pipeline.conn.close.assert_called_once()
+
+
+def test_flush_expired_keeps_going_after_chunk_error(tmp_path):
+    pipeline = _get_pipeline()
+    pipeline.infile_conf = mock.Mock(interval=0)
+    pipeline.chunks = {
+        ("a", ("id",)): _InfileChunk(tmp_path / "a.tsv"),
+        ("b", ("id",)): _InfileChunk(tmp_path / "b.tsv"),
+    }
+    loading = []
+
+    def run_in_thread(func, sql, chunk):
+        if chunk.path.name == "a.tsv":
+            raise RuntimeError("can't start new thread")
+        loading.append(chunk.path.name)
+        return Deferred()
+
+    pipeline._run_in_thread = run_in_thread
+    pipeline.flush_expired()
+    # 其中一个分块文件导入失败时不影响其它文件，失败的文件保留
+    assert loading == ["b.tsv"]
+    assert pipeline.chunks == {}
+    assert "a.tsv" in pipeline.slog.error.call_args[0][0]
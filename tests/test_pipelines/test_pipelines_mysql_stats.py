@@ -0,0 +1,62 @@
+import datetime
+from unittest import mock
+
+from scrapy.utils.test import get_crawler
+
+from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.scraper.pipelines.mysql.stats import AyuStatisticsMysqlPipeline
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.executed = []
+        self.executemany_calls = []
+
+    def execute(self, sql, args=None):
+        self.executed.append(sql)
+
+    def executemany(self, sql, args):
+        self.executemany_calls.append((sql, list(args)))
+
+
+def _get_pipeline():
+    crawler = get_crawler()
+    crawler.stats.open_spider()
+    pipeline = AyuStatisticsMysqlPipeline.from_crawler(crawler)
+    pipeline.mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    pipeline.cursor = RecordingCursor()
+    pipeline.conn = mock.Mock()
+    pipeline.slog = mock.Mock()
+    return pipeline
+
+
+def test_table_rows_statistics():
+    pipeline = _get_pipeline()
+    pipeline._count_rows("article", 3)
+    pipeline._count_rows("article")
+    pipeline._count_rows("comment", 2)
+    # 写入失败的批次条数为 0，不应产生统计记录
+    pipeline._count_written(0, "empty")
+    pipeline.crawler.stats.inc_value("item_scraped_count", 6)
+
+    pipeline.table_rows_statistics(
+        spider_name="demo", database="test", crawl_time=datetime.date(2026, 1, 2)
+    )
+    [(sql, rows)] = pipeline.cursor.executemany_calls
+    assert "`table_collection_statistics`" in sql
+    assert sorted(rows) == [
+        ("demo", "test", "article", 4, "2026-01-02"),
+        ("demo", "test", "comment", 2, "2026-01-02"),
+    ]
+    pipeline.conn.commit.assert_called_once()
+
+
+def test_table_rows_statistics_without_rows():
+    pipeline = _get_pipeline()
+    pipeline.table_rows_statistics(
+        spider_name="demo", database="test", crawl_time=datetime.date(2026, 1, 2)
+    )
+    assert pipeline.cursor.executed == []
+    assert pipeline.cursor.executemany_calls == []
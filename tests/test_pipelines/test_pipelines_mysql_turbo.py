@@ -0,0 +1,98 @@
+from unittest import mock
+
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred, DeferredSemaphore
+from twisted.python.failure import Failure
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.mysql.turbo import AyuTurboMysqlPipeline
+
+
+class ManualWriter:
+    """替代写入线程池，写入的 Deferred 由测试手动触发"""
+
+    def __init__(self):
+        self.pending = []
+
+    def __call__(self, func, *args):
+        d = Deferred()
+        self.pending.append((args, d))
+        return d
+
+    def finish(self, index=0, result=None):
+        args, d = self.pending.pop(index)
+        d.callback(len(args[0]) if result is None else result)
+
+
+def _get_pipeline(max_workers):
+    crawler = get_crawler()
+    crawler.stats.open_spider()
+    pipeline = AyuTurboMysqlPipeline.from_crawler(crawler)
+    pipeline.slog = mock.Mock()
+    pipeline.running_writes = set()
+    pipeline.failed_count = 0
+    pipeline.write_slots = DeferredSemaphore(max_workers)
+    pipeline.batch_conf = BatchConf(size=2, interval=60)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+    pipeline._run_in_thread = ManualWriter()
+    return pipeline
+
+
+# 不依赖已安装的 reactor，直接在 Deferred 驱动的协程中等待
+@mock.patch(
+    "ayugespidertools.scraper.pipelines.mysql.turbo.maybe_deferred_to_future",
+    lambda d: d,
+)
+def test_batch_writes_are_bounded_by_write_slots():
+    pipeline = _get_pipeline(max_workers=2)
+    writer = pipeline._run_in_thread
+    results = [
+        Deferred.fromCoroutine(pipeline.process_item(AyuItem(_table="t", n=n)))
+        for n in range(6)
+    ]
+
+    # 三个批次中只有两个开始写入，写入名额已满后 process_item 都需要等待
+    assert len(writer.pending) == 2
+    assert [d.called for d in results] == [True] * 3 + [False] * 3
+
+    # 有批次写入完成后，第三个批次开始写入，名额又已满
+    writer.finish()
+    assert len(writer.pending) == 2
+    assert [d.called for d in results] == [True] * 5 + [False]
+
+    writer.finish()
+    assert all(d.called for d in results)
+    writer.pending.pop(0)[1].errback(Failure(RuntimeError("Lost connection")))
+    # 写入完成后在 reactor 中统计写入条数，失败的批次计入失败总数
+    assert pipeline.running_writes == set()
+    assert pipeline.crawler.stats.get_value("mysql/table_rows/t") == 4
+    assert pipeline.failed_count == 2
+    assert "Lost connection" in pipeline.slog.error.call_args[0][0]
+
+
+@mock.patch(
+    "ayugespidertools.scraper.pipelines.mysql.turbo.maybe_deferred_to_future",
+    lambda d: d,
+)
+def test_close_spider_flushes_buffer_and_waits_for_writes():
+    pipeline = _get_pipeline(max_workers=1)
+    pipeline.threadpool = mock.Mock()
+    pipeline.pool = mock.Mock()
+    pipeline._connections = [mock.Mock()]
+    writer = pipeline._run_in_thread
+    Deferred.fromCoroutine(pipeline.process_item(AyuItem(_table="t", n=1)))
+
+    closing = Deferred.fromCoroutine(pipeline.close_spider())
+    # 缓存中剩余的数据写入完成前不会关闭连接池
+    assert [args for args, _ in writer.pending] == [([mock.ANY],)]
+    assert not closing.called
+    pipeline.pool.close.assert_not_called()
+
+    writer.finish()
+    assert closing.called
+    assert pipeline.crawler.stats.get_value("mysql/table_rows/t") == 1
+    pipeline.threadpool.stop.assert_called_once()
+    pipeline._connections[0].close.assert_called_once()
+    pipeline.pool.close.assert_called_once()
@@ -0,0 +1,63 @@
+from unittest import mock
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.common.typevars import MysqlConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.mysql.twisted import AyuTwistedMysqlPipeline
+
+
+class ScriptedTransaction:
+    """模拟 adbapi 的 Transaction，写入参数在 bad_args 中的数据时报错
+
+    只记录执行的语句，savepoint 的回滚效果由 rows 中的数据来体现。
+    """
+
+    def __init__(self, bad_args):
+        self.bad_args = bad_args
+        self.statements = []
+        self.rows = []
+        self._savepoints = {}
+
+    def execute(self, sql, args=None):
+        self.statements.append(sql.split(" ")[0] if args else sql)
+        if sql.startswith("SAVEPOINT "):
+            self._savepoints[sql.split()[-1]] = len(self.rows)
+        elif sql.startswith("ROLLBACK TO SAVEPOINT "):
+            del self.rows[self._savepoints[sql.split()[-1]] :]
+        elif args in self.bad_args:
+            raise RuntimeError("(1062, \"Duplicate entry 'b' for key 'PRIMARY'\")")
+        else:
+            self.rows.append(args)
+
+    def executemany(self, sql, args_list):
+        # 模拟 executemany 拆分为多条语句执行时，中途失败前已写入的数据
+        for args in args_list:
+            self.execute(sql, args)
+
+
+def _get_pipeline():
+    pipeline = AyuTwistedMysqlPipeline()
+    pipeline.mysql_conf = MysqlConf(
+        host="localhost", port=3306, user="root", password="", database="test"
+    )
+    pipeline.slog = mock.Mock()
+    pipeline.schema_cache = mock.Mock()
+    return pipeline
+
+
+def test_db_insert_many_falls_back_per_row():
+    pipeline = _get_pipeline()
+    alter_items = [
+        ReuseOperation.reshape_item(AyuItem(_table="t", title=title).asdict())
+        for title in ("a", "b", "c")
+    ]
+    cursor = ScriptedTransaction(bad_args=[("b",)])
+
+    assert pipeline.db_insert_many(cursor, alter_items) == 2
+    # 整批写入失败后先撤销已写入的 a，再逐条写入，只丢弃写入失败的 b
+    assert cursor.rows == [("a",), ("c",)]
+    assert cursor.statements.count("ROLLBACK TO SAVEPOINT ayu_batch") == 1
+    assert cursor.statements.count("ROLLBACK TO SAVEPOINT ayu_item") == 1
+    assert "Duplicate entry" in pipeline.slog.error.call_args[0][0]
+    # 主键冲突不是表结构问题，不需要重新加载字段缓存
+    pipeline.schema_cache.invalidate.assert_not_called()
@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+from types import SimpleNamespace
+from unittest import mock
+
+import oracledb
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.oracle.asynced import AyuAsyncOraclePipeline
+
+KEY = ("article", ("id", "content"), ("id",), ("content",))
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def setinputsizes(self, *sizes):
+        self.conn.input_sizes.append(sizes)
+
+    async def executemany(self, sql, rows, batcherrors=False):
+        await asyncio.sleep(self.conn.delay)
+        self.conn.executed.append((rows, batcherrors))
+
+    def getbatcherrors(self):
+        return self.conn.batch_errors
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, batch_errors=(), pipeline_results=None):
+        self.batch_errors = list(batch_errors)
+        self.pipeline_results = pipeline_results
+        self.delay = 0
+        self.input_sizes = []
+        self.executed = []
+        self.pipelines = []
+        self.commit = mock.AsyncMock()
+        self.rollback = mock.AsyncMock()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    async def run_pipeline(self, pipeline, continue_on_error=False):
+        self.pipelines.append(pipeline)
+        return self.pipeline_results(pipeline)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+    async def close(self):
+        self.conn.executed.append("pool closed")
+
+
+def _get_pipeline(conn):
+    pipeline = AyuAsyncOraclePipeline()
+    pipeline.pool = FakePool(conn)
+    pipeline.slog = mock.Mock()
+    pipeline.input_sizes = {}
+    return pipeline
+
+
+def test_insert_items_reports_batch_errors():
+    conn = FakeConnection(
+        batch_errors=[SimpleNamespace(message="ORA-12899: value too large", offset=1)]
+    )
+    pipeline = _get_pipeline(conn)
+    rows = [(1, "a"), (2, "x" * 5000)]
+    asyncio.run(pipeline.insert_items(KEY, rows))
+
+    assert conn.executed == [(rows, True)]
+    assert conn.input_sizes == [(None, oracledb.DB_TYPE_CLOB)]
+    conn.commit.assert_awaited_once()
+    message = pipeline.slog.error.call_args[0][0]
+    assert "Offset: 1" in message
+    assert "ORA-12899" in message
+
+
+def test_run_pipeline_retries_rows_after_failed_offset():
+    def results(pipeline):
+        # 第一个分组在偏移量为 1 的数据处失败，其余操作成功
+        ops = pipeline.operations
+        error = SimpleNamespace(message="ORA-00001: unique constraint", offset=1)
+        return [
+            SimpleNamespace(error=error if i == 0 else None) for i in range(len(ops))
+        ]
+
+    conn = FakeConnection(pipeline_results=results)
+    pipeline = _get_pipeline(conn)
+    failed = [(1, "a"), (2, "b"), (3, "c")]
+    large = [(4, "x" * 5000)]
+    other = [(5, "d")]
+    other_key = ("comment", *KEY[1:])
+    large_key = ("page", *KEY[1:])
+    asyncio.run(
+        pipeline.run_pipeline([(KEY, failed), (large_key, large), (other_key, other)])
+    )
+
+    # 需要以 CLOB 绑定的分组不放在 pipeline 中
+    [sent] = conn.pipelines
+    assert [op.parameters for op in sent.operations[:-1]] == [failed, other]
+    assert "Item: (2, 'b')" in pipeline.slog.error.call_args_list[0][0][0]
+    # CLOB 分组及失败数据之后的数据使用 setinputsizes 及 batcherrors 单独写入
+    assert conn.executed == [(large, True), ([(3, "c")], True)]
+    assert conn.input_sizes[0] == (None, oracledb.DB_TYPE_CLOB)
+
+
+def test_run_pipeline_falls_back_when_pipeline_fails():
+    def broken(pipeline):
+        raise oracledb.InterfaceError("DPY-3028: pipelining is not supported")
+
+    def commit_failed(pipeline):
+        ops = pipeline.operations
+        error = SimpleNamespace(message="ORA-02091: transaction rolled back", offset=0)
+        return [
+            SimpleNamespace(error=error if i == len(ops) - 1 else None)
+            for i in range(len(ops))
+        ]
+
+    groups = [(KEY, [(1, "a"), (2, "b")]), (("comment", *KEY[1:]), [(3, "c")])]
+    for results in (broken, commit_failed):
+        conn = FakeConnection(pipeline_results=results)
+        pipeline = _get_pipeline(conn)
+        asyncio.run(pipeline.run_pipeline(groups))
+
+        # 未提交的分组都改为使用 batcherrors 单独写入并提交
+        conn.rollback.assert_awaited_once()
+        assert conn.executed == [(rows, True) for _, rows in groups]
+        assert conn.commit.await_count == 2
+        assert "Oracle pipeline" in pipeline.slog.error.call_args_list[0][0][0]
+
+
+def test_close_spider_waits_for_periodic_flush():
+    conn = FakeConnection()
+    conn.delay = 0.05
+    pipeline = _get_pipeline(conn)
+    pipeline.batch_conf = BatchConf(size=100, interval=0.01)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+
+    async def run():
+        pipeline.flush_task = asyncio.create_task(pipeline._flush_periodically())
+        await pipeline.process_item(AyuItem(_table="article", id=1, content="a"))
+        # 等到定时任务取出缓存中的分组后再关闭
+        while pipeline.flushing is None:
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.01)
+        await pipeline.close_spider()
+
+    asyncio.run(run())
+    assert conn.executed == [([(1, "a")], True), "pool closed"]
@@ -0,0 +1,46 @@
+import asyncio
+from unittest import mock
+
+from ayugespidertools.common.batch import BatchBuffer
+from ayugespidertools.common.typevars import BatchConf
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.postgres.asynced import AyuAsyncPostgresPipeline
+
+
+def test_close_spider_waits_for_periodic_flush():
+    events = []
+    pipeline = AyuAsyncPostgresPipeline()
+    pipeline.slog = mock.Mock()
+    pipeline.batch_conf = BatchConf(size=100, interval=0.01)
+    pipeline.buffer = BatchBuffer(pipeline.batch_conf)
+
+    async def write_group(key, alter_items):
+        # 同一次 flush_expired 中依次写入各个分组，每个分组都需要从连接池获取连接
+        assert "pool closed" not in events, "连接池已关闭"
+        events.append(("start", key[0]))
+        await asyncio.sleep(0.03)
+        events.append(("done", key[0]))
+
+    async def close_pool():
+        events.append("pool closed")
+
+    pipeline.write_group = write_group
+    pipeline.pool = mock.Mock(close=close_pool)
+
+    async def run():
+        pipeline.flush_task = asyncio.create_task(pipeline._flush_periodically())
+        for table in ("article", "comment"):
+            await pipeline.process_item(AyuItem(_table=table, title="t"))
+        while not events:
+            await asyncio.sleep(0.005)
+        await pipeline.close_spider()
+
+    asyncio.run(run())
+    assert events == [
+        ("start", "article"),
+        ("done", "article"),
+        ("start", "comment"),
+        ("done", "comment"),
+        "pool closed",
+    ]
+    pipeline.slog.error.assert_not_called()
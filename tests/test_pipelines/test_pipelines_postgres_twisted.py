@@ -0,0 +1,74 @@
+import contextlib
+from unittest import mock
+
+from ayugespidertools.common.multiplexing import ReuseOperation
+from ayugespidertools.items import AyuItem
+from ayugespidertools.scraper.pipelines.postgres.twisted import (
+    AyuTwistedPostgresPipeline,
+)
+
+
+class FakeConnection:
+    """模拟 psycopg 连接，嵌套的 transaction 与 psycopg 一样作为 savepoint 处理"""
+
+    def __init__(self, rejected):
+        self.rejected = rejected
+        self.rows = []
+        self.depth = self.savepoints = 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        start = len(self.rows)
+        self.depth += 1
+        self.savepoints += self.depth > 1
+        try:
+            yield
+        except Exception:
+            del self.rows[start:]
+            raise
+        finally:
+            self.depth -= 1
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = []
+
+    def execute(self, sql, args=None):
+        self.statements.append(sql)
+        if args is None:
+            return
+        if args in self.connection.rejected:
+            raise RuntimeError(
+                'duplicate key value violates unique constraint "t_pkey"'
+            )
+        self.connection.rows.append(args)
+
+    def executemany(self, sql, args_list):
+        if any(args in self.connection.rejected for args in args_list):
+            raise RuntimeError(
+                'duplicate key value violates unique constraint "t_pkey"'
+            )
+        self.connection.rows.extend(args_list)
+
+
+def test_db_insert_many_retries_each_row_in_a_savepoint():
+    pipeline = AyuTwistedPostgresPipeline()
+    pipeline.slog = mock.Mock()
+    alter_items = [
+        ReuseOperation.reshape_item(AyuItem(_table="t", id=i).asdict())
+        for i in (1, 2, 3, 4)
+    ]
+    conn = FakeConnection(rejected={(2,), (4,)})
+    cursor = FakeCursor(conn)
+
+    pipeline.db_insert_many(cursor, alter_items)
+
+    # 整批失败后先回滚，再逐条写入，只丢弃冲突的数据
+    assert "ROLLBACK" in cursor.statements
+    assert conn.rows == [(1,), (3,)]
+    assert conn.savepoints == 4
+    errors = [c[0][0] for c in pipeline.slog.error.call_args_list]
+    assert len(errors) == 2
+    assert all("duplicate key" in e and "Table: t" in e for e in errors)
@@ -133,6 +133,35 @@ def test_postgres_asyncpg_upsert_generate():
     assert value == ("zhangsan", 18)
 
 
+def test_postgres_asyncpg_copy_upsert_generate():
+    create_sql, merge_sql = GenPostgresqlAsyncpg.copy_upsert_generate(
+        db_table="demo_eleven",
+        staging_table="_ayu_staging",
+        keys=["name", "age"],
+        conflict_cols={"name"},
+        update_cols={"age"},
+    )
+    assert (
+        create_sql
+        == "CREATE TEMP TABLE _ayu_staging ON COMMIT DROP AS SELECT name, age FROM demo_eleven WITH NO DATA;"
+    )
+    assert (
+        merge_sql
+        == "INSERT INTO demo_eleven (name, age) SELECT name, age FROM _ayu_staging ON CONFLICT (name) DO UPDATE SET age = EXCLUDED.age;"
+    )
+
+    _, merge_sql = GenPostgresqlAsyncpg.copy_upsert_generate(
+        db_table="demo_eleven",
+        staging_table="_ayu_staging",
+        keys=["name", "age"],
+        conflict_cols={"id"},
+    )
+    assert (
+        merge_sql
+        == "INSERT INTO demo_eleven (name, age) SELECT name, age FROM _ayu_staging ON CONFLICT (id) DO NOTHING;"
+    )
+
+
 def test_postgresql_merge_generate():
     sql, value = GenPostgresqlAsyncpg.merge_generate(
         db_table="demo_eleven",
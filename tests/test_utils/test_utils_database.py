@@ -1,7 +1,12 @@
+import asyncio
+
+import pytest
 from pymongo.uri_parser import parse_uri
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
 
 from ayugespidertools.common.typevars import MongoDBConf
-from ayugespidertools.utils.database import MongoDBAsyncPortal, MongoDBPortal
+from ayugespidertools.utils.database import MongoDBAsyncPortal, MongoDBPortal, StatsPool
 from tests import MONGODB_CONFIG
 
 
@@ -26,3 +31,51 @@ class TestUtilsDatabase:
         db_name2 = map_client.get_database().name
         assert db_name == db_name2 == self.db_name
         map.close()
+
+
+class FakeAsyncpgPool:
+    def __init__(self, size):
+        self.size = size
+        self.idle = asyncio.Queue()
+        for i in range(size):
+            self.idle.put_nowait(i)
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return self.idle.qsize()
+
+    async def acquire(self):
+        return await self.idle.get()
+
+    async def release(self, conn):
+        self.idle.put_nowait(conn)
+
+
+async def _check_stats_pool(stats):
+    pool = StatsPool(FakeAsyncpgPool(1), "postgresql/pool", stats, timeout=0.05)
+    async with pool.acquire() as conn:
+        assert conn == 0
+        assert pool.get_idle_size() == 0
+        with pytest.raises(asyncio.TimeoutError):
+            async with pool.acquire():
+                pass
+    assert pool.get_idle_size() == 1
+
+    # 与原连接池一样支持 await acquire 及 release 的用法
+    conn = await pool.acquire()
+    assert conn == 0
+    assert pool.get_idle_size() == 0
+    await pool.release(conn)
+    assert pool.get_idle_size() == 1
+
+
+def test_stats_pool():
+    stats = MemoryStatsCollector(get_crawler())
+    asyncio.run(_check_stats_pool(stats))
+    assert stats.get_value("postgresql/pool/size") == 1
+    assert stats.get_value("postgresql/pool/idle") == 1
+    assert stats.get_value("postgresql/pool/acquire_count") == 2
+    assert stats.get_value("postgresql/pool/acquire_timeouts") == 1
+    assert stats.get_value("postgresql/pool/acquire_wait_max_ms") >= 0